@@ -0,0 +1,261 @@
+"""
+COPY-based bulk loader for large product feeds (initial seeding, nightly vendor files).
+
+Rows are validated like the regular import (product_csv.parse_import_row)
+and streamed into a temporary staging table with COPY
+(asyncpg copy_records_to_table). The staged rows are then cleaned up and
+merged into products with one set-based INSERT ... ON CONFLICT (sku) DO
+UPDATE, with total_cost, profit_margin and margin_percent computed in SQL.
+The whole load is one transaction: either every valid row lands or none.
+
+Within a file the last row for a SKU wins. Rows whose barcode belongs to
+another product (or to an earlier row of the same file) are rejected and
+reported; missing barcodes keep the existing product's or get a new one.
+
+    python bulk_load.py feed.csv [--stock 10]
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import os
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import text
+
+from database import engine
+from product_csv import REQUIRED_IMPORT_HEADERS, RowError, parse_import_row
+
+logger = logging.getLogger(__name__)
+
+COPY_READ_BATCH = 5000
+MAX_REPORTED_ERRORS = 1000
+
+STAGING_TABLE = "product_staging"
+
+# Staging column -> type; values come from parse_import_row
+STAGING_COLUMNS = {
+    "row_number": "integer",
+    "sku": "text",
+    "barcode": "text",
+    "hsn_code": "text",
+    "name": "text",
+    "description": "text",
+    "category": "text",
+    "subcategory": "text",
+    "tags": "jsonb",
+    "status": "text",
+    "metal": "text",
+    "purity": "text",
+    "gross_weight": "numeric",
+    "net_weight": "numeric",
+    "stone_weight": "numeric",
+    "stone_type": "text",
+    "stone_quality": "text",
+    "selling_price": "numeric",
+    "price": "numeric",
+    "cost_gold": "numeric",
+    "cost_stone": "numeric",
+    "cost_making": "numeric",
+    "cost_other": "numeric",
+    "stock_quantity": "integer",
+    "low_stock_threshold": "integer",
+}
+
+# Plain copies from staging into products (sku is the conflict key)
+MERGED_COLUMNS = [c for c in STAGING_COLUMNS if c not in ("row_number", "sku")]
+
+_CLEANUP_SQL = [
+    # Within the file, the last row for a SKU wins
+    ("superseded", f"""
+        DELETE FROM {STAGING_TABLE} s USING {STAGING_TABLE} t
+        WHERE t.sku = s.sku AND t.row_number > s.row_number
+        RETURNING s.row_number, s.sku
+    """),
+    ("error", f"""
+        DELETE FROM {STAGING_TABLE} s USING {STAGING_TABLE} t
+        WHERE t.barcode = s.barcode AND t.row_number < s.row_number
+        RETURNING s.row_number, 'barcode ' || s.barcode || ' is already used by row ' || t.row_number
+    """),
+    ("error", f"""
+        DELETE FROM {STAGING_TABLE} s USING products p
+        WHERE p.barcode = s.barcode AND p.sku <> s.sku
+        RETURNING s.row_number, 'barcode ' || s.barcode || ' belongs to product ' || p.sku
+    """),
+]
+
+_FILL_BARCODES_SQL = [
+    f"""
+        UPDATE {STAGING_TABLE} s SET barcode = p.barcode
+        FROM products p WHERE p.sku = s.sku AND s.barcode IS NULL
+    """,
+    f"""
+        UPDATE {STAGING_TABLE} SET barcode = lpad(floor(random() * 1e13)::bigint::text, 13, '0')
+        WHERE barcode IS NULL
+    """,
+]
+
+_MERGE_SQL = f"""
+    WITH staged AS (
+        SELECT s.*,
+               coalesce(cost_gold, 0) + coalesce(cost_stone, 0)
+                 + coalesce(cost_making, 0) + coalesce(cost_other, 0) AS total_cost
+        FROM {STAGING_TABLE} s
+    ),
+    upserted AS (
+        INSERT INTO products (
+            id, sku, {", ".join(MERGED_COLUMNS)},
+            total_cost, profit_margin, margin_percent,
+            in_stock, track_inventory, created_at, updated_at
+        )
+        SELECT
+            gen_random_uuid(), sku, {", ".join(MERGED_COLUMNS)},
+            total_cost,
+            CASE WHEN selling_price > 0 THEN selling_price - total_cost ELSE 0 END,
+            -- margin_percent is numeric(5,2)
+            CASE WHEN selling_price > 0
+                 THEN greatest(least(round((selling_price - total_cost) / selling_price * 100, 2), 999.99), -999.99)
+                 ELSE 0 END,
+            stock_quantity > 0, true, now(), now()
+        FROM staged
+        ON CONFLICT (sku) DO UPDATE SET
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in MERGED_COLUMNS)},
+            total_cost = EXCLUDED.total_cost,
+            profit_margin = EXCLUDED.profit_margin,
+            margin_percent = EXCLUDED.margin_percent,
+            in_stock = EXCLUDED.in_stock,
+            updated_at = now()
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+
+
+class BulkLoadReport:
+    def __init__(self):
+        self.rows = 0
+        self.staged = 0
+        self.inserted = 0
+        self.updated = 0
+        self.superseded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+
+    def add_error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row_number}: {message}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "staged": self.staged,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "superseded": self.superseded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _copy_value(kind: str, value):
+    """COPY uses the binary protocol: numerics must be Decimal and jsonb a JSON string"""
+    if value is None:
+        return None
+    if kind == "numeric":
+        return Decimal(str(value))
+    if kind == "jsonb":
+        return json.dumps(value)
+    return value
+
+
+async def _staging_records(reader: csv.DictReader, report: BulkLoadReport,
+                           stock_override: Optional[int]) -> AsyncIterator[tuple]:
+    """Validated staging tuples, read from the CSV off the event loop in batches"""
+    row_number = 1  # the header is row 1, as in a spreadsheet
+    while True:
+        rows = await asyncio.to_thread(lambda: list(itertools.islice(reader, COPY_READ_BATCH)))
+        if not rows:
+            return
+        for row in rows:
+            row_number += 1
+            report.rows += 1
+            if not any(v for v in row.values() if isinstance(v, str) and v.strip()):
+                report.skipped += 1
+                continue
+            try:
+                values = parse_import_row(row)
+            except RowError as e:
+                report.add_error(row_number, str(e))
+                continue
+            if stock_override is not None:
+                values["stock_quantity"] = stock_override
+            values["row_number"] = row_number
+            report.staged += 1
+            yield tuple(_copy_value(STAGING_COLUMNS[c], values[c]) for c in STAGING_COLUMNS)
+
+
+async def bulk_load_products(path: str, stock_override: Optional[int] = None) -> BulkLoadReport:
+    """COPY a product CSV into staging and merge it into products in one transaction"""
+    report = BulkLoadReport()
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        headers = await asyncio.to_thread(lambda: reader.fieldnames) or []
+        missing = [h for h in REQUIRED_IMPORT_HEADERS if h not in headers]
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+        async with engine.begin() as conn:
+            columns = ", ".join(f"{name} {kind}" for name, kind in STAGING_COLUMNS.items())
+            await conn.execute(text(f"CREATE TEMP TABLE {STAGING_TABLE} ({columns}) ON COMMIT DROP"))
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                STAGING_TABLE,
+                records=_staging_records(reader, report, stock_override),
+                columns=list(STAGING_COLUMNS),
+            )
+            await conn.execute(text(f"CREATE INDEX ON {STAGING_TABLE} (sku)"))
+            await conn.execute(text(f"CREATE INDEX ON {STAGING_TABLE} (barcode)"))
+            await conn.execute(text(f"ANALYZE {STAGING_TABLE}"))
+
+            for kind, statement in _CLEANUP_SQL:
+                result = await conn.execute(text(statement))
+                for row_number, detail in result.all():
+                    if kind == "superseded":
+                        report.superseded += 1
+                    else:
+                        report.add_error(row_number, detail)
+            for statement in _FILL_BARCODES_SQL:
+                await conn.execute(text(statement))
+
+            inserted, updated = (await conn.execute(text(_MERGE_SQL))).one()
+            report.inserted, report.updated = inserted, updated
+
+    logger.info(
+        f"Bulk product load: {report.rows} rows, {report.inserted} inserted, {report.updated} updated, "
+        f"{report.superseded} superseded, {report.failed} failed, {report.skipped} skipped"
+    )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load a product CSV (import format) with COPY")
+    parser.add_argument("path", help="CSV file to load")
+    parser.add_argument("--stock", type=int, help="Override stockQuantity for every row (e.g. when seeding)")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    result = asyncio.run(bulk_load_products(args.path, args.stock)).to_dict()
+    for error in result["errors"]:
+        print(f"❌ {error}")
+    print(
+        f"✅ Loaded {args.path}: {result['inserted']} inserted, {result['updated']} updated, "
+        f"{result['superseded']} superseded, {result['failed']} failed, {result['skipped']} skipped"
+    )
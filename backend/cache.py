@@ -0,0 +1,281 @@
+"""
+Caches for hot, read-mostly admin/storefront responses.
+
+LRUCache is a small in-process LRU with a per-entry TTL. CatalogCache wraps
+a pluggable backend for the public catalogue endpoints:
+
+* "memory" (default): an LRUCache per worker;
+* "redis": any Redis-compatible server at CATALOG_CACHE_URL, shared by all
+  workers (needs the optional `redis` package).
+
+Catalogue keys are namespaced by a generation number, so invalidate() is a
+single increment that orphans every cached entry (they then age out via
+TTL). Writers call invalidate() after committing product, stock or review
+changes. A read-through stores its result only if the generation is still
+the one its lookup() saw, so rows loaded before an invalidation are never
+cached as current.
+
+The generation is shared by every worker: it lives in Redis, or for the
+memory backend in the admin_settings row "catalog_generation", which each
+worker re-reads at most every CATALOG_GENERATION_REFRESH seconds. A write
+handled by one worker therefore reaches the others' caches and ETags
+within that interval.
+"""
+import json
+import logging
+import os
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from urllib.parse import urlencode
+
+from sqlalchemy import text
+
+from database import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Least-recently-used cache whose entries also expire `ttl` seconds after being set"""
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ---------- Catalogue cache backends ----------
+
+_BUMP_GENERATION_SQL = text("""
+    INSERT INTO admin_settings (key, value) VALUES ('catalog_generation', '1')
+    ON CONFLICT (key) DO UPDATE SET value = (admin_settings.value::bigint + 1)::text, updated_at = now()
+    RETURNING value
+""")
+
+
+class DatabaseGeneration:
+    """Catalogue generation stored in admin_settings, re-read at most every `refresh` seconds"""
+
+    def __init__(self, refresh: float):
+        self.refresh = refresh
+        self._value: Optional[int] = None
+        self._read_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self) -> int:
+        if self._value is not None and time.monotonic() - self._read_at < self.refresh:
+            return self._value
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another request may have refreshed it while we waited
+            if self._value is None or time.monotonic() - self._read_at >= self.refresh:
+                async with async_session_maker() as db:
+                    value = (await db.execute(
+                        text("SELECT value FROM admin_settings WHERE key = 'catalog_generation'")
+                    )).scalar_one_or_none()
+                self._value = int(value or 0)
+                self._read_at = time.monotonic()
+        return self._value
+
+    async def bump(self) -> int:
+        async with async_session_maker() as db:
+            value = (await db.execute(_BUMP_GENERATION_SQL)).scalar_one()
+            await db.commit()
+        self._value = int(value)
+        self._read_at = time.monotonic()
+        return self._value
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, ttl: float, max_entries: int, generation_refresh: float):
+        self._cache = LRUCache(ttl, max_entries)
+        self._generation = DatabaseGeneration(generation_refresh)
+        self._cached_generation: Optional[int] = None
+
+    async def generation(self) -> int:
+        generation = await self._generation.get()
+        if generation != self._cached_generation:
+            # Entries of older generations can never be read again
+            self._cache.clear()
+            self._cached_generation = generation
+        return generation
+
+    async def bump_generation(self) -> int:
+        return await self._generation.bump()
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any):
+        self._cache.set(key, value)
+
+    async def size(self) -> Optional[int]:
+        return len(self._cache)
+
+
+class RedisBackend:
+    name = "redis"
+    GENERATION_KEY = "catalog:generation"
+
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio as redis  # optional dependency
+
+        self._client = redis.from_url(url)
+        self.ttl = int(ttl)
+
+    async def generation(self) -> int:
+        return int(await self._client.get(self.GENERATION_KEY) or 0)
+
+    async def bump_generation(self) -> int:
+        return int(await self._client.incr(self.GENERATION_KEY))
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any):
+        await self._client.set(key, json.dumps(value), ex=self.ttl)
+
+    async def size(self) -> Optional[int]:
+        return None
+
+
+class CatalogCache:
+    """Read-through cache for catalogue responses with hit/miss counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        self.stale_writes_skipped = 0
+
+    @staticmethod
+    def key(endpoint: str, **params) -> str:
+        """Stable key from the endpoint name and its (non-empty) query params"""
+        query = urlencode(sorted((k, v) for k, v in params.items() if v is not None))
+        return f"{endpoint}?{query}"
+
+    @staticmethod
+    def _namespaced(generation: int, key: str) -> str:
+        return f"catalog:{generation}:{key}"
+
+    async def lookup(self, key: str) -> Tuple[Optional[Any], Optional[int]]:
+        """
+        Cached value (or None) and the generation it was looked up under.
+        Pass the generation to set() when storing the freshly loaded value.
+        """
+        try:
+            generation = await self.backend.generation()
+            value = await self.backend.get(self._namespaced(generation, key))
+        except Exception as e:
+            # A cache outage must never take the storefront down
+            self.errors += 1
+            logger.warning(f"Catalog cache read failed: {e}")
+            return None, None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, generation
+
+    async def set(self, key: str, value: Any, generation: Optional[int]):
+        """
+        Store a value loaded after lookup() returned `generation`. If the
+        catalogue was invalidated in between, the value may predate the write,
+        so it is not cached.
+        """
+        if generation is None:
+            return
+        try:
+            if await self.backend.generation() != generation:
+                self.stale_writes_skipped += 1
+                return
+            await self.backend.set(self._namespaced(generation, key), value)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Catalog cache write failed: {e}")
+
+    async def version(self) -> Optional[str]:
+        """Opaque catalogue version that changes on every invalidation (None if unavailable)"""
+        try:
+            return f"g{await self.backend.generation()}"
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Catalog cache version lookup failed: {e}")
+            return None
+
+    async def invalidate(self):
+        """Drop every cached catalogue response"""
+        self.invalidations += 1
+        try:
+            await self.backend.bump_generation()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Catalog cache invalidation failed: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        try:
+            entries = await self.backend.size()
+        except Exception:
+            entries = None
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "errors": self.errors,
+            "invalidations": self.invalidations,
+            "stale_writes_skipped": self.stale_writes_skipped,
+            "entries": entries,
+        }
+
+
+def create_catalog_cache() -> CatalogCache:
+    ttl = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+    max_entries = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "2048"))
+    generation_refresh = float(os.getenv("CATALOG_GENERATION_REFRESH", "1"))
+    if os.getenv("CATALOG_CACHE_BACKEND", "memory").lower() == "redis":
+        url = os.getenv("CATALOG_CACHE_URL", "redis://localhost:6379/0")
+        try:
+            return CatalogCache(RedisBackend(url, ttl))
+        except ImportError:
+            logger.warning("CATALOG_CACHE_BACKEND=redis but the redis package is not installed; using memory")
+    return CatalogCache(MemoryBackend(ttl, max_entries, generation_refresh))
+
+
+# Admin dashboard stats, keyed by (period, channel, start_date, end_date).
+# Cleared when a transaction that called refresh_sales_for_orders() commits.
+dashboard_cache = LRUCache(ttl=30)
+
+catalog_cache = create_catalog_cache()
@@ -0,0 +1,223 @@
+"""
+Abandoned-cart reminder engine.
+
+A cart gets up to len(REMINDER_STEPS) reminders. The first goes out once
+the cart has been idle for the "abandoned_cart_minutes" admin setting; each
+later step waits its own delay after the previous reminder
+(ABANDONED_CART_FOLLOW_UP_HOURS, default 24h then 72h), and any cart
+activity restarts the idle clock.
+
+send_due_reminders() drains the due carts with up to
+ABANDONED_CART_CONCURRENCY workers. Each worker repeatedly claims
+ABANDONED_CART_BATCH_SIZE due carts with FOR UPDATE SKIP LOCKED, renders
+their emails in one go, queues them in the outbox (mailer.py) and bumps
+reminder_count in the same transaction. A batch is therefore committed
+exactly once: a crash before the commit leaves its carts due and unsent,
+and concurrent runs (other app workers) skip carts already claimed.
+
+queue_reminder() sends a cart's next step on demand (the admin "send
+reminder" button), with the same subject, template and bookkeeping.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select
+
+from database import async_session_maker
+from db_models import AbandonedCartDB, AdminSettingsDB
+from mailer import PRIORITY_MARKETING, enqueue_email
+from templates import cart_email_context, render, render_many
+
+logger = logging.getLogger(__name__)
+
+ABANDONED_CART_BATCH_SIZE = int(os.getenv("ABANDONED_CART_BATCH_SIZE", "50"))
+ABANDONED_CART_CONCURRENCY = int(os.getenv("ABANDONED_CART_CONCURRENCY", "4"))
+ABANDONED_CART_MAX_PER_RUN = int(os.getenv("ABANDONED_CART_MAX_PER_RUN", "5000"))
+DEFAULT_FIRST_REMINDER_MINUTES = 5
+
+# Delays of the 2nd, 3rd, ... reminder after the previous one
+FOLLOW_UP_DELAYS = [
+    timedelta(hours=float(h)) for h in os.getenv("ABANDONED_CART_FOLLOW_UP_HOURS", "24,72").split(",") if h.strip()
+]
+
+# Subject per reminder step; the template varies its headline by step as well
+REMINDER_STEPS = [
+    "✨ Your cart is waiting for you - Annya Jewellers",
+    "Still thinking it over? Your cart is saved - Annya Jewellers",
+    "Last reminder: the pieces in your cart may not last - Annya Jewellers",
+][:len(FOLLOW_UP_DELAYS) + 1]
+MAX_REMINDERS = len(REMINDER_STEPS)
+
+
+async def first_reminder_delay(db) -> timedelta:
+    result = await db.execute(
+        select(AdminSettingsDB.value).where(AdminSettingsDB.key == "abandoned_cart_minutes")
+    )
+    value = result.scalar_one_or_none()
+    return timedelta(minutes=int(value) if value else DEFAULT_FIRST_REMINDER_MINUTES)
+
+
+def due_condition(now: datetime, first_delay: timedelta):
+    """SQL condition for carts whose next reminder is due"""
+    steps = [AbandonedCartDB.reminder_count == 0]
+    for sent, delay in enumerate(FOLLOW_UP_DELAYS[:MAX_REMINDERS - 1], start=1):
+        steps.append(and_(AbandonedCartDB.reminder_count == sent, AbandonedCartDB.last_reminder_at < now - delay))
+    return and_(
+        AbandonedCartDB.status == 'active',
+        AbandonedCartDB.updated_at < now - first_delay,
+        or_(*steps),
+    )
+
+
+def is_due(cart: AbandonedCartDB, now: datetime, first_delay: timedelta) -> bool:
+    """Python twin of due_condition() for carts already loaded"""
+    sent = cart.reminder_count or 0
+    if cart.status != 'active' or sent >= MAX_REMINDERS or not cart.updated_at:
+        return False
+    if cart.updated_at >= now - first_delay:
+        return False
+    return sent == 0 or (cart.last_reminder_at is not None
+                         and cart.last_reminder_at < now - FOLLOW_UP_DELAYS[sent - 1])
+
+
+class ReminderEngine:
+    def __init__(self):
+        self.runs = 0
+        self.queued = 0
+        self.queued_by_step = [0] * MAX_REMINDERS
+        self.failed = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    async def _process_batch(self, first_delay: timedelta, limit: int, errors: List[Dict[str, str]]) -> int:
+        """Claim, queue and commit one batch; returns the number of carts claimed"""
+        now = datetime.now(timezone.utc)
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(AbandonedCartDB)
+                .where(due_condition(now, first_delay))
+                .order_by(AbandonedCartDB.updated_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            carts = result.scalars().all()
+            if not carts:
+                return 0
+
+            contexts = []
+            for cart in carts:
+                context = cart_email_context(cart)
+                context["step"] = (cart.reminder_count or 0) + 1
+                contexts.append(context)
+            bodies = await render_many("abandoned_cart.html", contexts)
+
+            for cart, body in zip(carts, bodies):
+                step = (cart.reminder_count or 0) + 1
+                try:
+                    await enqueue_email(cart.email, REMINDER_STEPS[step - 1], body,
+                                        kind="abandoned_cart", priority=PRIORITY_MARKETING, db=db)
+                except Exception as e:
+                    self.failed += 1
+                    errors.append({"email": cart.email, "error": str(e)})
+                    continue
+                cart.reminder_count = step
+                cart.last_reminder_at = now
+                self.queued += 1
+                self.queued_by_step[step - 1] += 1
+            await db.commit()
+            return len(carts)
+
+    async def queue_reminder(self, db, cart: AbandonedCartDB) -> Optional[int]:
+        """Queue the next step for one cart locked by the caller; None if every step was sent"""
+        step = (cart.reminder_count or 0) + 1
+        if step > MAX_REMINDERS:
+            return None
+        context = cart_email_context(cart)
+        context["step"] = step
+        await enqueue_email(cart.email, REMINDER_STEPS[step - 1], render("abandoned_cart.html", **context),
+                            kind="abandoned_cart", priority=PRIORITY_MARKETING, db=db)
+        cart.reminder_count = step
+        cart.last_reminder_at = datetime.now(timezone.utc)
+        self.queued += 1
+        self.queued_by_step[step - 1] += 1
+        return step
+
+    async def send_due_reminders(self, first_delay: Optional[timedelta] = None,
+                                 max_carts: int = ABANDONED_CART_MAX_PER_RUN,
+                                 batch_size: int = ABANDONED_CART_BATCH_SIZE,
+                                 concurrency: int = ABANDONED_CART_CONCURRENCY) -> Dict[str, Any]:
+        """Queue reminders for due carts (up to max_carts); safe to run from several processes"""
+        if first_delay is None:
+            async with async_session_maker() as db:
+                first_delay = await first_reminder_delay(db)
+
+        started = time.monotonic()
+        queued_before, failed_before = self.queued, self.failed
+        errors: List[Dict[str, str]] = []
+        remaining = max_carts
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                limit = min(batch_size, remaining)
+                remaining -= limit
+                try:
+                    claimed = await self._process_batch(first_delay, limit, errors)
+                except Exception as e:
+                    logger.error(f"Abandoned cart batch failed: {e}")
+                    errors.append({"email": None, "error": f"Batch failed: {e}"})
+                    return
+                if claimed < limit:
+                    return  # nothing left that is not claimed by someone else
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+        elapsed = time.monotonic() - started
+        queued = self.queued - queued_before
+        self.runs += 1
+        self.last_run = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "queued": queued,
+            "failed": self.failed - failed_before,
+            "seconds": round(elapsed, 3),
+            "carts_per_second": round(queued / elapsed, 1) if elapsed > 0 else None,
+        }
+        if queued or errors:
+            logger.info(f"Abandoned cart reminders: {queued} queued in {elapsed:.1f}s, {len(errors)} errors")
+        return {"queued": queued, "errors": errors}
+
+    async def backlog(self) -> Dict[str, Any]:
+        """Carts due right now, by reminder step"""
+        now = datetime.now(timezone.utc)
+        async with async_session_maker() as db:
+            first_delay = await first_reminder_delay(db)
+            result = await db.execute(
+                select(AbandonedCartDB.reminder_count, func.count())
+                .where(due_condition(now, first_delay))
+                .group_by(AbandonedCartDB.reminder_count)
+            )
+            due = {sent + 1: count for sent, count in result.all()}
+            oldest = (await db.execute(
+                select(func.min(AbandonedCartDB.updated_at)).where(due_condition(now, first_delay))
+            )).scalar()
+        return {
+            "due": sum(due.values()),
+            "due_by_step": {str(step): due.get(step, 0) for step in range(1, MAX_REMINDERS + 1)},
+            "oldest_due_cart_updated_at": oldest.isoformat() if oldest else None,
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "queued": self.queued,
+            "queued_by_step": {str(step): n for step, n in enumerate(self.queued_by_step, start=1)},
+            "failed": self.failed,
+            "last_run": self.last_run,
+            "backlog": await self.backlog(),
+        }
+
+
+reminder_engine = ReminderEngine()
@@ -3,14 +3,30 @@ SQLAlchemy ORM models for PostgreSQL database tables
 This is separate from models.py which contains Pydantic models for API validation
 """
 from sqlalchemy import (
-    Column, String, Integer, Numeric, Boolean, Text,
-    ForeignKey, DateTime, CheckConstraint, Index
+    Column, String, Integer, BigInteger, Numeric, Boolean, Text, Date, LargeBinary,
+    ForeignKey, DateTime, CheckConstraint, Index, Computed
 )
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from database import Base
+from datetime import datetime, timezone
 import uuid
 
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+# Weighted full-text document for product search (see search.py).
+# Name/SKU rank highest, then category/subcategory/tags, then metal/stone.
+PRODUCT_SEARCH_CONFIG = "english"
+PRODUCT_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(name, '') || ' ' || coalesce(sku, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '') || ' ' || coalesce(subcategory, '')), 'B') || "
+    "setweight(jsonb_to_tsvector('english', coalesce(tags, '[]'::jsonb), '[\"string\"]'), 'B') || "
+    "setweight(to_tsvector('english', coalesce(metal, '') || ' ' || coalesce(stone_type, '')), 'C')"
+)
+
 # Products table
 class ProductDB(Base):
     __tablename__ = "products"
@@ -32,6 +48,8 @@ class ProductDB(Base):
     # Images
     image = Column(String(1000))
     images = Column(JSONB, default=[])
+    # Image URL -> responsive variant URLs ({"thumb", "card", "zoom"}), see uploads.py
+    image_variants = Column(JSONB, default={})
     
     # Jewelry specifications
     metal = Column(String(100))
@@ -69,6 +87,8 @@ class ProductDB(Base):
     # Reservation System
     reserved_until = Column(DateTime(timezone=True))
     reserved_by = Column(String(200)) # session_id or user_id
+    # Units held by open (pending/processing) orders, maintained transactionally
+    reserved_quantity = Column(Integer, nullable=False, default=0, server_default='0')
     
     # Vendor
     vendor_id = Column(String(50))
@@ -89,6 +109,9 @@ class ProductDB(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    # Search (generated by Postgres, never loaded with the row)
+    search_vector = deferred(Column(TSVECTOR, Computed(PRODUCT_SEARCH_VECTOR_SQL, persisted=True)))
+    
     __table_args__ = (
         CheckConstraint('stock_quantity >= 0', name='products_stock_check'),
         Index('idx_products_category', 'category'),
@@ -96,6 +119,9 @@ class ProductDB(Base):
         Index('idx_products_barcode', 'barcode'),
         Index('idx_products_vendor', 'vendor_id'),
         Index('idx_products_stock', 'stock_quantity'),
+        Index('idx_products_search', 'search_vector', postgresql_using='gin'),
+        Index('idx_products_sku_upper', func.upper(sku)),
+        Index('idx_products_created_id', 'created_at', 'id'),
     )
 
 
@@ -123,6 +149,7 @@ class UserDB(Base):
     __table_args__ = (
         Index('idx_users_email', 'email'),
         Index('idx_users_role', 'role'),
+        Index('idx_users_created_id', 'created_at', 'id'),
     )
 
 
@@ -169,6 +196,15 @@ class OrderDB(Base):
     
     notes = Column(Text)
     
+    # Courier shipment (Shiprocket), set when the order is shipped
+    shiprocket_order_id = Column(String(50))
+    shipment_id = Column(String(50))
+    awb_code = Column(String(50))
+    courier_name = Column(String(100))
+    shipment_created_at = Column(DateTime(timezone=True))
+    # Set while a courier call for the order is in flight (see shipping.py)
+    shipment_claimed_at = Column(DateTime(timezone=True))
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -179,9 +215,56 @@ class OrderDB(Base):
         Index('idx_orders_channel', 'channel'),
         Index('idx_orders_status', 'status'),
         Index('idx_orders_created', 'created_at'),
+        Index('idx_orders_created_id', 'created_at', 'id'),
+        Index('idx_orders_shipment', 'shipment_id'),
     )
 
 
+# Order Lines table (normalized projection of OrderDB.items, written with the order)
+class OrderLineDB(Base):
+    __tablename__ = "order_lines"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    order_id = Column(UUID(as_uuid=True), nullable=False)
+    product_id = Column(UUID(as_uuid=True))
+    sku = Column(String(50))
+    name = Column(String(500))
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Numeric(12, 2), nullable=False)
+    # Per-unit cost snapshot taken from the product at the time of sale
+    cost_gold = Column(Numeric(12, 2))
+    cost_stone = Column(Numeric(12, 2))
+    cost_making = Column(Numeric(12, 2))
+    cost_other = Column(Numeric(12, 2))
+    unit_cost = Column(Numeric(12, 2))  # Product total_cost at the time of sale
+    channel = Column(String(20))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index('idx_order_lines_order', 'order_id'),
+        Index('idx_order_lines_product_created', 'product_id', 'created_at'),
+        Index('idx_order_lines_created_channel', 'created_at', 'channel'),
+    )
+
+
+# Daily Sales rollup (one row per IST day, channel and payment status; see sales_rollup.py)
+class SalesDailyDB(Base):
+    __tablename__ = "sales_daily"
+    
+    day = Column(Date, primary_key=True)
+    channel = Column(String(20), primary_key=True)
+    payment_status = Column(String(50), primary_key=True)
+    
+    order_count = Column(Integer, nullable=False, default=0)
+    pending_count = Column(Integer, nullable=False, default=0)
+    delivered_count = Column(Integer, nullable=False, default=0)
+    returned_count = Column(Integer, nullable=False, default=0)
+    
+    gross_sales = Column(Numeric(14, 2), nullable=False, default=0)
+    gross_profit = Column(Numeric(14, 2), nullable=False, default=0)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # Vendors table
 class VendorDB(Base):
     __tablename__ = "vendors"
@@ -231,16 +314,44 @@ class CouponDB(Base):
 class TrafficLogDB(Base):
     __tablename__ = "traffic_logs"
     
+    # Partitioned by month on created_at (see partitions.py), so it is part of the key
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     path = Column(String(500))
     user_agent = Column(Text)
     ip_address = Column(String(45))
     referrer = Column(Text)
     device_type = Column(String(50))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    source = Column(String(50))  # Referrer bucket, see traffic.classify_source
+    visitor_id = Column(String(64))  # Anonymous hash of IP + user agent
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=utcnow, server_default=func.now())
+    # Set by the database when the batch is written; created_at is when the event was queued
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now())
     
     __table_args__ = (
         Index('idx_traffic_created', 'created_at'),
+        Index('idx_traffic_ingested', 'ingested_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+# Daily Traffic rollup (maintained from traffic_logs by traffic_rollup.py)
+# dimension is 'total' (value ''), 'path', 'device' or 'source'
+class TrafficDailyDB(Base):
+    __tablename__ = "traffic_daily"
+    
+    day = Column(Date, primary_key=True)  # IST day
+    dimension = Column(String(20), primary_key=True)
+    value = Column(String(500), primary_key=True)
+    
+    pageviews = Column(Integer, nullable=False, default=0)
+    visitors = Column(Integer, nullable=False, default=0)  # HyperLogLog estimate
+    bounces = Column(Integer, nullable=False, default=0)  # Single-pageview visitors (path rows only)
+    visitor_sketch = Column(LargeBinary)  # Serialized HyperLogLog, mergeable across days
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('idx_traffic_daily_dimension_day', 'dimension', 'day'),
     )
 
 
@@ -275,6 +386,7 @@ class TransferDB(Base):
     __table_args__ = (
         Index('idx_transfers_number', 'transfer_number'),
         Index('idx_transfers_status', 'status'),
+        Index('idx_transfers_created_id', 'created_at', 'id'),
     )
 
 
@@ -282,6 +394,7 @@ class TransferDB(Base):
 class InventoryLedgerDB(Base):
     __tablename__ = "inventory_ledger"
     
+    # Partitioned by month on created_at (see partitions.py), so it is part of the key
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     product_id = Column(String(50), nullable=False)
     sku = Column(String(50))
@@ -297,13 +410,14 @@ class InventoryLedgerDB(Base):
     notes = Column(Text)
     
     created_by = Column(String(100))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=utcnow, server_default=func.now())
     
     __table_args__ = (
         Index('idx_ledger_product', 'product_id'),
         Index('idx_ledger_created', 'created_at'),
         Index('idx_ledger_sku', 'sku'),
         Index('idx_ledger_event', 'event_type'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
 
 
@@ -332,6 +446,7 @@ class PurchaseOrderDB(Base):
         Index('idx_po_number', 'po_number'),
         Index('idx_po_status', 'status'),
         Index('idx_po_vendor', 'vendor_id'),
+        Index('idx_po_created_id', 'created_at', 'id'),
     )
 
 
@@ -354,6 +469,7 @@ class ReviewDB(Base):
         Index('idx_reviews_product', 'product_id'),
         Index('idx_reviews_user', 'user_id'),
         Index('idx_reviews_rating', 'rating'),
+        Index('idx_reviews_created_id', 'created_at', 'id'),
         CheckConstraint('rating >= 1 AND rating <= 5', name='check_rating_range'),
     )
 
@@ -377,6 +493,7 @@ class ReturnRequestDB(Base):
         Index('idx_returns_order', 'order_id'),
         Index('idx_returns_customer', 'customer_id'),
         Index('idx_returns_status', 'status'),
+        Index('idx_returns_created_id', 'created_at', 'id'),
     )
 
 
@@ -413,6 +530,8 @@ class AbandonedCartDB(Base):
         Index('idx_abandoned_user', 'user_id'),
         Index('idx_abandoned_status', 'status'),
         Index('idx_abandoned_updated', 'updated_at'),
+        # Reminder engine: due carts by step (see cart_reminders.py)
+        Index('idx_abandoned_reminder_due', 'status', 'reminder_count', 'updated_at'),
     )
 
 
@@ -441,3 +560,86 @@ class AdminSettingsDB(Base):
     key = Column(String(100), primary_key=True)
     value = Column(String, nullable=False)  # JSON or simple string
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# Cached Shiprocket serviceability answers (see serviceability.py)
+class ShippingServiceabilityDB(Base):
+    __tablename__ = "shipping_serviceability"
+    
+    pickup_pincode = Column(String(10), primary_key=True)
+    delivery_pincode = Column(String(10), primary_key=True)
+    weight_band = Column(Numeric(8, 2), primary_key=True)  # kg, rounded up to SERVICEABILITY_WEIGHT_BAND
+    cod = Column(Integer, primary_key=True)
+    
+    response = Column(JSONB, nullable=False)
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    
+    __table_args__ = (
+        Index('idx_serviceability_expires', 'expires_at'),
+    )
+
+
+# Outgoing email queue (see mailer.py)
+class EmailOutboxDB(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String(50), nullable=False)  # otp, order_confirmation, abandoned_cart, ...
+    priority = Column(Integer, nullable=False, default=5)  # lower is sent first
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(500), nullable=False)
+    html = Column(Text, nullable=False)
+    
+    # Status: queued, sending, sent, dead
+    status = Column(String(20), nullable=False, default='queued')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        Index('idx_outbox_due', 'status', 'priority', 'next_attempt_at'),
+        Index('idx_outbox_recipient_sent', 'to_email', 'sent_at'),
+    )
+
+
+# Which worker owns each periodic job (see job_leases.py)
+class SchedulerLeaseDB(Base):
+    __tablename__ = "scheduler_leases"
+    
+    job_id = Column(String(100), primary_key=True)
+    owner = Column(String(200), nullable=False)  # host:pid:random of the owning worker
+    acquired_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    last_run_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+
+
+# Progress of background admin jobs, readable from every worker (see jobs.py)
+class BackgroundJobDB(Base):
+    __tablename__ = "background_jobs"
+    
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(50), nullable=False)  # product_import, product_bulk_load, bulk_ship
+    owner = Column(String(200), nullable=False)  # worker running the job
+    
+    # Status: queued, running, completed, failed
+    status = Column(String(20), nullable=False, default='queued')
+    processed = Column(BigInteger, nullable=False, default=0)
+    total = Column(BigInteger)
+    progress = Column(JSONB, nullable=False, default=dict)
+    result = Column(JSONB)
+    error = Column(Text)
+    
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    
+    __table_args__ = (
+        Index('idx_background_jobs_created', 'created_at'),
+    )
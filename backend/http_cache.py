@@ -0,0 +1,58 @@
+"""
+HTTP conditional requests for catalogue responses.
+
+ETags are derived from the catalogue version (see CatalogCache.version)
+and the request URL, so they change whenever products, stock or reviews
+change. Endpoints compare If-None-Match first and answer 304 before any
+database work. Cache-Control lets browsers and CDNs keep serving a copy
+while they revalidate in the background.
+
+    headers = await catalog_cache_headers(request)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+"""
+import hashlib
+from typing import Dict
+
+from fastapi import Request
+
+from cache import catalog_cache
+
+CATALOG_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=600"
+SITEMAP_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+
+
+def make_etag(version: str, request: Request) -> str:
+    raw = f"{version}|{request.url.path}?{request.url.query}"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def versioned_headers(request: Request, version: str, cache_control: str) -> Dict[str, str]:
+    """ETag + Cache-Control for a response identified by `version`"""
+    return {"ETag": make_etag(version, request), "Cache-Control": cache_control}
+
+
+async def catalog_cache_headers(request: Request, cache_control: str = CATALOG_CACHE_CONTROL,
+                                extra_version: str = "") -> Dict[str, str]:
+    """ETag + Cache-Control for the current catalogue version (empty if the version is unavailable)"""
+    version = await catalog_cache.version()
+    if version is None:
+        return {}
+    return versioned_headers(request, version + extra_version, cache_control)
+
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """Weak If-None-Match comparison against the response's ETag"""
+    etag = headers.get("ETag")
+    header = request.headers.get("if-none-match")
+    if not etag or not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in header.split(",")}
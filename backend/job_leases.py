@@ -0,0 +1,187 @@
+"""
+Leader election for the APScheduler jobs.
+
+Every app process (uvicorn worker, pod) runs the same scheduler, so without
+coordination each periodic job would run once per process. JobCoordinator
+gives every job a lease row in scheduler_leases:
+
+* a renewal loop (every JOB_LEASE_TTL_SECONDS / 3) takes free or expired
+  leases and extends the ones this process holds, in one upsert per job
+  that compares against the database clock, so worker clocks never matter;
+* a scheduled run only does work in the process that holds the job's
+  lease; everywhere else it is a no-op;
+* if the owner dies, its lease expires after JOB_LEASE_TTL_SECONDS and the
+  next renewal in another process takes over. A clean shutdown releases
+  its leases right away.
+
+Different jobs may end up owned by different processes. A run that
+outlives a lost lease is not interrupted, so jobs must still tolerate an
+occasional overlap (they all claim work with row locks or upserts).
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, text
+
+from database import async_session_maker
+from db_models import SchedulerLeaseDB
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_TTL_SECONDS = int(os.getenv("JOB_LEASE_TTL_SECONDS", "60"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Take the lease if it is free, expired or already ours; RETURNING only when we hold it
+_ACQUIRE_SQL = text("""
+    INSERT INTO scheduler_leases (job_id, owner, acquired_at, expires_at)
+    VALUES (:job_id, :owner, now(), now() + make_interval(secs => :ttl))
+    ON CONFLICT (job_id) DO UPDATE
+    SET owner = EXCLUDED.owner,
+        expires_at = EXCLUDED.expires_at,
+        acquired_at = CASE WHEN scheduler_leases.owner = EXCLUDED.owner
+                           THEN scheduler_leases.acquired_at ELSE now() END
+    WHERE scheduler_leases.owner = EXCLUDED.owner OR scheduler_leases.expires_at < now()
+    RETURNING job_id
+""")
+
+
+class JobCoordinator:
+    def __init__(self, scheduler, ttl_seconds: int = JOB_LEASE_TTL_SECONDS, worker_id: str = WORKER_ID):
+        self.scheduler = scheduler
+        self.ttl = ttl_seconds
+        self.worker_id = worker_id
+        self.renew_interval = max(1.0, ttl_seconds / 3)
+        self._job_ids: List[str] = []
+        # job id -> loop time until which this process may act as owner
+        self._owned_until: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add_job(self, func: Callable[[], Awaitable[Any]], trigger, id: str, **kwargs):
+        """Register a periodic job; it runs only in the process holding its lease"""
+        if id not in self._job_ids:
+            self._job_ids.append(id)
+        self.scheduler.add_job(self._guarded(id, func), trigger, id=id, replace_existing=True, **kwargs)
+
+    def owns(self, job_id: str) -> bool:
+        return self._owned_until.get(job_id, 0.0) > asyncio.get_running_loop().time()
+
+    def owned_jobs(self) -> List[str]:
+        return [job_id for job_id in self._job_ids if self.owns(job_id)]
+
+    def _guarded(self, job_id: str, func: Callable[[], Awaitable[Any]]):
+        async def run():
+            if not self.owns(job_id):
+                return
+            error = None
+            try:
+                await func()
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Scheduled job {job_id} failed: {e}")
+            await self._record_run(job_id, error)
+
+        run.__name__ = getattr(func, "__name__", job_id)
+        return run
+
+    async def renew(self):
+        """Acquire or extend the lease of every registered job"""
+        loop = asyncio.get_running_loop()
+        for job_id in self._job_ids:
+            started = loop.time()
+            try:
+                async with async_session_maker() as db:
+                    held = (await db.execute(
+                        _ACQUIRE_SQL, {"job_id": job_id, "owner": self.worker_id, "ttl": float(self.ttl)}
+                    )).scalar_one_or_none()
+                    await db.commit()
+            except Exception as e:
+                # Keep acting as owner only while the last granted lease is surely still valid
+                logger.warning(f"Could not renew lease for {job_id}: {e}")
+                continue
+            was_owner = self.owns(job_id)
+            if held:
+                # Measured from before the round trip, and with a margin, so we stop before the DB lease ends
+                self._owned_until[job_id] = started + self.ttl - self.renew_interval
+                if not was_owner:
+                    logger.info(f"Worker {self.worker_id} now runs scheduled job {job_id}")
+            else:
+                self._owned_until.pop(job_id, None)
+                if was_owner:
+                    logger.warning(f"Worker {self.worker_id} lost the lease for scheduled job {job_id}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self.renew()
+            except Exception as e:
+                logger.error(f"Lease renewal failed: {e}")
+
+    async def start(self):
+        """Take the initial leases, then keep renewing them in the background"""
+        try:
+            await self.renew()
+        except Exception as e:
+            logger.error(f"Initial lease acquisition failed: {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._owned_until.clear()
+        # Hand the jobs over immediately instead of after the TTL
+        try:
+            async with async_session_maker() as db:
+                await db.execute(
+                    text("UPDATE scheduler_leases SET expires_at = now() - interval '1 second' WHERE owner = :owner"),
+                    {"owner": self.worker_id}
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Could not release scheduler leases: {e}")
+
+    async def _record_run(self, job_id: str, error: Optional[str] = None):
+        try:
+            async with async_session_maker() as db:
+                await db.execute(
+                    text("""
+                        UPDATE scheduler_leases SET last_run_at = now(), last_error = :error
+                        WHERE job_id = :job_id AND owner = :owner
+                    """),
+                    {"job_id": job_id, "owner": self.worker_id, "error": error}
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Could not record run of {job_id}: {e}")
+
+    async def status(self) -> Dict[str, Any]:
+        async with async_session_maker() as db:
+            leases = (await db.execute(select(SchedulerLeaseDB).order_by(SchedulerLeaseDB.job_id))).scalars().all()
+        now = datetime.now(timezone.utc)
+        return {
+            "worker_id": self.worker_id,
+            "owned_here": self.owned_jobs(),
+            "leases": [
+                {
+                    "job_id": lease.job_id,
+                    "owner": lease.owner,
+                    "active": lease.expires_at > now,
+                    "acquired_at": lease.acquired_at.isoformat(),
+                    "expires_at": lease.expires_at.isoformat(),
+                    "last_run_at": lease.last_run_at.isoformat() if lease.last_run_at else None,
+                    "last_error": lease.last_error,
+                }
+                for lease in leases
+            ],
+        }
@@ -0,0 +1,209 @@
+"""
+Background admin jobs with progress reporting.
+
+Long admin operations (bulk imports, bulk shipping) run as asyncio tasks
+started here; the endpoint that starts one returns its id right away, and
+GET /api/admin/jobs/{id} reports progress until it finishes.
+
+The task runs in the worker that started it, but its state lives in the
+background_jobs table, so any worker can answer the progress endpoint:
+
+* the row is inserted before start() returns the id;
+* progress is written at most every JOB_PROGRESS_INTERVAL seconds (and
+  at least every JOB_HEARTBEAT_SECONDS while running), so a job that
+  reports per row does not turn into a write per row;
+* the final status and result are written when the task ends. A running
+  job whose row has not been touched for JOB_STALE_SECONDS belonged to a
+  worker that died and is reported as failed.
+
+Finished jobs are deleted after JOB_RETENTION_DAYS.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+
+from database import async_session_maker
+from db_models import BackgroundJobDB
+
+logger = logging.getLogger(__name__)
+
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1"))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+def _jsonable(value: Any) -> Any:
+    """Round-trip through json so dates, UUIDs and decimals fit a JSONB column"""
+    return json.loads(json.dumps(value, default=str))
+
+
+def job_to_dict(job) -> Dict[str, Any]:
+    """API view of a Job or a BackgroundJobDB row"""
+    percent = None
+    if job.total:
+        percent = round(min(job.processed / job.total, 1) * 100, 1)
+    elif job.status == JOB_COMPLETED:
+        percent = 100.0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "processed": job.processed,
+        "total": job.total,
+        "percent": percent,
+        "progress": job.progress or {},
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class Job:
+    def __init__(self, kind: str, total: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.total = total
+        self.processed = 0
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = asyncio.Event()
+
+    def update(self, processed: Optional[int] = None, total: Optional[int] = None, **progress):
+        """Record progress; extra keyword counters are reported as-is"""
+        if processed is not None:
+            self.processed = processed
+        if total is not None:
+            self.total = total
+        self.progress.update(progress)
+        self._dirty.set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return job_to_dict(self)
+
+    def _values(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "progress": _jsonable(self.progress),
+            "result": _jsonable(self.result),
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+
+class JobRegistry:
+    def __init__(self, retention: timedelta = timedelta(days=JOB_RETENTION_DAYS)):
+        self.retention = retention
+        # Jobs running in this process, so their tasks are not garbage collected
+        self._running: Dict[str, Job] = {}
+
+    async def start(self, kind: str, run: Callable[[Job], Awaitable[Any]], total: Optional[int] = None) -> Job:
+        """Run `run(job)` as a background task; its return value becomes job.result"""
+        job = Job(kind, total)
+        async with async_session_maker() as db:
+            await db.execute(delete(BackgroundJobDB).where(
+                BackgroundJobDB.finished_at < job.created_at - self.retention
+            ))
+            db.add(BackgroundJobDB(id=job.id, kind=kind, owner=WORKER_ID, status=job.status,
+                                   total=total, progress={}, created_at=job.created_at,
+                                   updated_at=job.created_at))
+            await db.commit()
+        self._running[job.id] = job
+        job._task = asyncio.create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[Any]]):
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now(timezone.utc)
+        reporter = asyncio.create_task(self._report(job))
+        try:
+            job.result = await run(job)
+            job.status = JOB_COMPLETED
+        except Exception as e:
+            logger.exception(f"Background job {job.kind} {job.id} failed")
+            job.error = str(e)
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            reporter.cancel()
+            try:
+                await reporter
+            except asyncio.CancelledError:
+                pass
+            await self._save(job)
+            self._running.pop(job.id, None)
+
+    async def _report(self, job: Job):
+        """Write progress while the job runs, batched to one write per interval"""
+        while True:
+            await self._save(job)
+            try:
+                await asyncio.wait_for(job._dirty.wait(), timeout=JOB_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            job._dirty.clear()
+            await asyncio.sleep(JOB_PROGRESS_INTERVAL)
+
+    async def _save(self, job: Job):
+        try:
+            async with async_session_maker() as db:
+                await db.execute(
+                    update(BackgroundJobDB).where(BackgroundJobDB.id == job.id).values(**job._values())
+                )
+                await db.commit()
+        except Exception as e:
+            # The job itself keeps running; only its reported progress lags
+            logger.warning(f"Could not save progress of job {job.id}: {e}")
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        async with async_session_maker() as db:
+            row = await db.get(BackgroundJobDB, job_id)
+        if row is None:
+            return None
+        job = job_to_dict(row)
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+        if not row.finished_at and row.updated_at < stale_before:
+            job["status"] = JOB_FAILED
+            job["error"] = f"Worker {row.owner} stopped reporting progress"
+        return job
+
+    async def recent(self, kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Recent jobs, newest first"""
+        query = select(BackgroundJobDB).order_by(BackgroundJobDB.created_at.desc()).limit(limit)
+        if kind is not None:
+            query = query.where(BackgroundJobDB.kind == kind)
+        async with async_session_maker() as db:
+            rows = (await db.execute(query)).scalars().all()
+        return [job_to_dict(row) for row in rows]
+
+
+job_registry = JobRegistry()
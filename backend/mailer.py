@@ -0,0 +1,428 @@
+"""
+Outgoing email: a persistent outbox plus a pooled async SMTP sender.
+
+Callers never talk to SMTP. enqueue_email() inserts a row into
+email_outbox, either in the caller's transaction (the email exists if and
+only if e.g. the order does) or on its own. The MailWorker then:
+
+* claims up to MAIL_BATCH_SIZE due rows with FOR UPDATE SKIP LOCKED, so
+  several app workers can run it side by side; claims are leased, and rows
+  whose lease expired (crashed worker) are picked up again;
+* defers rows whose recipient already got MAIL_RECIPIENT_LIMIT emails in
+  the last MAIL_RECIPIENT_WINDOW_MINUTES; OTP emails are exempt and do not
+  count towards the limit, since a deferred login code is useless;
+* sends the batch over a pool of MAIL_POOL_SIZE authenticated aiosmtplib
+  connections that stay open between batches;
+* marks rows sent, or schedules a retry with exponential backoff. Rows
+  that keep failing (MAIL_MAX_ATTEMPTS) or are refused permanently (5xx)
+  become "dead" and can be re-queued by an admin.
+
+SMTP settings come from SMTP_HOST/SMTP_PORT/SMTP_USER (or SMTP_EMAIL)/
+SMTP_PASSWORD. SMTP_SECURITY (ssl, starttls or none) defaults to ssl on
+port 465; with SMTP_SECURITY=none and no credentials, mail can be pointed
+at a local SMTP sink for development and testing.
+"""
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import make_msgid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, event, func, select, text, update
+
+from database import async_session_maker
+from db_models import EmailOutboxDB
+
+logger = logging.getLogger(__name__)
+
+MAIL_POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", "2"))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "50"))
+MAIL_POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", "5"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+MAIL_RECIPIENT_LIMIT = int(os.getenv("MAIL_RECIPIENT_LIMIT", "10"))
+MAIL_RECIPIENT_WINDOW_MINUTES = int(os.getenv("MAIL_RECIPIENT_WINDOW_MINUTES", "60"))
+MAIL_RETENTION_DAYS = int(os.getenv("MAIL_RETENTION_DAYS", "30"))
+MAIL_SMTP_TIMEOUT = float(os.getenv("MAIL_SMTP_TIMEOUT", "30"))
+# Close pooled connections unused for this long (servers drop idle sessions anyway)
+MAIL_IDLE_SECONDS = 120
+CLAIM_LEASE = timedelta(minutes=5)
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+CLEANUP_INTERVAL = timedelta(hours=1)
+
+BRAND = "Annya Jewellers"
+
+# Outbox priorities: lower is sent first
+PRIORITY_OTP = 0
+PRIORITY_TRANSACTIONAL = 3
+PRIORITY_MARKETING = 7
+
+STATUS_QUEUED = "queued"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_DEAD = "dead"
+
+# Login codes expire within minutes, so they bypass the per-recipient limit
+KIND_OTP = "otp"
+
+
+def is_rate_limit_exempt(row) -> bool:
+    return row.kind == KIND_OTP or row.priority == PRIORITY_OTP
+
+
+def apply_recipient_limit(rows, counts: Dict[str, int], limit: Optional[int] = None):
+    """Split claimed rows into (to_send, deferred); counts holds each recipient's recent sends and is updated"""
+    limit = MAIL_RECIPIENT_LIMIT if limit is None else limit
+    to_send, deferred = [], []
+    for row in rows:
+        if is_rate_limit_exempt(row):
+            to_send.append(row)
+        elif counts.get(row.to_email, 0) >= limit:
+            deferred.append(row)
+        else:
+            counts[row.to_email] = counts.get(row.to_email, 0) + 1
+            to_send.append(row)
+    return to_send, deferred
+
+
+class SmtpSettings:
+    def __init__(self):
+        self.host = os.getenv("SMTP_HOST") or os.getenv("SMTP_SERVER") or "smtp.gmail.com"
+        self.port = int(os.getenv("SMTP_PORT", "465"))
+        self.username = os.getenv("SMTP_EMAIL") or os.getenv("SMTP_USER")
+        self.password = os.getenv("SMTP_PASSWORD")
+        self.security = (os.getenv("SMTP_SECURITY") or ("ssl" if self.port == 465 else "starttls")).lower()
+        sender = self.username or "noreply@annyajewellers.com"
+        self.from_header = os.getenv("SMTP_FROM_EMAIL") or f"{BRAND} <{sender}>"
+
+
+def build_message(settings: SmtpSettings, to_email: str, subject: str, html: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = settings.from_header
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg["Message-ID"] = make_msgid()
+    msg.set_content(html, subtype="html")
+    return msg
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """5xx replies for the message itself (bad recipient, rejected content) will never succeed"""
+    import aiosmtplib
+
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        # 4xx refusals (greylisting, mailbox full) are worth retrying
+        return bool(error.recipients) and all(500 <= refusal.code < 600 for refusal in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return False  # a configuration problem: keep retrying until it is fixed
+    return isinstance(error, aiosmtplib.SMTPResponseException) and 500 <= error.code < 600
+
+
+def should_dead_letter(error: Exception, attempts: int) -> bool:
+    return is_permanent_failure(error) or attempts >= MAIL_MAX_ATTEMPTS
+
+
+def retry_delay(attempts: int) -> timedelta:
+    # Exponent capped so a large MAIL_MAX_ATTEMPTS cannot overflow timedelta
+    delay = min(RETRY_BASE * (2 ** min(max(attempts - 1, 0), 16)), RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class _PooledConnection:
+    """One SMTP session, connected and logged in on first use and reused afterwards"""
+
+    def __init__(self, settings: SmtpSettings):
+        self.settings = settings
+        self._smtp = None
+        self._last_used = 0.0
+
+    async def _connect(self):
+        import aiosmtplib
+
+        s = self.settings
+        smtp = aiosmtplib.SMTP(
+            hostname=s.host, port=s.port, timeout=MAIL_SMTP_TIMEOUT,
+            use_tls=s.security == "ssl", start_tls=s.security == "starttls",
+        )
+        await smtp.connect()
+        if s.username and s.password:
+            await smtp.login(s.username, s.password)
+        self._smtp = smtp
+
+    async def close(self):
+        if self._smtp is not None:
+            try:
+                await self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    async def close_if_idle(self, now: float):
+        if self._smtp is not None and now - self._last_used > MAIL_IDLE_SECONDS:
+            await self.close()
+
+    async def send(self, message: EmailMessage):
+        import aiosmtplib
+
+        loop = asyncio.get_running_loop()
+        if self._smtp is None or not self._smtp.is_connected:
+            await self._connect()
+        try:
+            await self._smtp.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError):
+            # The server dropped the idle session: reconnect once and resend
+            self._smtp = None
+            await self._connect()
+            await self._smtp.send_message(message)
+        self._last_used = loop.time()
+
+
+class SmtpPool:
+    def __init__(self, settings: SmtpSettings, size: int = MAIL_POOL_SIZE):
+        self.settings = settings
+        self._connections = [_PooledConnection(settings) for _ in range(max(1, size))]
+
+    async def send_all(self, messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        """Send messages spread over the pooled connections; one error (or None) per message"""
+        errors: List[Optional[Exception]] = [None] * len(messages)
+
+        async def run(connection: _PooledConnection, indexes: List[int]):
+            for i in indexes:
+                try:
+                    await connection.send(messages[i])
+                except Exception as e:
+                    errors[i] = e
+                    await connection.close()
+
+        await asyncio.gather(*(
+            run(connection, list(range(slot, len(messages), len(self._connections))))
+            for slot, connection in enumerate(self._connections)
+        ))
+        return errors
+
+    async def close_idle(self):
+        now = asyncio.get_running_loop().time()
+        for connection in self._connections:
+            await connection.close_if_idle(now)
+
+    async def close(self):
+        for connection in self._connections:
+            await connection.close()
+
+
+_CLAIM_SQL = text("""
+    UPDATE email_outbox o
+    SET status = 'sending', locked_until = :lease_until, attempts = o.attempts + 1
+    WHERE o.id IN (
+        SELECT id FROM email_outbox
+        WHERE (status = 'queued' AND next_attempt_at <= now())
+           OR (status = 'sending' AND locked_until < now())
+        ORDER BY priority, next_attempt_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.id, o.kind, o.to_email, o.subject, o.html, o.attempts, o.priority, o.next_attempt_at
+""")
+
+
+class MailWorker:
+    """Background task that drains email_outbox over pooled SMTP connections"""
+
+    def __init__(self, batch_size: int = MAIL_BATCH_SIZE, poll_interval: float = MAIL_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.settings = SmtpSettings()
+        self.pool = SmtpPool(self.settings)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_cleanup: Optional[datetime] = None
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.deferred = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Mail worker started ({MAIL_POOL_SIZE} SMTP connections to {self.settings.host}:{self.settings.port})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Rows claimed by an interrupted batch are retried once their lease expires
+        await self.pool.close()
+
+    def wake(self):
+        """Send newly queued mail now instead of at the next poll"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.process_batch()
+                await self._cleanup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mail worker batch failed: {e}")
+                claimed = 0
+            if claimed >= self.batch_size:
+                continue  # more is probably waiting
+            await self.pool.close_idle()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        """Claim, rate-limit, send and record one batch; returns the number of rows claimed"""
+        now = datetime.now(timezone.utc)
+        async with async_session_maker() as db:
+            rows = (await db.execute(_CLAIM_SQL, {"lease_until": now + CLAIM_LEASE, "limit": self.batch_size})).all()
+            await db.commit()
+        if not rows:
+            return 0
+        rows.sort(key=lambda r: (r.priority, r.next_attempt_at))
+
+        # Per-recipient rate limit, counting what this batch would add
+        window_start = now - timedelta(minutes=MAIL_RECIPIENT_WINDOW_MINUTES)
+        async with async_session_maker() as db:
+            counts = dict((await db.execute(
+                select(EmailOutboxDB.to_email, func.count())
+                .where(EmailOutboxDB.to_email.in_({r.to_email for r in rows}),
+                       EmailOutboxDB.status == STATUS_SENT,
+                       EmailOutboxDB.sent_at > window_start,
+                       EmailOutboxDB.kind != KIND_OTP)
+                .group_by(EmailOutboxDB.to_email)
+            )).all())
+        to_send, deferred = apply_recipient_limit(rows, counts)
+
+        messages = [build_message(self.settings, row.to_email, row.subject, row.html) for row in to_send]
+        results = await self.pool.send_all(messages) if messages else []
+
+        await self._record(now, to_send, results, deferred)
+        return len(rows)
+
+    async def _record(self, now: datetime, rows, results: List[Optional[Exception]], deferred):
+        done = datetime.now(timezone.utc)
+        sent_ids = [row.id for row, error in zip(rows, results) if error is None]
+        async with async_session_maker() as db:
+            if sent_ids:
+                await db.execute(
+                    update(EmailOutboxDB).where(EmailOutboxDB.id.in_(sent_ids))
+                    .values(status=STATUS_SENT, sent_at=done, locked_until=None, last_error=None)
+                )
+                self.sent += len(sent_ids)
+            for row, error in zip(rows, results):
+                if error is None:
+                    continue
+                values = {"locked_until": None, "last_error": str(error)[:2000]}
+                if should_dead_letter(error, row.attempts):
+                    values["status"] = STATUS_DEAD
+                    self.dead += 1
+                    logger.error(f"Email {row.id} to {row.to_email} dead-lettered after {row.attempts} attempts: {error}")
+                else:
+                    values["status"] = STATUS_QUEUED
+                    values["next_attempt_at"] = done + retry_delay(row.attempts)
+                    self.retried += 1
+                    logger.warning(f"Email {row.id} to {row.to_email} failed (attempt {row.attempts}), will retry: {error}")
+                await db.execute(update(EmailOutboxDB).where(EmailOutboxDB.id == row.id).values(**values))
+            if deferred:
+                # Not a failed attempt: just wait for the recipient's window to open up
+                await db.execute(
+                    update(EmailOutboxDB).where(EmailOutboxDB.id.in_([row.id for row in deferred]))
+                    .values(status=STATUS_QUEUED, locked_until=None, attempts=EmailOutboxDB.attempts - 1,
+                            next_attempt_at=now + timedelta(minutes=MAIL_RECIPIENT_WINDOW_MINUTES) / MAIL_RECIPIENT_LIMIT)
+                )
+                self.deferred += len(deferred)
+            await db.commit()
+        if sent_ids:
+            logger.info(f"Mail worker sent {len(sent_ids)} of {len(rows)} emails")
+
+    async def _cleanup(self):
+        now = datetime.now(timezone.utc)
+        if self._last_cleanup and now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        async with async_session_maker() as db:
+            result = await db.execute(
+                delete(EmailOutboxDB).where(
+                    EmailOutboxDB.status == STATUS_SENT,
+                    EmailOutboxDB.sent_at < now - timedelta(days=MAIL_RETENTION_DAYS)
+                )
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} sent emails older than {MAIL_RETENTION_DAYS} days")
+
+    async def send_now(self, to_email: str, subject: str, html: str):
+        """Send one message immediately on a fresh connection (configuration checks); raises on failure"""
+        connection = _PooledConnection(self.settings)
+        try:
+            await connection.send(build_message(self.settings, to_email, subject, html))
+        finally:
+            await connection.close()
+
+    async def stats(self) -> Dict[str, Any]:
+        async with async_session_maker() as db:
+            by_status = dict((await db.execute(
+                select(EmailOutboxDB.status, func.count()).group_by(EmailOutboxDB.status)
+            )).all())
+            oldest_due = (await db.execute(
+                select(func.min(EmailOutboxDB.next_attempt_at)).where(EmailOutboxDB.status == STATUS_QUEUED)
+            )).scalar()
+        return {
+            "outbox": by_status,
+            "oldest_queued_at": oldest_due.isoformat() if oldest_due else None,
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead": self.dead,
+            "deferred": self.deferred,
+        }
+
+
+mail_worker = MailWorker()
+
+
+async def enqueue_email(to_email: str, subject: str, html: str, kind: str,
+                        priority: int = PRIORITY_TRANSACTIONAL, db=None) -> EmailOutboxDB:
+    """
+    Queue an email. With `db`, it is added to the caller's transaction and
+    goes out once that commits; otherwise it is committed right away.
+    """
+    row = EmailOutboxDB(kind=kind, priority=priority, to_email=to_email, subject=subject, html=html,
+                        status=STATUS_QUEUED, next_attempt_at=datetime.now(timezone.utc))
+    if db is not None:
+        db.add(row)
+        event.listen(db.sync_session, "after_commit", lambda session: mail_worker.wake(), once=True)
+        return row
+    async with async_session_maker() as session:
+        session.add(row)
+        await session.commit()
+    mail_worker.wake()
+    return row
+
+
+async def requeue_dead_emails(ids: Optional[List[str]] = None) -> int:
+    """Give dead-lettered emails a fresh set of attempts"""
+    async with async_session_maker() as db:
+        stmt = update(EmailOutboxDB).where(EmailOutboxDB.status == STATUS_DEAD)
+        if ids:
+            stmt = stmt.where(EmailOutboxDB.id.in_(ids))
+        result = await db.execute(stmt.values(
+            status=STATUS_QUEUED, attempts=0, next_attempt_at=datetime.now(timezone.utc), last_error=None
+        ))
+        await db.commit()
+    mail_worker.wake()
+    return result.rowcount
@@ -0,0 +1,23 @@
+"""
+Database migration script for the abandoned-cart reminder engine
+Backfills reminder_count and adds the index used to find due carts.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+async def run_migration():
+    async with engine.begin() as conn:
+        # due_condition() compares reminder_count directly, so NULL must not occur
+        await conn.execute(text(
+            "UPDATE abandoned_carts SET reminder_count = 0 WHERE reminder_count IS NULL;"
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_abandoned_reminder_due "
+            "ON abandoned_carts (status, reminder_count, updated_at);"
+        ))
+
+        print("✅ Migration complete: abandoned cart reminder index created")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
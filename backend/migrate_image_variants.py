@@ -0,0 +1,18 @@
+"""
+Database migration script for responsive image variants
+Adds products.image_variants (image URL -> thumb/card/zoom URLs).
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+async def run_migration():
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE products ADD COLUMN IF NOT EXISTS image_variants JSONB DEFAULT '{}'::jsonb;"
+        ))
+
+        print("✅ Migration complete: products.image_variants added")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
@@ -0,0 +1,30 @@
+"""
+Database migration script for keyset pagination
+Adds (created_at, id) indexes so cursor pages are a single index range scan.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+KEYSET_INDEXES = {
+    "idx_products_created_id": "products",
+    "idx_users_created_id": "users",
+    "idx_orders_created_id": "orders",
+    "idx_transfers_created_id": "transfers",
+    "idx_po_created_id": "purchase_orders",
+    "idx_reviews_created_id": "reviews",
+    "idx_returns_created_id": "return_requests",
+}
+
+async def run_migration():
+    async with engine.begin() as conn:
+        for index_name, table in KEYSET_INDEXES.items():
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} (created_at, id);"
+            ))
+            print(f"✅ {index_name} on {table}")
+
+        print("✅ Migration complete: keyset pagination indexes created")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
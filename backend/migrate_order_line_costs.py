@@ -0,0 +1,37 @@
+"""
+Database migration script for order line cost snapshots
+Adds the cost breakdown columns to order_lines. Lines written before this
+migration have no snapshot, so they are filled from the product's current
+costs as a best estimate.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+async def run_migration():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            ALTER TABLE order_lines
+            ADD COLUMN IF NOT EXISTS cost_gold NUMERIC(12, 2),
+            ADD COLUMN IF NOT EXISTS cost_stone NUMERIC(12, 2),
+            ADD COLUMN IF NOT EXISTS cost_making NUMERIC(12, 2),
+            ADD COLUMN IF NOT EXISTS cost_other NUMERIC(12, 2);
+        """))
+
+        result = await conn.execute(text("""
+            UPDATE order_lines ol
+            SET cost_gold = p.cost_gold,
+                cost_stone = p.cost_stone,
+                cost_making = p.cost_making,
+                cost_other = p.cost_other,
+                unit_cost = COALESCE(ol.unit_cost, p.total_cost)
+            FROM products p
+            WHERE p.id = ol.product_id
+              AND ol.cost_gold IS NULL AND ol.cost_stone IS NULL
+              AND ol.cost_making IS NULL AND ol.cost_other IS NULL;
+        """))
+
+        print(f"✅ Migration complete: order_lines cost columns added, {result.rowcount} lines estimated from current costs")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
@@ -0,0 +1,47 @@
+"""
+Database migration script for normalized order lines
+Creates the order_lines table and backfills it from the orders.items JSON.
+Backfilled unit_cost uses the product's current total_cost as a best estimate.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+from db_models import OrderLineDB
+
+UUID_PATTERN = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+async def run_migration():
+    async with engine.begin() as conn:
+        await conn.run_sync(OrderLineDB.__table__.create, checkfirst=True)
+        for index in OrderLineDB.__table__.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+
+        # Online orders store "id", admin/POS orders store "id" or legacy "productId"
+        result = await conn.execute(text("""
+            INSERT INTO order_lines (id, order_id, product_id, sku, name, quantity, unit_price, unit_cost, channel, created_at)
+            SELECT
+                gen_random_uuid(),
+                o.id,
+                p.id,
+                COALESCE(item->>'sku', p.sku),
+                COALESCE(item->>'name', p.name),
+                COALESCE((item->>'quantity')::int, 1),
+                COALESCE((item->>'price')::numeric, 0),
+                p.total_cost,
+                o.channel,
+                o.created_at
+            FROM orders o
+            CROSS JOIN LATERAL jsonb_array_elements(o.items::jsonb) AS item
+            LEFT JOIN products p
+                ON p.id = CASE
+                    WHEN COALESCE(item->>'id', item->>'productId') ~ :uuid_pattern
+                    THEN COALESCE(item->>'id', item->>'productId')::uuid
+                END
+            WHERE jsonb_typeof(o.items::jsonb) = 'array'
+              AND NOT EXISTS (SELECT 1 FROM order_lines ol WHERE ol.order_id = o.id);
+        """), {"uuid_pattern": UUID_PATTERN})
+
+        print(f"✅ Migration complete: order_lines created, {result.rowcount} lines backfilled")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
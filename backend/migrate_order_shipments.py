@@ -0,0 +1,28 @@
+"""
+Database migration script for persisted courier shipments
+Adds the Shiprocket order/shipment ids, AWB code, courier name and the
+in-flight shipment claim to orders.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+async def run_migration():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            ALTER TABLE orders
+            ADD COLUMN IF NOT EXISTS shiprocket_order_id VARCHAR(50),
+            ADD COLUMN IF NOT EXISTS shipment_id VARCHAR(50),
+            ADD COLUMN IF NOT EXISTS awb_code VARCHAR(50),
+            ADD COLUMN IF NOT EXISTS courier_name VARCHAR(100),
+            ADD COLUMN IF NOT EXISTS shipment_created_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS shipment_claimed_at TIMESTAMPTZ;
+        """))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_orders_shipment ON orders (shipment_id);"
+        ))
+
+        print("✅ Migration complete: shipment columns added to orders")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
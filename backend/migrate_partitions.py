@@ -0,0 +1,60 @@
+"""
+Database migration script for monthly partitioning
+Converts traffic_logs and inventory_ledger into tables partitioned by
+RANGE (created_at), copying existing rows into monthly partitions.
+Each table is converted in its own transaction; already partitioned
+tables are skipped.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+from db_models import TrafficLogDB, InventoryLedgerDB
+from partitions import is_partitioned, ensure_partitions, month_start
+
+async def convert_table(conn, table):
+    name = table.name
+    legacy = f"{name}_unpartitioned"
+
+    await conn.execute(text(f"ALTER TABLE {name} RENAME TO {legacy}"))
+    # Free the index / primary key names for the new table
+    await conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {name}_pkey"))
+    indexes = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": legacy})
+    for (index_name,) in indexes.all():
+        await conn.execute(text(f'DROP INDEX IF EXISTS "{index_name}"'))
+    # created_at becomes part of the primary key
+    await conn.execute(text(f"UPDATE {legacy} SET created_at = now() WHERE created_at IS NULL"))
+
+    await conn.run_sync(table.create)
+
+    oldest = (await conn.execute(text(f"SELECT min(created_at) FROM {legacy}"))).scalar()
+    await ensure_partitions(conn, name, month_start(oldest.date()) if oldest else None)
+
+    # Copy only the columns both versions have (older tables may lack newer columns)
+    legacy_columns = await conn.execute(
+        text("SELECT column_name FROM information_schema.columns WHERE table_name = :t"), {"t": legacy}
+    )
+    existing = {c for (c,) in legacy_columns.all()}
+    columns = ", ".join(c.name for c in table.columns if c.name in existing)
+    result = await conn.execute(text(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {legacy}"))
+
+    await conn.execute(text(f"DROP TABLE {legacy}"))
+    print(f"✅ {name} partitioned by month ({result.rowcount} rows copied)")
+
+async def run_migration():
+    for table in (TrafficLogDB.__table__, InventoryLedgerDB.__table__):
+        async with engine.begin() as conn:
+            exists = (await conn.execute(text("SELECT to_regclass(:t)"), {"t": table.name})).scalar()
+            if exists and await is_partitioned(conn, table.name):
+                print(f"ℹ️ {table.name} is already partitioned")
+                continue
+            if exists:
+                await convert_table(conn, table)
+            else:
+                await conn.run_sync(table.create)
+                await ensure_partitions(conn, table.name)
+                print(f"✅ {table.name} created as a partitioned table")
+
+    print("✅ Migration complete: traffic_logs and inventory_ledger are partitioned")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
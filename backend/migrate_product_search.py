@@ -0,0 +1,26 @@
+"""
+Database migration script for product full-text search
+Adds the generated search_vector column and its GIN / SKU lookup indexes.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+from db_models import PRODUCT_SEARCH_VECTOR_SQL
+
+async def run_migration():
+    async with engine.begin() as conn:
+        # Generated, weighted tsvector kept in sync by Postgres on every write
+        await conn.execute(text(f"""
+            ALTER TABLE products
+            ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS ({PRODUCT_SEARCH_VECTOR_SQL}) STORED;
+        """))
+
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN (search_vector);"))
+        # Case-insensitive exact SKU hits (barcode already has idx_products_barcode)
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_products_sku_upper ON products (upper(sku));"))
+
+        print("✅ Migration complete: products.search_vector and search indexes created")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
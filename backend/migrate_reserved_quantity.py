@@ -0,0 +1,39 @@
+"""
+Database migration script for the materialized reserved-quantity counter
+Adds products.reserved_quantity and backfills it from open (pending/processing) orders.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+UUID_PATTERN = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+async def run_migration():
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE products ADD COLUMN IF NOT EXISTS reserved_quantity INTEGER NOT NULL DEFAULT 0;"
+        ))
+
+        # Rebuild from scratch so the script is safe to re-run
+        await conn.execute(text("UPDATE products SET reserved_quantity = 0 WHERE reserved_quantity <> 0;"))
+        # Same item keys as adjust_reserved_quantities(): "id", or legacy "productId" on admin/POS orders
+        result = await conn.execute(text("""
+            UPDATE products p
+            SET reserved_quantity = r.qty
+            FROM (
+                SELECT COALESCE(item->>'id', item->>'productId')::uuid AS product_id,
+                       SUM(COALESCE((item->>'quantity')::int, 0)) AS qty
+                FROM orders o
+                CROSS JOIN LATERAL jsonb_array_elements(o.items) AS item
+                WHERE o.status IN ('pending', 'processing')
+                  AND jsonb_typeof(o.items) = 'array'
+                  AND COALESCE(item->>'id', item->>'productId') ~ :uuid_pattern
+                GROUP BY 1
+            ) r
+            WHERE p.id = r.product_id;
+        """), {"uuid_pattern": UUID_PATTERN})
+
+        print(f"✅ Migration complete: reserved_quantity backfilled for {result.rowcount} products")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
@@ -0,0 +1,39 @@
+"""
+Database migration script for the traffic rollup ingest time
+Adds traffic_logs.ingested_at (set by the database on insert), which the
+rollup watermark now tracks instead of created_at.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+async def run_migration():
+    async with engine.begin() as conn:
+        # No default while adding, so existing rows are not all stamped with the migration time
+        await conn.execute(text("""
+            ALTER TABLE traffic_logs ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMPTZ;
+        """))
+        await conn.execute(text("""
+            ALTER TABLE traffic_logs ALTER COLUMN ingested_at SET DEFAULT now();
+        """))
+
+        # Rows past the current watermark have not been rolled up yet; the rest must stay out
+        result = await conn.execute(text("""
+            UPDATE traffic_logs
+            SET ingested_at = created_at
+            WHERE ingested_at IS NULL
+              AND created_at >= COALESCE(
+                  (SELECT NULLIF(value, '')::timestamptz FROM admin_settings
+                   WHERE key = 'traffic_rollup_watermark'),
+                  '-infinity'::timestamptz
+              );
+        """))
+
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_traffic_ingested ON traffic_logs (ingested_at);
+        """))
+
+        print(f"✅ Migration complete: traffic_logs.ingested_at added ({result.rowcount} pending rows stamped)")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
@@ -0,0 +1,20 @@
+"""
+Database migration script for traffic ingestion
+Adds the source bucket and anonymous visitor id columns to traffic_logs.
+"""
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+async def run_migration():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            ALTER TABLE traffic_logs
+            ADD COLUMN IF NOT EXISTS source VARCHAR(50),
+            ADD COLUMN IF NOT EXISTS visitor_id VARCHAR(64);
+        """))
+
+        print("✅ Migration complete: traffic_logs.source and visitor_id added")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
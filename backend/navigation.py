@@ -0,0 +1,190 @@
+"""
+Cached storefront navigation (mega-menu) for GET /api/navigation.
+
+The menu structure comes from navigation_config.json when it has entries,
+otherwise from the active category/subcategory pairs. It is built once,
+together with a pool of featured candidates per top-level entry, and
+rebuilt when invalidated (product or navigation changes) or after
+NAVIGATION_CACHE_TTL seconds. Requests only rotate through the pools in
+memory, so a page load costs no queries.
+
+Each worker keeps its own copy; invalidation is local to the worker that
+made the change, and the TTL bounds staleness everywhere else.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select
+
+from database import async_session_maker
+from db_models import ProductDB
+
+logger = logging.getLogger(__name__)
+
+NAVIGATION_FILE = "navigation_config.json"
+NAVIGATION_CACHE_TTL = int(os.getenv("NAVIGATION_CACHE_TTL", "600"))
+FEATURED_POOL_SIZE = 24
+FEATURED_PER_CATEGORY = 2
+
+CATEGORY_PRIORITY = ["Engagement Rings", "Diamond Jewellery", "Wedding Rings", "Gold Jewellery", "Silver Jewellery"]
+
+
+def load_navigation_config() -> Optional[list]:
+    """Saved manual navigation, or None when missing/empty/unreadable"""
+    if not os.path.exists(NAVIGATION_FILE):
+        return None
+    try:
+        with open(NAVIGATION_FILE, 'r') as f:
+            saved_nav = json.load(f)
+        if saved_nav and isinstance(saved_nav, list):
+            return saved_nav
+    except Exception as e:
+        logger.error(f"Error loading navigation config: {e}")
+    return None
+
+
+async def build_dynamic_navigation(db) -> List[Dict[str, Any]]:
+    """Menu entries derived from active products' categories/subcategories"""
+    result = await db.execute(
+        select(ProductDB.category, ProductDB.subcategory)
+        .where(ProductDB.status == 'active')
+        .distinct()
+        .order_by(ProductDB.category, ProductDB.subcategory)
+    )
+
+    # Group by Category
+    tree = {}
+    for cat, sub in result.all():
+        if not cat:
+            continue
+        cat = cat.strip()
+        sub = sub.strip() if sub else None
+        tree.setdefault(cat, set())
+        if sub:
+            tree[cat].add(sub)
+
+    # Sort Categories: known ones first in merchandising order, then alphabetical
+    priority_index = {name: i for i, name in enumerate(CATEGORY_PRIORITY)}
+    sorted_categories = sorted(tree.keys())
+    sorted_categories.sort(key=lambda x: priority_index.get(x, 999 + (1 if x > "" else 0)))
+
+    nav_structure = []
+    for cat in sorted_categories:
+        subcats = sorted(tree[cat])
+
+        # Split into columns
+        columns = []
+        chunk_size = 6
+        for i in range(0, len(subcats), chunk_size):
+            columns.append({
+                "title": "Browse" if i == 0 else None,
+                "items": subcats[i:i + chunk_size]
+            })
+        if not columns:
+            columns.append({"title": None, "items": []})
+
+        # Add "All [Category]"
+        columns[0]["items"].append(f"All {cat}")
+
+        nav_structure.append({"name": cat, "columns": columns})
+    return nav_structure
+
+
+async def load_featured_pool(db, category_name: str, keywords: Optional[list] = None) -> List[Dict[str, str]]:
+    """Newest in-stock products with an image for a menu entry (keywords from manual config, else category)"""
+    if keywords:
+        filters = []
+        for k in keywords:
+            filters.append(ProductDB.category.ilike(f"%{k}%"))
+            filters.append(ProductDB.subcategory.ilike(f"%{k}%"))
+            filters.append(ProductDB.name.ilike(f"%{k}%"))
+        filter_cond = or_(*filters)
+    else:
+        filter_cond = (ProductDB.category == category_name)
+
+    result = await db.execute(
+        select(ProductDB.id, ProductDB.name, ProductDB.image)
+        .where(
+            and_(
+                filter_cond,
+                ProductDB.status == 'active',
+                ProductDB.stock_quantity > 0,
+                ProductDB.image.isnot(None),
+                ProductDB.image != ""
+            )
+        )
+        .order_by(ProductDB.created_at.desc())
+        .limit(FEATURED_POOL_SIZE)
+    )
+    return [
+        {"title": name, "link": f"/product/{product_id}", "image": image}
+        for product_id, name, image in result.all()
+    ]
+
+
+class NavigationCache:
+    def __init__(self, ttl: float = NAVIGATION_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._pools: List[List[Dict[str, str]]] = []
+        self._expires_at = 0.0
+        self._rotation = 0
+        self._builds = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Force a rebuild on the next request"""
+        self._expires_at = 0.0
+
+    async def _rebuild(self):
+        async with async_session_maker() as db:
+            nav_structure = load_navigation_config() or await build_dynamic_navigation(db)
+            entries, pools = [], []
+            for item in nav_structure:
+                cat_name = item.get("name", "")
+                entries.append({"name": cat_name, "columns": item.get("columns", [])})
+                # Manual config may carry specific keywords; otherwise the name is the DB category
+                pools.append(await load_featured_pool(db, cat_name, item.get("keywords")))
+        self._entries, self._pools = entries, pools
+        self._builds += 1
+        self._expires_at = time.monotonic() + self.ttl
+
+    async def version(self) -> str:
+        """Changes whenever the menu or its featured pools are rebuilt (used for ETags)"""
+        await self._ensure_fresh()
+        return f".nav{self._builds}"
+
+    async def _ensure_fresh(self):
+        if time.monotonic() >= self._expires_at:
+            async with self._lock:
+                # Another request may have rebuilt it while we waited
+                if time.monotonic() >= self._expires_at:
+                    try:
+                        await self._rebuild()
+                    except Exception as e:
+                        if self._entries is None:
+                            raise
+                        logger.error(f"Navigation rebuild failed, serving previous menu: {e}")
+                        self._expires_at = time.monotonic() + min(self.ttl, 30)
+
+    async def get(self) -> List[Dict[str, Any]]:
+        await self._ensure_fresh()
+
+        # Rotate featured picks through each pool in memory
+        self._rotation += 1
+        menu = []
+        for entry, pool in zip(self._entries, self._pools):
+            featured = []
+            if pool:
+                start = (self._rotation * FEATURED_PER_CATEGORY) % len(pool)
+                count = min(FEATURED_PER_CATEGORY, len(pool))
+                featured = [pool[(start + i) % len(pool)] for i in range(count)]
+            menu.append({**entry, "featured": featured})
+        return menu
+
+
+navigation_cache = NavigationCache()
@@ -0,0 +1,103 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Lists are ordered newest first on a tuple of sort keys, normally
+(created_at, id). The cursor is an opaque, URL-safe token holding the sort
+keys of the last row on the page, so the next page is a single indexed
+range scan no matter how deep the client has paged.
+
+Endpoints opt in per request: passing `cursor` (empty for the first page)
+returns {"items": [...], "next_cursor": ...}; omitting it keeps the legacy
+plain-list response for existing clients.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+CURSOR_LABEL = "cursor_key_"
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"uuid": str(value)}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "uuid" in value:
+            return uuid.UUID(value["uuid"])
+        raise ValueError("Unknown cursor value")
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Pack sort-key values into an opaque cursor string"""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_count: int) -> Tuple[Any, ...]:
+    """Unpack a cursor produced by encode_cursor, rejecting anything else"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != key_count:
+            raise ValueError("Cursor does not match this list")
+        return tuple(_decode_value(v) for v in values)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def resolve_page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """Cursor requests are always bounded; legacy requests keep their old limit"""
+    if limit is not None:
+        return limit
+    return DEFAULT_PAGE_SIZE if cursor is not None else None
+
+
+def keyset_paginate(stmt, keys: Sequence[Any], cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Order `stmt` by `keys` (all descending), resume after `cursor` and fetch
+    one extra row so split_page can tell whether another page exists.
+    The key values are added to the select so each row carries its position.
+    """
+    stmt = stmt.add_columns(*(key.label(f"{CURSOR_LABEL}{i}") for i, key in enumerate(keys)))
+    if cursor:
+        stmt = stmt.where(tuple_(*keys) < decode_cursor(cursor, len(keys)))
+    stmt = stmt.order_by(*(key.desc() for key in keys))
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def split_page(rows: List[Any], limit: Optional[int]) -> Tuple[List[Any], Optional[str]]:
+    """Trim the look-ahead row and build the cursor for the next page"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]._mapping
+    values = [last[key] for key in last.keys() if str(key).startswith(CURSOR_LABEL)]
+    return page, encode_cursor(values)
+
+
+def page_response(items: List[Any], next_cursor: Optional[str], cursor: Optional[str]):
+    """Envelope for cursor requests, plain list for legacy callers"""
+    if cursor is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,184 @@
+"""
+Monthly range partitioning for append-only tables (traffic_logs, inventory_ledger).
+
+Both tables are partitioned by RANGE (created_at) with one partition per
+calendar month (UTC), named `<table>_pYYYYMM`. ensure_all_partitions() runs at
+startup and maintain_partitions() daily from the scheduler:
+
+* creates partitions for the current month and PARTITION_MONTHS_AHEAD months
+  ahead, so inserts never hit a missing range;
+* detaches partitions older than the table's retention, exports them to
+  gzip CSV files under PARTITION_ARCHIVE_DIR, then drops them.
+
+Existing unpartitioned tables are converted with migrate_partitions.py.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_ARCHIVE_DIR = os.getenv(
+    "PARTITION_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "archives")
+)
+
+# Table -> months of history kept online
+PARTITIONED_TABLES: Dict[str, int] = {
+    "traffic_logs": int(os.getenv("TRAFFIC_RETENTION_MONTHS", "6")),
+    "inventory_ledger": int(os.getenv("INVENTORY_LEDGER_RETENTION_MONTHS", "24")),
+}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+def _partition_re(table: str):
+    return re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+
+
+async def create_month_partition(conn, table: str, month: date):
+    """Create the partition holding `month` if it does not exist yet"""
+    await conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(table, month)}
+        PARTITION OF {table}
+        FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')
+    """))
+
+
+async def ensure_partitions(conn, table: str, first_month: date = None, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Create monthly partitions from `first_month` (default: this month) through months_ahead"""
+    current = month_start(datetime.now(timezone.utc).date())
+    month = first_month or current
+    last = add_months(current, months_ahead)
+    while month <= last:
+        await create_month_partition(conn, table, month)
+        month = add_months(month, 1)
+
+
+async def list_partitions(conn, table: str) -> List[date]:
+    """Months of the managed partitions currently attached to `table`, oldest first"""
+    result = await conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table})
+    pattern = _partition_re(table)
+    months = []
+    for (name,) in result.all():
+        match = pattern.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    result = await conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :table
+    """), {"table": table})
+    return result.first() is not None
+
+
+async def export_table_gzip(conn, table: str, path: str):
+    """Stream a table out with COPY into a gzip CSV file"""
+    raw = await conn.get_raw_connection()
+    tmp_path = f"{path}.part"
+    with gzip.open(tmp_path, "wb") as archive:
+        async def write_chunk(chunk: bytes):
+            await asyncio.to_thread(archive.write, chunk)
+
+        await raw.driver_connection.copy_from_table(table, output=write_chunk, format="csv", header=True)
+    os.replace(tmp_path, path)
+
+
+async def archive_old_partitions(table: str, retention_months: int) -> List[str]:
+    """Detach, export and drop partitions entirely older than the retention window"""
+    cutoff = add_months(month_start(datetime.now(timezone.utc).date()), -retention_months)
+    os.makedirs(PARTITION_ARCHIVE_DIR, exist_ok=True)
+    archived = []
+
+    async with engine.connect() as conn:
+        months = await list_partitions(conn, table)
+
+    for month in months:
+        if month >= cutoff:
+            break
+        name = partition_name(table, month)
+        path = os.path.join(PARTITION_ARCHIVE_DIR, f"{name}.csv.gz")
+        async with engine.begin() as conn:
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        # Detached partitions are plain tables: export, then drop once the file is complete
+        async with engine.begin() as conn:
+            await export_table_gzip(conn, name, path)
+            await conn.execute(text(f"DROP TABLE {name}"))
+        archived.append(path)
+        logger.info(f"Archived partition {name} to {path}")
+
+    return archived
+
+
+async def archive_detached_leftovers(table: str):
+    """Export and drop partitions detached by a run that failed before dropping them"""
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT c.relname FROM pg_class c
+            WHERE c.relkind = 'r' AND c.relname ~ :pattern
+              AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+        """), {"pattern": f"^{table}_p[0-9]{{6}}$"})
+        leftovers = [name for (name,) in result.all()]
+
+    for name in leftovers:
+        path = os.path.join(PARTITION_ARCHIVE_DIR, f"{name}.csv.gz")
+        async with engine.begin() as conn:
+            await export_table_gzip(conn, name, path)
+            await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"Archived previously detached partition {name} to {path}")
+
+
+async def ensure_all_partitions():
+    """Startup hook: make sure every partitioned table can accept inserts"""
+    async with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            if await is_partitioned(conn, table):
+                await ensure_partitions(conn, table)
+            else:
+                logger.warning(f"{table} is not partitioned yet; run migrate_partitions.py")
+
+
+async def maintain_partitions():
+    """Create upcoming partitions and apply retention for every partitioned table"""
+    for table, retention_months in PARTITIONED_TABLES.items():
+        try:
+            async with engine.begin() as conn:
+                if not await is_partitioned(conn, table):
+                    logger.warning(f"{table} is not partitioned yet; run migrate_partitions.py")
+                    continue
+                await ensure_partitions(conn, table)
+            os.makedirs(PARTITION_ARCHIVE_DIR, exist_ok=True)
+            await archive_detached_leftovers(table)
+            await archive_old_partitions(table, retention_months)
+        except Exception as e:
+            logger.error(f"Partition maintenance failed for {table}: {e}")
@@ -0,0 +1,377 @@
+"""
+Product CSV export and import (GET /api/admin/products/export, POST .../import).
+
+The export is an async generator: it reads plain columns (no ORM objects)
+through a server-side cursor, EXPORT_BATCH_SIZE rows at a time, and yields
+each batch as a CSV chunk (optionally gzip-compressed) as soon as it is
+formatted. Memory stays at one batch regardless of catalogue size, and the
+first bytes reach the client before the query has finished.
+
+The import reads the uploaded file incrementally, validates each row and
+upserts batches with INSERT ... ON CONFLICT (sku) DO UPDATE, committing
+per batch. Existing products keep their id (and so their reviews,
+reservations and ledger rows). Rows that fail validation or the upsert are
+reported individually and never block the rest of the file.
+
+The column headers match the import format, so an export can be edited and
+re-imported as is.
+"""
+import asyncio
+import csv
+import io
+import itertools
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError
+
+from database import async_session_maker
+from db_models import ProductDB
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+# ~30 bind parameters per row: 1000 rows stays well under asyncpg's 32767 limit
+MAX_IMPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = min(int(os.getenv("PRODUCT_IMPORT_BATCH_SIZE", "500")), MAX_IMPORT_BATCH_SIZE)
+MAX_REPORTED_ERRORS = 1000
+REQUIRED_IMPORT_HEADERS = ('name', 'sellingPrice')
+
+# CSV header -> ProductDB column, in export order
+CSV_COLUMNS = [
+    ('sku', ProductDB.sku),
+    ('barcode', ProductDB.barcode),
+    ('hsnCode', ProductDB.hsn_code),
+    ('name', ProductDB.name),
+    ('description', ProductDB.description),
+    ('category', ProductDB.category),
+    ('subcategory', ProductDB.subcategory),
+    ('tags', ProductDB.tags),
+    ('status', ProductDB.status),
+    ('metal', ProductDB.metal),
+    ('purity', ProductDB.purity),
+    ('grossWeight', ProductDB.gross_weight),
+    ('netWeight', ProductDB.net_weight),
+    ('stoneWeight', ProductDB.stone_weight),
+    ('stoneType', ProductDB.stone_type),
+    ('stoneQuality', ProductDB.stone_quality),
+    ('sellingPrice', ProductDB.selling_price),
+    ('netPrice', ProductDB.price),
+    ('costGold', ProductDB.cost_gold),
+    ('costStone', ProductDB.cost_stone),
+    ('costMaking', ProductDB.cost_making),
+    ('costOther', ProductDB.cost_other),
+    ('stockQuantity', ProductDB.stock_quantity),
+    ('lowStockThreshold', ProductDB.low_stock_threshold),
+]
+CSV_HEADERS = [header for header, _ in CSV_COLUMNS]
+
+
+def _number(value) -> float:
+    return float(value) if value else 0.0
+
+
+def format_export_row(row) -> list:
+    """One product row (in CSV_COLUMNS order) as CSV values"""
+    (sku, barcode, hsn_code, name, description, category, subcategory, tags, status, metal, purity,
+     gross_weight, net_weight, stone_weight, stone_type, stone_quality, selling_price, price,
+     cost_gold, cost_stone, cost_making, cost_other, stock_quantity, low_stock_threshold) = row
+    return [
+        sku, barcode, hsn_code, name, description, category, subcategory,
+        ",".join(tags) if tags else "",
+        status, metal, purity,
+        _number(gross_weight), _number(net_weight), _number(stone_weight),
+        stone_type, stone_quality,
+        _number(selling_price),
+        float(price) if price else _number(selling_price),
+        _number(cost_gold), _number(cost_stone), _number(cost_making), _number(cost_other),
+        stock_quantity, low_stock_threshold,
+    ]
+
+
+def export_query(category: Optional[str] = None, status: Optional[str] = None,
+                 updated_since: Optional[datetime] = None):
+    stmt = select(*[column for _, column in CSV_COLUMNS])
+    if category:
+        stmt = stmt.where(ProductDB.category == category)
+    if status:
+        stmt = stmt.where(ProductDB.status == status)
+    if updated_since:
+        stmt = stmt.where(ProductDB.updated_at >= updated_since)
+    return stmt.order_by(ProductDB.created_at.desc(), ProductDB.id.desc())
+
+
+async def stream_products_csv(category: Optional[str] = None, status: Optional[str] = None,
+                              updated_since: Optional[datetime] = None,
+                              compress: bool = False) -> AsyncIterator[bytes]:
+    """Yield the export as CSV (or gzip) chunks, one per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 writes a gzip container rather than a raw zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def take_chunk() -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(CSV_HEADERS)
+    # The request's session is closed before a StreamingResponse body runs, so use our own
+    async with async_session_maker() as db:
+        result = await db.stream(
+            export_query(category, status, updated_since)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            writer.writerows(format_export_row(row) for row in rows)
+            chunk = take_chunk()
+            if chunk:
+                yield chunk
+
+    chunk = take_chunk()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(compress: bool) -> str:
+    return f"products_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv{'.gz' if compress else ''}"
+
+
+# ---------- Import ----------
+
+class RowError(ValueError):
+    pass
+
+
+def _parse_number(row: dict, header: str, default, cast=float):
+    raw = row.get(header)
+    if raw is None or not str(raw).strip():
+        return default
+    try:
+        value = float(str(raw).replace(',', '').strip())
+    except ValueError:
+        raise RowError(f"{header} is not a number: {raw!r}")
+    return cast(value)
+
+
+def _text(row: dict, header: str, default: Optional[str] = None) -> Optional[str]:
+    value = (row.get(header) or "").strip()
+    return value or default
+
+
+def generate_barcode() -> str:
+    return f"{uuid.uuid4().int % 10**13:013d}"
+
+
+def parse_import_row(row: dict) -> dict:
+    """Validated ProductDB values for one CSV row (raises RowError)"""
+    name = _text(row, 'name')
+    if not name:
+        raise RowError("name is required")
+    category = _text(row, 'category')
+    if not category:
+        raise RowError("category is required")
+    selling_price = _parse_number(row, 'sellingPrice', None)
+    if selling_price is None:
+        raise RowError("sellingPrice is required")
+    if selling_price < 0:
+        raise RowError("sellingPrice cannot be negative")
+    stock_quantity = _parse_number(row, 'stockQuantity', 0, int)
+    if stock_quantity < 0:
+        raise RowError("stockQuantity cannot be negative")
+    barcode = _text(row, 'barcode')
+    if barcode and len(barcode) > 13:
+        raise RowError("barcode must be at most 13 characters")
+    sku = _text(row, 'sku') or f"SKU-{uuid.uuid4().hex[:8].upper()}"
+    if len(sku) > 50:
+        raise RowError("sku must be at most 50 characters")
+
+    cost_gold = _parse_number(row, 'costGold', 0.0)
+    cost_stone = _parse_number(row, 'costStone', 0.0)
+    cost_making = _parse_number(row, 'costMaking', 0.0)
+    cost_other = _parse_number(row, 'costOther', 0.0)
+    total_cost = cost_gold + cost_stone + cost_making + cost_other
+    profit_margin = 0
+    margin_percent = 0
+    if selling_price > 0:
+        profit_margin = selling_price - total_cost
+        margin_percent = (profit_margin / selling_price) * 100
+
+    tags = _text(row, 'tags')
+    return {
+        "id": uuid.uuid4(),  # only used when the sku is new
+        "sku": sku,
+        "barcode": barcode,
+        "hsn_code": _text(row, 'hsnCode', '7113'),
+        "name": name,
+        "description": row.get('description'),
+        "category": category,
+        "subcategory": _text(row, 'subcategory'),
+        "tags": [t.strip() for t in tags.split(',') if t.strip()] if tags else [],
+        "status": _text(row, 'status', 'active'),
+        "metal": _text(row, 'metal'),
+        "purity": _text(row, 'purity'),
+        "gross_weight": _parse_number(row, 'grossWeight', 0.0),
+        "net_weight": _parse_number(row, 'netWeight', 0.0),
+        "stone_weight": _parse_number(row, 'stoneWeight', 0.0),
+        "stone_type": _text(row, 'stoneType'),
+        "stone_quality": _text(row, 'stoneQuality'),
+        "selling_price": selling_price,
+        "price": _parse_number(row, 'netPrice', 0.0) or selling_price,
+        "cost_gold": cost_gold,
+        "cost_stone": cost_stone,
+        "cost_making": cost_making,
+        "cost_other": cost_other,
+        "total_cost": total_cost,
+        "profit_margin": profit_margin,
+        "margin_percent": margin_percent,
+        "stock_quantity": stock_quantity,
+        "low_stock_threshold": _parse_number(row, 'lowStockThreshold', 2, int),
+        "track_inventory": True,
+        "in_stock": stock_quantity > 0,
+    }
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+
+    def add_error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row_number}: {message}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+# Columns only set when a product is created; an import never changes these on update
+INSERT_ONLY_COLUMNS = {"id", "sku", "track_inventory"}
+
+
+async def _upsert(db, values: List[dict]) -> List[bool]:
+    """Upsert rows by sku; returns, per row, whether it was inserted (vs updated)"""
+    inserted: List[bool] = []
+    # Rows without a barcode get a generated one, but must not replace an existing product's
+    with_barcode = [v for v in values if v["barcode"]]
+    without_barcode = [{**v, "barcode": generate_barcode()} for v in values if not v["barcode"]]
+    for group, keep_barcode in ((with_barcode, False), (without_barcode, True)):
+        if not group:
+            continue
+        stmt = pg_insert(ProductDB).values(group)
+        set_ = {
+            column: stmt.excluded[column] for column in group[0]
+            if column not in INSERT_ONLY_COLUMNS and not (keep_barcode and column == "barcode")
+        }
+        set_["updated_at"] = func.now()
+        result = await db.execute(
+            stmt.on_conflict_do_update(index_elements=["sku"], set_=set_)
+            # xmax is 0 only for freshly inserted row versions
+            .returning(literal_column("xmax = 0"))
+        )
+        inserted.extend(flag for (flag,) in result.all())
+    return inserted
+
+
+def _db_error_message(error: DBAPIError) -> str:
+    return str(getattr(error, "orig", error)).strip().splitlines()[0]
+
+
+async def _write_batch(db, batch: List[Tuple[int, dict]], report: ImportReport):
+    """Upsert a batch; if it fails, retry row by row so only the bad rows are rejected"""
+    try:
+        async with db.begin_nested():
+            flags = await _upsert(db, [values for _, values in batch])
+    except DBAPIError:
+        flags = []
+        for row_number, values in batch:
+            try:
+                async with db.begin_nested():
+                    flags.extend(await _upsert(db, [values]))
+            except DBAPIError as e:
+                report.add_error(row_number, _db_error_message(e))
+    inserted = sum(1 for flag in flags if flag)
+    report.inserted += inserted
+    report.updated += len(flags) - inserted
+
+
+def _is_blank(row: dict) -> bool:
+    return not any(v for v in row.values() if isinstance(v, str) and v.strip())
+
+
+async def import_products_csv(path: str, batch_size: int = IMPORT_BATCH_SIZE,
+                              on_progress: Optional[Callable[[ImportReport, int, int], Awaitable]] = None
+                              ) -> ImportReport:
+    """
+    Upsert products from a CSV file, `batch_size` rows per statement and commit.
+    on_progress(report, bytes_read, file_size) is awaited after every batch.
+    """
+    batch_size = max(1, min(batch_size, MAX_IMPORT_BATCH_SIZE))
+    report = ImportReport()
+    file_size = os.path.getsize(path)
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        headers = await asyncio.to_thread(lambda: reader.fieldnames) or []
+        missing = [h for h in REQUIRED_IMPORT_HEADERS if h not in headers]
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+        async with async_session_maker() as db:
+            row_number = 1  # the header is row 1, as in a spreadsheet
+            while True:
+                rows = await asyncio.to_thread(lambda: list(itertools.islice(reader, batch_size)))
+                if not rows:
+                    break
+
+                # One statement cannot update the same sku twice, so a repeated sku starts a new batch
+                pending: Dict[str, Tuple[int, dict]] = {}
+                for row in rows:
+                    row_number += 1
+                    report.rows += 1
+                    if _is_blank(row):
+                        report.skipped += 1
+                        continue
+                    try:
+                        values = parse_import_row(row)
+                    except RowError as e:
+                        report.add_error(row_number, str(e))
+                        continue
+                    if values["sku"] in pending:
+                        await _write_batch(db, list(pending.values()), report)
+                        pending = {}
+                    pending[values["sku"]] = (row_number, values)
+                if pending:
+                    await _write_batch(db, list(pending.values()), report)
+                await db.commit()
+
+                if on_progress:
+                    await on_progress(report, f.buffer.tell(), file_size)
+
+    logger.info(
+        f"Product import: {report.rows} rows, {report.inserted} inserted, "
+        f"{report.updated} updated, {report.failed} failed, {report.skipped} skipped"
+    )
+    return report
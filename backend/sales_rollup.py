@@ -0,0 +1,235 @@
+"""
+Daily sales rollup (`sales_daily`) behind the dashboard and sales analytics.
+
+One row per (IST day, channel, payment_status) holding order counts, status
+counts and sales/profit sums. Order writes call refresh_sales_for_orders()
+right before committing, which recomputes the affected days from `orders`
+in a single upsert, so the rollup stays exact without tracking deltas.
+Each day is recomputed under a transaction-level advisory lock: a second
+writer for the same day waits for the first to commit, and its recompute
+then sees that order too (READ COMMITTED takes a fresh snapshot per
+statement). Cached dashboard responses are dropped once the write commits.
+Readers go through sales_source(), which serves closed days from the rollup
+and the current IST day live from `orders`.
+
+Rebuild from scratch (or from a given day) with:
+    python sales_rollup.py [--since YYYY-MM-DD]
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional, Tuple
+
+import pytz
+from sqlalchemy import Date, case, cast, event, false, func, inspect, literal, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import dashboard_cache
+from db_models import OrderDB, SalesDailyDB
+
+IST = pytz.timezone('Asia/Kolkata')
+
+# Advisory lock namespace (first key of pg_advisory_xact_lock(int, int)); the second key is the day
+SALES_DAY_LOCK = 5731
+
+# Rollup keys cannot be NULL, so missing values are bucketed
+UNKNOWN_CHANNEL = 'unknown'
+UNKNOWN_PAYMENT_STATUS = 'pending'
+
+_ROLLUP_COLUMNS_SQL = """
+    COALESCE(channel, 'unknown') AS channel,
+    COALESCE(payment_status, 'pending') AS payment_status,
+    count(*) AS order_count,
+    count(*) FILTER (WHERE status = 'pending') AS pending_count,
+    count(*) FILTER (WHERE status = 'delivered') AS delivered_count,
+    count(*) FILTER (WHERE status = 'returned') AS returned_count,
+    COALESCE(sum(grand_total), 0) AS gross_sales,
+    COALESCE(sum(gross_profit), 0) AS gross_profit
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO sales_daily (day, channel, payment_status, order_count, pending_count,
+                             delivered_count, returned_count, gross_sales, gross_profit, updated_at)
+    SELECT day, channel, payment_status, order_count, pending_count,
+           delivered_count, returned_count, gross_sales, gross_profit, now()
+    FROM fresh
+    ON CONFLICT (day, channel, payment_status) DO UPDATE SET
+        order_count = EXCLUDED.order_count,
+        pending_count = EXCLUDED.pending_count,
+        delivered_count = EXCLUDED.delivered_count,
+        returned_count = EXCLUDED.returned_count,
+        gross_sales = EXCLUDED.gross_sales,
+        gross_profit = EXCLUDED.gross_profit,
+        updated_at = now()
+"""
+
+# Recompute one IST day; groups that no longer have orders are removed
+_REFRESH_DAY_SQL = text(f"""
+    WITH fresh AS (
+        SELECT CAST(:day AS date) AS day, {_ROLLUP_COLUMNS_SQL}
+        FROM orders
+        WHERE created_at >= :day_start AND created_at < :day_end
+        GROUP BY 2, 3
+    ), removed AS (
+        DELETE FROM sales_daily s
+        WHERE s.day = :day
+          AND NOT EXISTS (
+              SELECT 1 FROM fresh f
+              WHERE f.channel = s.channel AND f.payment_status = s.payment_status
+          )
+    )
+    {_UPSERT_SQL}
+""")
+
+_REBUILD_SQL = text(f"""
+    WITH fresh AS (
+        SELECT (created_at AT TIME ZONE 'Asia/Kolkata')::date AS day, {_ROLLUP_COLUMNS_SQL}
+        FROM orders
+        WHERE created_at >= :since
+        GROUP BY 1, 2, 3
+    )
+    {_UPSERT_SQL}
+""")
+
+
+def ist_today() -> date:
+    return datetime.now(IST).date()
+
+
+def ist_day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """UTC-aware [start, end) of an IST calendar day"""
+    start = IST.localize(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+PERIOD_DAYS = {"7d": 7, "30d": 30, "90d": 90}
+
+
+def resolve_period(period: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   default_days: int = 7) -> Tuple[date, date]:
+    """Inclusive IST day range for a dashboard period ('today', '7d', ..., 'custom')"""
+    today = ist_today()
+    if period == 'custom' and start_date and end_date:
+        try:
+            return date.fromisoformat(start_date[:10]), date.fromisoformat(end_date[:10])
+        except ValueError:
+            pass  # fall back to the default window
+    if period == 'today':
+        return today, today
+    days = PERIOD_DAYS.get(period, default_days)
+    return today - timedelta(days=days - 1), today
+
+
+def order_ist_day(order: OrderDB) -> date:
+    """IST day an order is counted under"""
+    # New orders have no created_at yet, or it is expired after their INSERT (server default)
+    if "created_at" in inspect(order).unloaded or order.created_at is None:
+        return ist_today()
+    return order.created_at.astimezone(IST).date()
+
+
+async def refresh_sales_days(db: AsyncSession, days: Iterable[date]):
+    """
+    Recompute the rollup rows for the given IST days in the current transaction.
+    The day locks are held until commit, so call this as the last step before it.
+    """
+    days = sorted(set(days))  # a fixed lock order, so two writers cannot deadlock
+    await db.flush()
+    for day in days:
+        await db.execute(text("SELECT pg_advisory_xact_lock(:namespace, :day)"),
+                         {"namespace": SALES_DAY_LOCK, "day": day.toordinal()})
+        day_start, day_end = ist_day_bounds(day)
+        await db.execute(_REFRESH_DAY_SQL, {"day": day, "day_start": day_start, "day_end": day_end})
+
+
+async def refresh_sales_for_orders(db: AsyncSession, *orders: OrderDB):
+    """Call after creating an order or changing its status/payment/totals, right before commit"""
+    await refresh_sales_days(db, [order_ist_day(o) for o in orders if o is not None])
+    event.listen(db.sync_session, "after_commit", lambda session: dashboard_cache.clear(), once=True)
+
+
+def _channel_filter(column, channel: Optional[str]):
+    if channel == 'online':
+        return column == 'online'
+    # pos / main store
+    return column != 'online'
+
+
+def sales_source(start_day: date, end_day: date, channel: Optional[str] = None):
+    """
+    Subquery with the rollup's columns for IST days [start_day, end_day].
+    Days before today come from sales_daily; today is aggregated live from
+    orders so the figures never lag behind the last write.
+    """
+    today = ist_today()
+    parts = []
+
+    if start_day < today:
+        closed = select(
+            SalesDailyDB.day,
+            SalesDailyDB.channel,
+            SalesDailyDB.payment_status,
+            SalesDailyDB.order_count,
+            SalesDailyDB.pending_count,
+            SalesDailyDB.delivered_count,
+            SalesDailyDB.returned_count,
+            SalesDailyDB.gross_sales,
+            SalesDailyDB.gross_profit
+        ).where(SalesDailyDB.day >= start_day, SalesDailyDB.day <= min(end_day, today - timedelta(days=1)))
+        if channel:
+            closed = closed.where(_channel_filter(SalesDailyDB.channel, channel))
+        parts.append(closed)
+
+    if end_day >= today:
+        today_start, today_end = ist_day_bounds(today)
+        channel_key = func.coalesce(OrderDB.channel, UNKNOWN_CHANNEL)
+        payment_key = func.coalesce(OrderDB.payment_status, UNKNOWN_PAYMENT_STATUS)
+        live = select(
+            cast(literal(today), Date).label('day'),
+            channel_key.label('channel'),
+            payment_key.label('payment_status'),
+            func.count().label('order_count'),
+            func.count().filter(OrderDB.status == 'pending').label('pending_count'),
+            func.count().filter(OrderDB.status == 'delivered').label('delivered_count'),
+            func.count().filter(OrderDB.status == 'returned').label('returned_count'),
+            func.coalesce(func.sum(OrderDB.grand_total), 0).label('gross_sales'),
+            func.coalesce(func.sum(OrderDB.gross_profit), 0).label('gross_profit')
+        ).where(
+            OrderDB.created_at >= today_start, OrderDB.created_at < today_end
+        ).group_by(channel_key, payment_key)
+        if channel:
+            live = live.where(_channel_filter(channel_key, channel))
+        parts.append(live)
+
+    if not parts:
+        # Range entirely in the future: keep the column shape, return nothing
+        parts.append(select(SalesDailyDB).where(false()))
+
+    return (union_all(*parts) if len(parts) > 1 else parts[0]).subquery('sales')
+
+
+def paid(source, column):
+    """Sum of a rollup measure restricted to paid orders"""
+    return func.coalesce(func.sum(case((source.c.payment_status == 'paid', column), else_=0)), 0)
+
+
+async def rebuild_sales_daily(since: Optional[date] = None):
+    """Recompute the rollup for every day since `since` (all history by default)"""
+    from database import engine
+
+    since_utc = ist_day_bounds(since)[0] if since else datetime(1970, 1, 1, tzinfo=pytz.utc)
+    async with engine.begin() as conn:
+        await conn.run_sync(SalesDailyDB.__table__.create, checkfirst=True)
+        if since:
+            await conn.execute(text("DELETE FROM sales_daily WHERE day >= :since"), {"since": since})
+        else:
+            await conn.execute(text("DELETE FROM sales_daily"))
+        result = await conn.execute(_REBUILD_SQL, {"since": since_utc})
+        print(f"✅ sales_daily rebuilt: {result.rowcount} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the sales_daily rollup from orders")
+    parser.add_argument("--since", type=date.fromisoformat, help="First IST day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+    asyncio.run(rebuild_sales_daily(args.since))
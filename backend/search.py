@@ -0,0 +1,61 @@
+"""
+Product search built on the weighted `products.search_vector` tsvector.
+
+Free-text terms become a prefix tsquery (so typeahead matches partial words),
+ranked with ts_rank_cd. Exact SKU / barcode hits are always included and
+sorted first, even when the term produces no usable lexemes.
+"""
+import re
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, func, literal, or_
+
+from db_models import ProductDB, PRODUCT_SEARCH_CONFIG
+
+# Guard against pathological queries from the search box
+MAX_SEARCH_TERMS = 8
+MAX_TERM_LENGTH = 50
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+class ProductSearch(NamedTuple):
+    filter: object       # WHERE clause
+    exact_hit: object    # 1 for exact SKU/barcode matches, else 0
+    rank: object         # relevance score (0 when there is no text query)
+
+
+def build_prefix_tsquery(term: str) -> Optional[str]:
+    """Turn raw user input into a safe `a:* & b:*` tsquery string"""
+    tokens = [t[:MAX_TERM_LENGTH] for t in _TOKEN_RE.findall(term.lower())]
+    if not tokens:
+        return None
+    return " & ".join(f"{t}:*" for t in tokens[:MAX_SEARCH_TERMS])
+
+
+def product_search(term: str) -> ProductSearch:
+    """Build filter and ordering expressions for a storefront/admin search"""
+    term = term.strip()
+    exact = or_(
+        func.upper(ProductDB.sku) == term.upper(),
+        ProductDB.barcode == term
+    )
+    exact_hit = case((exact, 1), else_=0)
+
+    tsquery = build_prefix_tsquery(term)
+    if tsquery is None:
+        return ProductSearch(filter=exact, exact_hit=exact_hit, rank=literal(0.0))
+
+    query = func.to_tsquery(PRODUCT_SEARCH_CONFIG, tsquery)
+    matches = ProductDB.search_vector.op("@@")(query)
+    return ProductSearch(
+        filter=or_(matches, exact),
+        exact_hit=exact_hit,
+        rank=func.ts_rank_cd(ProductDB.search_vector, query)
+    )
+
+
+def apply_product_search(stmt, term: str):
+    """Filter a select() on products by `term`, best matches first"""
+    search = product_search(term)
+    return stmt.where(search.filter).order_by(search.exact_hit.desc(), search.rank.desc())
@@ -3,14 +3,14 @@ Annya Jewellers E-commerce Backend - Clean PostgreSQL Version
 Built from scratch with modern FastAPI and SQLAlchemy
 """
 from fastapi import FastAPI, Depends, HTTPException, status, Body, Query, APIRouter, UploadFile, File, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm, HTTPBearer, HTTPAuthorizationCredentials
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, selectinload
 from sqlalchemy.future import select
-from sqlalchemy import text, func, update, delete, or_, and_, cast, String
+from sqlalchemy import text, func, update, delete, and_, cast, literal_column, String, Date, true
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Union, Dict, Any
@@ -22,9 +22,6 @@ import logging
 import asyncio
 import shutil # For file operations
 import hashlib # Add hashlib import
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from fastapi import BackgroundTasks
 from dotenv import load_dotenv
 
@@ -34,7 +31,26 @@ load_dotenv(env_path)
 
 # Import models
 from database import get_db, create_tables
-from db_models import UserDB, OrderDB, ProductDB, VendorDB, CouponDB, LocationDB, TransferDB, InventoryLedgerDB, PurchaseOrderDB, ReviewDB, ReturnRequestDB, AbandonedCartDB, ProductReservationDB, AdminSettingsDB
+from db_models import UserDB, OrderDB, OrderLineDB, ProductDB, TrafficDailyDB, VendorDB, CouponDB, LocationDB, TransferDB, InventoryLedgerDB, PurchaseOrderDB, ReviewDB, ReturnRequestDB, AbandonedCartDB, ProductReservationDB, AdminSettingsDB
+from search import apply_product_search, product_search
+from sales_rollup import sales_source, paid, resolve_period, ist_today, ist_day_bounds, refresh_sales_for_orders
+from cache import dashboard_cache, catalog_cache
+from http_cache import catalog_cache_headers, versioned_headers, is_not_modified, SITEMAP_CACHE_CONTROL
+from traffic import traffic_ingestor, SOURCES
+from templates import load_templates, render
+from cart_reminders import reminder_engine, is_due
+from mailer import enqueue_email, mail_worker, requeue_dead_emails, KIND_OTP, PRIORITY_OTP
+from partitions import ensure_all_partitions, maintain_partitions
+from sitemap import sitemap_cache
+from product_csv import stream_products_csv, export_filename, import_products_csv, IMPORT_BATCH_SIZE, MAX_IMPORT_BATCH_SIZE
+from jobs import job_registry
+from uploads import upload_image, upload_images, add_to_gallery, MAX_FILES_PER_UPLOAD, UPLOAD_TARGET, UPLOAD_LOCAL_DIR, UPLOAD_LOCAL_BASE_URL
+from shipping import build_shipment_order_data, shipment_blocker, claim_for_shipment, complete_shipment, bulk_ship_orders, MAX_BULK_SHIP_ORDERS
+from serviceability import serviceability_cache, warm_serviceability_cache, SERVICEABILITY_WARM_INTERVAL_HOURS
+from bulk_load import bulk_load_products
+from navigation import navigation_cache, load_navigation_config, NAVIGATION_FILE
+from traffic_rollup import roll_up_traffic, merged_visitors, ROLLUP_INTERVAL_MINUTES
+from pagination import keyset_paginate, split_page, page_response, resolve_page_limit, MAX_PAGE_SIZE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -64,143 +80,79 @@ app = FastAPI()
 
 # Initialize Database on Startup
 import cloudinary
-import cloudinary.uploader
 
 # Background Scheduler for Automatic Abandoned Cart Emails
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from job_leases import JobCoordinator
 
 # Global settings are now stored in DB (AdminSettingsDB)
 
 scheduler = AsyncIOScheduler()
+# Every periodic job registers here so only one worker runs it (see job_leases.py)
+job_coordinator = JobCoordinator(scheduler)
 
 async def send_automatic_abandoned_cart_emails():
     """
     Background task that runs every 5 minutes.
-    Sends reminder emails to carts abandoned based on configured timing.
+    Queues due abandoned-cart reminders (see cart_reminders.py).
     """
-    from database import async_session_maker
-    from datetime import timedelta
-    
-    async with async_session_maker() as db:
-        try:
-            # 1. Fetch configurable timing from DB
-            settings_res = await db.execute(
-                select(AdminSettingsDB).where(AdminSettingsDB.key == "abandoned_cart_minutes")
-            )
-            setting_row = settings_res.scalar_one_or_none()
-            minutes = int(setting_row.value) if setting_row else 5  # Default 5 (User Preference)
-            
-            cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-            
-            result = await db.execute(
-                select(AbandonedCartDB)
-                .where(
-                    AbandonedCartDB.status == 'active',
-                    AbandonedCartDB.updated_at < cutoff,
-                    AbandonedCartDB.reminder_count < 3
-                )
-                .limit(20)  # Process 20 at a time
-            )
-            carts = result.scalars().all()
-            logger.info(f"Abandoned cart scheduler: {len(carts)} eligible carts found (cutoff {minutes} mins)")
-            
-            for cart in carts:
-                try:
-                    # Build email content
-                    items_html = ""
-                    for item in (cart.items or [])[:5]:  # Max 5 items
-                        items_html += f"""
-                        <tr>
-                            <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                                <img src="{item.get('image', '')}" width="50" height="50" style="border-radius: 4px;" />
-                            </td>
-                            <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                                {item.get('name', 'Product')}
-                            </td>
-                            <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">
-                                ₹{item.get('price', 0):,.0f}
-                            </td>
-                        </tr>
-                        """
-                    
-                    email_body = f"""
-                    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; background: #fafafa;">
-                        <div style="background: white; border-radius: 12px; padding: 30px; box-shadow: 0 2px 10px rgba(0,0,0,0.05);">
-                            <h1 style="color: #c4ad94; text-align: center; margin-bottom: 20px;">✨ You left something beautiful behind!</h1>
-                            
-                            <p style="color: #333;">Hi {cart.customer_name or 'there'},</p>
-                            
-                            <p style="color: #666;">We noticed you left some gorgeous pieces in your cart. They're waiting for you!</p>
-                            
-                            <table style="width: 100%; margin: 20px 0; background: #f9f9f9; border-radius: 8px;">
-                                {items_html}
-                            </table>
-                            
-                            <p style="text-align: center; font-size: 20px; color: #333;">
-                                <strong>Cart Total: ₹{float(cart.cart_total):,.0f}</strong>
-                            </p>
-                            
-                            <div style="text-align: center; margin: 30px 0;">
-                                <a href="https://annyajewellers.com/cart" 
-                                   style="background: linear-gradient(135deg, #c4ad94, #a89070); color: white; 
-                                          padding: 16px 40px; text-decoration: none; border-radius: 30px; 
-                                          font-weight: bold; display: inline-block; box-shadow: 0 4px 15px rgba(196,173,148,0.4);">
-                                    Complete Your Purchase →
-                                </a>
-                            </div>
-                            
-                            <p style="color: #888; font-size: 13px; text-align: center;">
-                                Questions? Reply to this email or call +91 9100496169
-                            </p>
-                        </div>
-                        
-                        <p style="color: #999; font-size: 11px; text-align: center; margin-top: 20px;">
-                            Annya Jewellers | Hyderabad, India<br/>
-                            <a href="https://annyajewellers.com" style="color: #c4ad94;">www.annyajewellers.com</a>
-                        </p>
-                    </div>
-                    """
-                    
-                    # Send email
-                    sent = await send_email_via_vercel(
-                        to_email=cart.email,
-                        subject="✨ Your cart is waiting for you - Annya Jewellers",
-                        body=email_body
-                    )
-                    if not sent:
-                        logger.error(f"Failed to send abandoned cart reminder to {cart.email}")
-                        continue
-                    
-                    # Update reminder tracking
-                    cart.reminder_count += 1
-                    cart.last_reminder_at = datetime.now(timezone.utc)
-                    logger.info(f"Sent abandoned cart reminder to {cart.email}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to send reminder to {cart.email}: {e}")
-            
-            await db.commit()
-            
-        except Exception as e:
-            import traceback
-            logger.error(f"Abandoned cart background task error: {e}")
-            logger.error(traceback.format_exc())
+    try:
+        await reminder_engine.send_due_reminders()
+    except Exception as e:
+        import traceback
+        logger.error(f"Abandoned cart background task error: {e}")
+        logger.error(traceback.format_exc())
 
 # Initialize Database on Startup
 @app.on_event("startup")
 async def startup_event():
     await create_tables()
+    await ensure_all_partitions()
+    load_templates()
     
     # Start background scheduler for abandoned cart emails
-    scheduler.add_job(
+    job_coordinator.add_job(
         send_automatic_abandoned_cart_emails,
         IntervalTrigger(minutes=5),
-        id="abandoned_cart_emails",
-        replace_existing=True
+        id="abandoned_cart_emails"
     )
+    # Fold new page views into the daily traffic rollup
+    job_coordinator.add_job(
+        roll_up_traffic,
+        IntervalTrigger(minutes=ROLLUP_INTERVAL_MINUTES),
+        id="traffic_rollup"
+    )
+    
+    # Monthly partitions for traffic_logs / inventory_ledger: create ahead, archive old
+    job_coordinator.add_job(
+        maintain_partitions,
+        IntervalTrigger(hours=24),
+        id="partition_maintenance"
+    )
+    # Keep serviceability answers for the busiest delivery pincodes warm
+    job_coordinator.add_job(
+        warm_serviceability_cache,
+        IntervalTrigger(hours=SERVICEABILITY_WARM_INTERVAL_HOURS),
+        id="serviceability_warmer"
+    )
+    await job_coordinator.start()
     scheduler.start()
-    logger.info("Started background scheduler for abandoned cart emails (every 5 minutes)")
+    logger.info(f"Started background scheduler; jobs owned by this worker: {job_coordinator.owned_jobs()}")
+    
+    traffic_ingestor.start()
+    mail_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Let another worker take over the scheduled jobs right away
+    scheduler.shutdown(wait=False)
+    await job_coordinator.stop()
+    # Write out page views still waiting in the ingestion queue
+    await traffic_ingestor.stop()
+    await mail_worker.stop()
+    from shiprocket_client import shiprocket
+    await shiprocket.aclose()
 
 # Cloudinary Configuration
 cloudinary.config( 
@@ -209,6 +161,12 @@ cloudinary.config(
   api_secret = os.getenv('CLOUDINARY_API_SECRET') 
 )
 
+# Local stand-in for Cloudinary (development/testing, see uploads.py)
+if UPLOAD_TARGET == "local":
+    from fastapi.staticfiles import StaticFiles
+    os.makedirs(UPLOAD_LOCAL_DIR, exist_ok=True)
+    app.mount(UPLOAD_LOCAL_BASE_URL, StaticFiles(directory=UPLOAD_LOCAL_DIR), name="uploads")
+
 # CORS Setup
 
 # CORS Setup
@@ -278,59 +236,6 @@ async def send_email(to_email: str, subject: str, body: str, is_html: bool = Fal
     """
     pass
 
-async def send_email_via_vercel(to_email: str, subject: str = None, body: str = None, otp: str = None, brand: str = "Annya Jewellers") -> bool:
-    """
-    Send email via SMTP (Zoho).
-    Returns True on success, False on failure.
-    """
-    smtp_email = os.environ.get("SMTP_EMAIL")
-    smtp_user = os.environ.get("SMTP_USER") # Some envs use this
-    smtp_sender = smtp_email or smtp_user
-    
-    smtp_password = os.environ.get("SMTP_PASSWORD")
-    # Correct key is SMTP_HOST (Zoho), fallback to SMTP_SERVER or default
-    smtp_server = os.environ.get("SMTP_HOST") or os.environ.get("SMTP_SERVER") or "smtp.gmail.com"
-    smtp_port = int(os.environ.get("SMTP_PORT", 465))
-    
-    if smtp_sender and smtp_password:
-        try:
-            msg = MIMEMultipart()
-            # Use SMTP_FROM_EMAIL if available for display name
-            from_header = os.environ.get("SMTP_FROM_EMAIL") or f"{brand} <{smtp_sender}>"
-            msg['From'] = from_header
-            msg['To'] = to_email
-            msg['Subject'] = subject or f"{brand} Notification"
-            
-            if otp:
-                body = f"<p>Your OTP is: <strong>{otp}</strong></p>" + (body or "")
-            
-            msg.attach(MIMEText(body or "", 'html'))
-            
-            # Run SMTP in threadpool
-            def send_sync():
-                # Use SMTP_SSL for 465, standard SMTP for others
-                if smtp_port == 465:
-                    with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-                        server.login(smtp_sender, smtp_password)
-                        server.send_message(msg)
-                else:
-                    with smtplib.SMTP(smtp_server, smtp_port) as server:
-                        server.starttls()
-                        server.login(smtp_sender, smtp_password)
-                        server.send_message(msg)
-
-            await asyncio.to_thread(send_sync)
-            logger.info(f"Email sent via SMTP to {to_email}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send SMTP email: {e}")
-            # Don't re-raise in background tasks usually, but for now we log it
-            # If this is critical (like OTP), the caller might need to know, but this function handles fallbacks.
-            return False
-
-    logger.error("No email configuration found. Checked SMTP_USER/SMTP_PASSWORD.")
-    return False
-
 # ============================================
 # AUTHENTICATION
 # ============================================
@@ -407,20 +312,51 @@ async def health_check(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(owner: UserDB = Depends(get_owner)):
+    """Hit/miss counters for the catalogue, dashboard and serviceability caches"""
+    return {
+        "catalog": await catalog_cache.stats(),
+        "dashboard": {"entries": len(dashboard_cache)},
+        "serviceability": serviceability_cache.stats()
+    }
+
+@api_router.get("/admin/scheduler/leases")
+async def get_scheduler_leases(owner: UserDB = Depends(get_owner)):
+    """Which worker owns each scheduled job, and when each last ran"""
+    return await job_coordinator.status()
+
 # ============================================
 # PRODUCT ENDPOINTS  
 # ============================================
 
+async def invalidate_catalog():
+    """Drop cached catalogue responses and the navigation menu (call after committing)"""
+    navigation_cache.invalidate()
+    await catalog_cache.invalidate()
+
 @api_router.get("/products")
 async def get_products(
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     subcategory: Optional[str] = None,
     search: Optional[str] = None,
     limit: int = Query(100, le=1000),
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all products with optional filtering"""
+    """Get all products with optional filtering (pass `cursor` for keyset pages)"""
+    headers = await catalog_cache_headers(request)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    cache_key = catalog_cache.key("products", category=category, subcategory=subcategory, search=search, limit=limit, offset=offset, cursor=cursor)
+    cached, generation = await catalog_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    
     query = select(ProductDB).where(ProductDB.status == 'active')
     
     if category:
@@ -429,20 +365,20 @@ async def get_products(
     if subcategory:
         query = query.where(ProductDB.subcategory == subcategory)
     
-    if search:
-        search_filter = or_(
-            ProductDB.name.ilike(f"%{search}%"),
-            ProductDB.description.ilike(f"%{search}%"),
-            ProductDB.category.ilike(f"%{search}%"),
-            ProductDB.sku.ilike(f"%{search}%")
-        )
-        query = query.where(search_filter)
+    keys = [ProductDB.created_at, ProductDB.id]
+    if search and search.strip():
+        match = product_search(search)
+        query = query.where(match.filter)
+        keys = [match.exact_hit, match.rank] + keys
     
-    query = query.limit(limit).offset(offset)
+    query = keyset_paginate(query, keys, cursor, limit)
+    if cursor is None:
+        query = query.offset(offset)
     result = await db.execute(query)
-    products = result.scalars().all()
+    rows, next_cursor = split_page(result.all(), limit)
+    products = [row[0] for row in rows]
     
-    return [{
+    payload = page_response([{
         "id": str(p.id),
         "sku": p.sku,
         "barcode": p.barcode,
@@ -455,6 +391,7 @@ async def get_products(
         "currency": p.currency,
         "image": p.image,
         "images": p.images or [],
+        "imageVariants": p.image_variants or {},
         "tags": p.tags or [],
         "inStock": p.stock_quantity > 0,
         "stockQuantity": p.stock_quantity,
@@ -462,18 +399,32 @@ async def get_products(
         "stoneType": p.stone_type,
         "certification": p.certification,
         "createdAt": p.created_at.isoformat() if p.created_at else None
-    } for p in products]
+    } for p in products], next_cursor, cursor)
+    await catalog_cache.set(cache_key, payload, generation)
+    return payload
 
 @api_router.get("/products/summary")
 async def get_products_summary(
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     subcategory: Optional[str] = None,
     search: Optional[str] = None,
     limit: int = Query(50, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """Get lightweight product list for faster UI renders"""
+    headers = await catalog_cache_headers(request)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    cache_key = catalog_cache.key("products/summary", category=category, subcategory=subcategory, search=search, limit=limit, offset=offset, cursor=cursor)
+    cached, generation = await catalog_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    
     query = select(
         ProductDB.id,
         ProductDB.name,
@@ -490,20 +441,19 @@ async def get_products_summary(
     if subcategory:
         query = query.where(ProductDB.subcategory == subcategory)
 
-    if search:
-        search_filter = or_(
-            ProductDB.name.ilike(f"%{search}%"),
-            ProductDB.description.ilike(f"%{search}%"),
-            ProductDB.category.ilike(f"%{search}%"),
-            ProductDB.sku.ilike(f"%{search}%")
-        )
-        query = query.where(search_filter)
+    keys = [ProductDB.created_at, ProductDB.id]
+    if search and search.strip():
+        match = product_search(search)
+        query = query.where(match.filter)
+        keys = [match.exact_hit, match.rank] + keys
 
-    query = query.limit(limit).offset(offset)
+    query = keyset_paginate(query, keys, cursor, limit)
+    if cursor is None:
+        query = query.offset(offset)
     result = await db.execute(query)
-    rows = result.all()
+    rows, next_cursor = split_page(result.all(), limit)
 
-    return [
+    payload = page_response([
         {
             "id": str(row.id),
             "name": row.name,
@@ -514,11 +464,52 @@ async def get_products_summary(
             "inStock": (row.stock_quantity or 0) > 0
         }
         for row in rows
+    ], next_cursor, cursor)
+    await catalog_cache.set(cache_key, payload, generation)
+    return payload
+
+@api_router.get("/products/suggest")
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, le=20),
+    db: AsyncSession = Depends(get_db)
+):
+    """Typeahead suggestions for the storefront search box"""
+    query = select(
+        ProductDB.id,
+        ProductDB.sku,
+        ProductDB.name,
+        ProductDB.category,
+        ProductDB.selling_price,
+        ProductDB.image
+    ).where(ProductDB.status == 'active')
+    query = apply_product_search(query, q).limit(limit)
+
+    result = await db.execute(query)
+    return [
+        {
+            "id": str(row.id),
+            "sku": row.sku,
+            "name": row.name,
+            "category": row.category,
+            "price": float(row.selling_price),
+            "image": row.image
+        }
+        for row in result.all()
     ]
 
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: str, db: AsyncSession = Depends(get_db)):
+async def get_product(product_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """Get single product by ID"""
+    headers = await catalog_cache_headers(request)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    cache_key = catalog_cache.key(f"products/{product_id}")
+    cached, generation = await catalog_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    
     result = await db.execute(
         select(ProductDB).where(ProductDB.id == product_id)
     )
@@ -527,7 +518,7 @@ async def get_product(product_id: str, db: AsyncSession = Depends(get_db)):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return {
+    payload = {
         "id": str(product.id),
         "sku": product.sku,
         "barcode": product.barcode,
@@ -542,6 +533,7 @@ async def get_product(product_id: str, db: AsyncSession = Depends(get_db)):
         "currency": product.currency,
         "image": product.image,
         "images": product.images or [],
+        "imageVariants": product.image_variants or {},
         "tags": product.tags or [],
         "inStock": product.stock_quantity > 0,
         "stockQuantity": product.stock_quantity,
@@ -555,19 +547,36 @@ async def get_product(product_id: str, db: AsyncSession = Depends(get_db)):
         "vendorName": product.vendor_name,
         "createdAt": product.created_at.isoformat() if product.created_at else None
     }
+    await catalog_cache.set(cache_key, payload, generation)
+    return payload
 
 @api_router.get("/categories")
 async def get_categories(db: AsyncSession = Depends(get_db)):
     """Get all unique categories"""
+    cache_key = catalog_cache.key("categories")
+    cached, generation = await catalog_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    
     result = await db.execute(
         select(ProductDB.category).distinct()
     )
     categories = [row[0] for row in result.all() if row[0]]
+    await catalog_cache.set(cache_key, categories, generation)
     return categories
 
 @api_router.get("/categories/tree")
-async def get_categories_tree(db: AsyncSession = Depends(get_db)):
+async def get_categories_tree(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """Get category and subcategory hierarchy based on existing products"""
+    headers = await catalog_cache_headers(request)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    cache_key = catalog_cache.key("categories/tree")
+    cached, generation = await catalog_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    
     # Fetch all distinct pairs of (category, subcategory)
     result = await db.execute(
         select(ProductDB.category, ProductDB.subcategory)
@@ -590,13 +599,15 @@ async def get_categories_tree(db: AsyncSession = Depends(get_db)):
             tree[cat].add(sub)
             
     # Format as list
-    return [
+    payload = [
         {
             "name": cat,
             "subcategories": sorted(list(subs))
         }
         for cat, subs in tree.items()
     ]
+    await catalog_cache.set(cache_key, payload, generation)
+    return payload
 
 
 # ============================================
@@ -639,6 +650,11 @@ async def get_product_rating(
     db: AsyncSession = Depends(get_db)
 ):
     """Get average rating and total reviews for a product"""
+    cache_key = catalog_cache.key(f"products/{product_id}/rating")
+    cached, generation = await catalog_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    
     from sqlalchemy import func as sqlfunc
     result = await db.execute(
         select(
@@ -649,10 +665,12 @@ async def get_product_rating(
     )
     row = result.first()
     avg_rating = float(row.avg_rating) if row.avg_rating else 0
-    return {
+    payload = {
         "averageRating": round(avg_rating, 1),
         "totalReviews": row.total or 0
     }
+    await catalog_cache.set(cache_key, payload, generation)
+    return payload
 
 @api_router.post("/products/{product_id}/reviews")
 async def create_review(
@@ -666,18 +684,22 @@ async def create_review(
         raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
     # Check if user has purchased this product
-    order_result = await db.execute(
-        select(OrderDB)
+    try:
+        product_uuid = uuid_lib.UUID(product_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    purchase_result = await db.execute(
+        select(OrderLineDB.id)
+        .join(OrderDB, OrderDB.id == OrderLineDB.order_id)
         .where(
-            OrderDB.customer_id == current_user.id,
+            OrderLineDB.product_id == product_uuid,
+            OrderDB.customer_id == str(current_user.id),
             OrderDB.status.in_(['delivered', 'completed'])
         )
+        .limit(1)
     )
-    orders = order_result.scalars().all()
-    is_verified = any(
-        any(str(item.get('productId')) == product_id for item in (o.items or []))
-        for o in orders
-    )
+    is_verified = purchase_result.first() is not None
     
     # Check if user already reviewed this product
     existing = await db.execute(
@@ -699,6 +721,7 @@ async def create_review(
     )
     db.add(review)
     await db.commit()
+    await invalidate_catalog()
     await db.refresh(review)
     
     return {
@@ -713,20 +736,25 @@ async def create_review(
 
 @api_router.get("/admin/reviews")
 async def get_all_reviews(
-    status: Optional[str] = None,  # all, pending, approved
+    review_status: Optional[str] = Query(None, alias="status"),  # all, pending, approved
+    limit: Optional[int] = Query(None, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     owner: UserDB = Depends(get_owner)
 ):
     """Get all reviews for admin moderation"""
-    query = select(ReviewDB).order_by(ReviewDB.created_at.desc())
-    if status == "pending":
+    query = select(ReviewDB)
+    if review_status == "pending":
         query = query.where(ReviewDB.is_approved == False)
-    elif status == "approved":
+    elif review_status == "approved":
         query = query.where(ReviewDB.is_approved == True)
     
+    limit = resolve_page_limit(limit, cursor)
+    query = keyset_paginate(query, [ReviewDB.created_at, ReviewDB.id], cursor, limit)
     result = await db.execute(query)
-    reviews = result.scalars().all()
-    return [
+    rows, next_cursor = split_page(result.all(), limit)
+    reviews = [row[0] for row in rows]
+    return page_response([
         {
             "id": str(r.id),
             "productId": str(r.product_id),
@@ -738,7 +766,7 @@ async def get_all_reviews(
             "createdAt": r.created_at.isoformat() if r.created_at else None
         }
         for r in reviews
-    ]
+    ], next_cursor, cursor)
 
 @api_router.post("/admin/reviews/{review_id}/approve")
 async def approve_review(
@@ -754,6 +782,7 @@ async def approve_review(
     
     review.is_approved = True
     await db.commit()
+    await invalidate_catalog()
     return {"success": True, "message": "Review approved"}
 
 @api_router.delete("/admin/reviews/{review_id}")
@@ -770,6 +799,7 @@ async def delete_review(
     
     await db.delete(review)
     await db.commit()
+    await invalidate_catalog()
     return {"success": True, "message": "Review deleted"}
 
 
@@ -814,14 +844,11 @@ async def send_otp(data: OTPRequest, background_tasks: BackgroundTasks):
     # Send OTP via email if email provided
     if data.email:
         try:
-            # Use BackgroundTasks to send email immediately without blocking response
-            background_tasks.add_task(
-                send_email_via_vercel,
-                to_email=data.email,
-                otp=otp
-            )
+            # Queued at the front of the outbox; the mail worker sends it right away
+            await enqueue_email(data.email, "Annya Jewellers Notification",
+                                render("otp.html", otp=otp), kind=KIND_OTP, priority=PRIORITY_OTP)
         except Exception as e:
-            logger.error(f"Failed to schedule OTP email: {e}")
+            logger.error(f"Failed to queue OTP email: {e}")
             # Still return success - OTP is stored, user can check terminal
     
     logger.info(f"OTP for {identifier}: {otp}")
@@ -900,10 +927,18 @@ async def verify_otp(data: OTPVerify, db: AsyncSession = Depends(get_db)):
 # ============================================
 
 @api_router.post("/track")
-async def track_event(event: dict = Body(...)):
-    """Track analytics events (placeholder for now)"""
-    # In production, store this in a database or send to analytics service
-    logger.info(f"Track event: {event}")
+async def track_event(request: Request, event: dict = Body(...)):
+    """Track a storefront page view (queued, written to traffic_logs in batches)"""
+    forwarded_for = request.headers.get("x-forwarded-for")
+    ip_address = forwarded_for.split(",")[0].strip() if forwarded_for else (request.client.host if request.client else None)
+    traffic_ingestor.record(
+        path=str(event.get("path") or "/"),
+        user_agent=request.headers.get("user-agent"),
+        ip_address=ip_address,
+        referrer=event.get("referrer"),
+        device_hint=event.get("device"),
+        own_host=request.headers.get("host")
+    )
     return {"success": True}
 
 @api_router.post("/auth/register", response_model=AuthResponse)
@@ -1133,26 +1168,58 @@ async def verify_owner(current_user: UserDB = Depends(get_current_user)):
 @api_router.post("/admin/upload")
 async def upload_file(
     file: UploadFile = File(...),
+    variants: bool = False,
     owner: UserDB = Depends(get_owner)
 ):
-    """Upload a file (image) to Cloudinary"""
+    """Upload a file (image) to Cloudinary, optionally with thumb/card/zoom variants"""
     try:
-        # Upload using Cloudinary SDK
-        # folder parameter organizes images in Cloudinary
-        result = cloudinary.uploader.upload(file.file, folder="anya-jewellery")
-        
-        return {"url": result.get("secure_url")}
-        
+        return await upload_image(file.file, file.filename, variants)
     except Exception as e:
-        print(f"Cloudinary Upload failed: {str(e)}")
+        logger.error(f"Cloudinary Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+@api_router.post("/admin/upload/batch")
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    variants: bool = True,
+    product_id: Optional[str] = None,
+    owner: UserDB = Depends(get_owner),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload many images in parallel; with product_id they are appended to the product's gallery"""
+    if len(files) > MAX_FILES_PER_UPLOAD:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FILES_PER_UPLOAD} files per upload")
+    
+    if product_id:
+        exists = (await db.execute(select(ProductDB.id).where(ProductDB.id == product_id))).scalar_one_or_none()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Product not found")
+        # End the transaction so no connection sits idle in it for the whole upload
+        await db.rollback()
+    
+    results = await upload_images(files, variants)
+    uploaded = [r for r in results if r["success"]]
+    
+    if product_id and uploaded:
+        # Load and lock the row only now: staff may have edited the product meanwhile
+        result = await db.execute(select(ProductDB).where(ProductDB.id == product_id).with_for_update())
+        product = result.scalar_one_or_none()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product was deleted during the upload")
+        add_to_gallery(product, uploaded, variants)
+        await db.commit()
+        await invalidate_catalog()
+    
+    return {
+        "uploaded": len(uploaded),
+        "failed": len(results) - len(uploaded),
+        "results": results
+    }
+
 # ============================================
 # ADMIN - NAVIGATION API
 # ============================================
 
-NAVIGATION_FILE = "navigation_config.json"
-
 def get_default_navigation():
     """Return default navigation structure"""
     return [
@@ -1196,14 +1263,7 @@ def get_default_navigation():
 @api_router.get("/admin/navigation")
 async def get_navigation(owner: UserDB = Depends(get_owner)):
     """Get navigation menu structure"""
-    try:
-        if os.path.exists(NAVIGATION_FILE):
-            with open(NAVIGATION_FILE, 'r') as f:
-                return json.load(f)
-        return get_default_navigation()
-    except Exception as e:
-        logger.error(f"Error loading navigation: {e}")
-        return get_default_navigation()
+    return load_navigation_config() or get_default_navigation()
 
 @api_router.put("/admin/navigation")
 async def update_navigation(
@@ -1214,6 +1274,7 @@ async def update_navigation(
     try:
         with open(NAVIGATION_FILE, 'w') as f:
             json.dump(nav_items, f, indent=2)
+        navigation_cache.invalidate()
         return {"success": True, "message": "Navigation saved successfully"}
     except Exception as e:
         logger.error(f"Error saving navigation: {e}")
@@ -1227,6 +1288,7 @@ async def update_navigation(
 async def get_customers(
     limit: int = Query(100, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
@@ -1249,14 +1311,14 @@ async def get_customers(
         )
         .outerjoin(stats_subq, stats_subq.c.customer_id == cast(UserDB.id, String))
         .where(UserDB.role == 'customer')
-        .order_by(UserDB.created_at.desc())
-        .limit(limit)
-        .offset(offset)
     )
+    stmt = keyset_paginate(stmt, [UserDB.created_at, UserDB.id], cursor, limit)
+    if cursor is None:
+        stmt = stmt.offset(offset)
     result = await db.execute(stmt)
-    rows = result.all()
+    rows, next_cursor = split_page(result.all(), limit)
 
-    return [
+    return page_response([
         {
             "id": str(user.id),
             "name": user.full_name,
@@ -1266,8 +1328,8 @@ async def get_customers(
             "totalSpent": float(total_spent or 0),
             "createdAt": user.created_at.isoformat() if user.created_at else None
         }
-        for user, order_count, total_spent in rows
-    ]
+        for user, order_count, total_spent in (row[:3] for row in rows)
+    ], next_cursor, cursor)
 
 class CustomerCreate(BaseModel):
     name: str
@@ -1311,142 +1373,21 @@ async def create_customer(
 # ============================================
 
 @api_router.get("/navigation")
-async def get_navigation_tree(db: AsyncSession = Depends(get_db)):
+async def get_navigation_tree(request: Request, response: Response):
     """
     Returns the navigation structure.
     Priority:
     1. Manual Configuration (navigation_config.json) if it exists.
     2. Dynamic DB Structure (as fallback).
     
-    Both methods get dynamic Featured Products populated at runtime.
+    Served from navigation_cache; featured products rotate through a
+    precomputed pool per category.
     """
-    from sqlalchemy.sql.expression import func
-    import json
-    import os
-    
-    # --- Helper: Get Featured Products ---
-    async def get_featured_products(category_name, keywords=None):
-        # Build filters. If keywords provided (from old config), use them.
-        # Otherwise match category name.
-        filters = []
-        if keywords:
-             for k in keywords:
-                 filters.append(ProductDB.category.ilike(f"%{k}%"))
-                 filters.append(ProductDB.subcategory.ilike(f"%{k}%"))
-                 filters.append(ProductDB.name.ilike(f"%{k}%"))
-             filter_cond = or_(*filters)
-        else:
-             filter_cond = (ProductDB.category == category_name)
-
-        stmt = (
-            select(ProductDB)
-            .where(
-                and_(
-                    filter_cond,
-                    ProductDB.status == 'active',
-                    ProductDB.stock_quantity > 0,
-                    ProductDB.image.isnot(None),
-                    ProductDB.image != ""
-                )
-            )
-            .order_by(func.random())
-            .limit(2)
-        )
-        result = await db.execute(stmt)
-        products = result.scalars().all()
-        return [
-            {"title": p.name, "link": f"/product/{p.id}", "image": p.image}
-            for p in products
-        ]
-
-    nav_structure = []
-    use_dynamic = True
-
-    # 1. Try to load Manual Configuration
-    if os.path.exists(NAVIGATION_FILE):
-        try:
-            with open(NAVIGATION_FILE, 'r') as f:
-                saved_nav = json.load(f)
-                if saved_nav and isinstance(saved_nav, list) and len(saved_nav) > 0:
-                    nav_structure = saved_nav
-                    use_dynamic = False
-        except Exception as e:
-            print(f"Error loading navigation config: {e}")
-            # Fallback to dynamic
-
-    # 2. Dynamic Fallback
-    if use_dynamic:
-        # Fetch all distinct Category/Subcategory pairs
-        result = await db.execute(
-            select(ProductDB.category, ProductDB.subcategory)
-            .where(ProductDB.status == 'active')
-            .distinct()
-            .order_by(ProductDB.category, ProductDB.subcategory)
-        )
-        rows = result.all()
-        
-        # Group by Category
-        tree = {}
-        for cat, sub in rows:
-            if not cat: continue
-            cat = cat.strip()
-            sub = sub.strip() if sub else None
-            if cat not in tree: tree[cat] = set()
-            if sub: tree[cat].add(sub)
-        
-        # Sort Categories
-        sorted_categories = sorted(list(tree.keys()))
-        priority_order = ["Engagement Rings", "Diamond Jewellery", "Wedding Rings", "Gold Jewellery", "Silver Jewellery"]
-        def sort_key(x):
-            try: return priority_order.index(x)
-            except ValueError: return 999 + (1 if x > "" else 0)
-        sorted_categories.sort(key=sort_key)
-
-        for cat in sorted_categories:
-            subcats = sorted(list(tree[cat]))
-            
-            # Split into columns
-            columns = []
-            chunk_size = 6
-            for i in range(0, len(subcats), chunk_size):
-                chunk = subcats[i:i + chunk_size]
-                columns.append({
-                    "title": "Browse" if i == 0 else None,
-                    "items": chunk
-                })
-            
-            if not columns: columns.append({"title": None, "items": []})
-            
-            # Add "All [Category]"
-            if columns[0]["items"]: columns[0]["items"].append(f"All {cat}")
-            else: columns[0]["items"] = [f"All {cat}"]
-
-            nav_structure.append({
-                "name": cat,
-                "columns": columns
-            })
-
-    # 3. Populate Featured Products for the final structure
-    final_nav = []
-    for item in nav_structure:
-        # Check if item has 'keywords' (from manual config) or just 'name'
-        keywords = item.get("keywords")
-        # Legacy config might imply keywords map. 
-        # But simpler: use name as category lookup if keywords missing.
-        
-        cat_name = item.get("name", "")
-        
-        # If manual config has specific keywords, use them.
-        # Otherwise, assume the manual category name matches DB category name.
-        featured = await get_featured_products(cat_name, keywords)
-        
-        final_nav.append({
-            "name": cat_name,
-            "columns": item.get("columns", []),
-            "featured": featured
-        })
-        
-    return final_nav
+    headers = await catalog_cache_headers(request, extra_version=await navigation_cache.version())
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return await navigation_cache.get()
 
 
 @api_router.get("/admin/dashboard")
@@ -1459,79 +1400,47 @@ async def get_dashboard_stats(
     db: AsyncSession = Depends(get_db)
 ):
     """Get dashboard statistics with percentage changes"""
-    from datetime import datetime, timedelta, timezone
-    
-    now = datetime.now(timezone.utc)
-    
-    if period == 'custom' and start_date and end_date:
-        try:
-            # Parse ISO formatted dates (assuming YYYY-MM-DD)
-            # Add time components to cover the full day
-            dt_start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc)
-            dt_end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
-            
-            # Calculate duration for previous period comparison
-            duration = dt_end - dt_start
-            
-            current_start = dt_start
-            now = dt_end # Use custom end date instead of 'now' for the query limit
-            previous_start = current_start - duration
-        except ValueError:
-             # Fallback if parsing fails
-             current_start = now - timedelta(days=7)
-             previous_start = current_start - timedelta(days=7)
-    else:
-        # Standard periods
-        if period == 'today':
-            import pytz
-            ist = pytz.timezone('Asia/Kolkata')
-            now_ist = datetime.now(ist)
-            today_start_ist = now_ist.replace(hour=0, minute=0, second=0, microsecond=0)
-            current_start = today_start_ist.astimezone(timezone.utc)
-            previous_start = current_start - timedelta(days=1)
-        else:
-            days_map = {"7d": 7, "30d": 30, "90d": 90}
-            days = days_map.get(period, 7)
-            current_start = now - timedelta(days=days)
-            previous_start = current_start - timedelta(days=days)
-    
-    async def get_period_stats(start_time, end_time):
-        # Build base conditions
-        conditions = [OrderDB.created_at >= start_time, OrderDB.created_at < end_time]
-        if channel:
-            if channel == 'online':
-                conditions.append(OrderDB.channel == 'online')
-            else: # pos
-                conditions.append(OrderDB.channel != 'online')
-        
-        from sqlalchemy import case
-        
-        stmt = select(
-            func.sum(OrderDB.grand_total).label('gross_sales'),
-            func.sum(case((OrderDB.payment_status == 'paid', OrderDB.grand_total), else_=0)).label('net_sales'),
-            func.sum(case((OrderDB.payment_status == 'paid', OrderDB.gross_profit), else_=0)).label('gross_profit')
-        ).where(and_(*conditions))
-        
-        result = await db.execute(stmt)
-        row = result.one()
-        
-        gross_sales = row.gross_sales or 0
-        net_sales = row[1] or 0 # accessing by index/label
-        gross_profit = row[2] or 0
-        
-        # Net profit (simplified)
-        net_profit = gross_profit
-        
-        return {
-            "gross_sales": float(gross_sales),
-            "net_sales": float(net_sales),
-            "gross_profit": float(gross_profit),
-            "net_profit": float(net_profit)
-        }
-
-    # Get current and previous period stats
-    current = await get_period_stats(current_start, now)
-    previous = await get_period_stats(previous_start, current_start)
+    cache_key = (period, channel, start_date, end_date)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    current_start, current_end = resolve_period(period, start_date, end_date)
+    # Previous period of the same length, immediately before the current one
+    previous_start = current_start - (current_end - current_start) - timedelta(days=1)
+    
+    # Sales and order counts for both periods in one pass over the rollup
+    sales = sales_source(previous_start, current_end, channel)
+    in_current = sales.c.day >= current_start
+    in_previous = sales.c.day < current_start
+    
+    def period_sum(column, condition):
+        return func.coalesce(func.sum(column).filter(condition), 0)
+    
+    is_paid = sales.c.payment_status == 'paid'
+    sales_totals = select(
+        period_sum(sales.c.gross_sales, in_current).label('gross_sales'),
+        period_sum(sales.c.gross_sales, and_(in_current, is_paid)).label('net_sales'),
+        period_sum(sales.c.gross_profit, and_(in_current, is_paid)).label('gross_profit'),
+        period_sum(sales.c.gross_sales, in_previous).label('prev_gross_sales'),
+        period_sum(sales.c.gross_sales, and_(in_previous, is_paid)).label('prev_net_sales'),
+        period_sum(sales.c.gross_profit, and_(in_previous, is_paid)).label('prev_gross_profit'),
+        period_sum(sales.c.order_count, in_current).label('total_orders'),
+        period_sum(sales.c.pending_count, in_current).label('pending_orders'),
+        period_sum(sales.c.delivered_count, in_current).label('delivered_orders'),
+        period_sum(sales.c.returned_count, in_current).label('returned_orders')
+    ).cte('sales_totals')
+    
+    # Inventory value, low stock and stockout counts in one scan of products
+    inventory = select(
+        func.coalesce(func.sum(ProductDB.selling_price * ProductDB.stock_quantity), 0).label('inventory_value'),
+        func.count().filter(ProductDB.stock_quantity <= ProductDB.low_stock_threshold).label('low_stock_count'),
+        func.count().filter(ProductDB.stock_quantity == 0).label('stockout_count')
+    ).cte('inventory')
+    
+    # Single round trip: both CTEs joined into one row
+    stmt = select(sales_totals, inventory).select_from(sales_totals.join(inventory, true()))
+    row = (await db.execute(stmt)).one()
     
     def calculate_change(curr, prev):
         if prev == 0:
@@ -1539,73 +1448,38 @@ async def get_dashboard_stats(
         change = ((curr - prev) / prev) * 100
         sign = "+" if change >= 0 else ""
         return f"{sign}{change:.1f}%"
-
-    # Other non-comparative stats
-    # Combined order counts
-    conditions = [OrderDB.created_at >= current_start]
-    if channel:
-        if channel == 'online':
-            conditions.append(OrderDB.channel == 'online')
-        else:
-            conditions.append(OrderDB.channel != 'online')
-            
-    stmt = select(
-        func.count().label('total_orders'),
-        func.count().filter(OrderDB.status == 'pending').label('pending_orders'),
-        func.count().filter(OrderDB.status == 'delivered').label('delivered_orders'),
-        func.count().filter(OrderDB.status == 'returned').label('returned_orders')
-    ).where(and_(*conditions))
-    
-    counts_res = await db.execute(stmt)
-    counts_row = counts_res.one()
-    
-    order_count = counts_row[0] or 0
-    pending_count = counts_row[1] or 0
-    delivered_count = counts_row[2] or 0
-    returned_count = counts_row[3] or 0
-    
-    # Inventory value
-    inventory_value_result = await db.execute(
-        select(func.sum(ProductDB.selling_price * ProductDB.stock_quantity))
-    )
-    inventory_value = inventory_value_result.scalar() or 0
-    
-    # Low stock count
-    low_stock_result = await db.execute(
-        select(func.count()).select_from(ProductDB)
-        .where(ProductDB.stock_quantity <= ProductDB.low_stock_threshold)
-    )
-    low_stock_count = low_stock_result.scalar() or 0
     
-    # Stockout count (0 quantity)
-    stockout_result = await db.execute(
-        select(func.count()).select_from(ProductDB)
-        .where(ProductDB.stock_quantity == 0)
-    )
-    stockout_count = stockout_result.scalar() or 0
+    gross_sales = float(row.gross_sales)
+    net_sales = float(row.net_sales)
+    gross_profit = float(row.gross_profit)
+    # Net profit (simplified)
+    net_profit = gross_profit
+    prev_net_profit = float(row.prev_gross_profit)
     
-    return {
-        "gross_sales": current["gross_sales"],
-        "gross_sales_change": calculate_change(current["gross_sales"], previous["gross_sales"]),
+    stats = {
+        "gross_sales": gross_sales,
+        "gross_sales_change": calculate_change(gross_sales, float(row.prev_gross_sales)),
         
-        "net_sales": current["net_sales"],
-        "net_sales_change": calculate_change(current["net_sales"], previous["net_sales"]),
+        "net_sales": net_sales,
+        "net_sales_change": calculate_change(net_sales, float(row.prev_net_sales)),
         
-        "gross_profit": current["gross_profit"],
-        "gross_profit_change": calculate_change(current["gross_profit"], previous["gross_profit"]),
+        "gross_profit": gross_profit,
+        "gross_profit_change": calculate_change(gross_profit, float(row.prev_gross_profit)),
         
-        "net_profit": current["net_profit"],
-        "net_profit_change": calculate_change(current["net_profit"], previous["net_profit"]),
+        "net_profit": net_profit,
+        "net_profit_change": calculate_change(net_profit, prev_net_profit),
         
-        "orders_count": order_count,
-        "orders_pending": pending_count,
-        "orders_delivered": delivered_count,
-        "orders_returned": returned_count,
+        "orders_count": int(row.total_orders),
+        "orders_pending": int(row.pending_orders),
+        "orders_delivered": int(row.delivered_orders),
+        "orders_returned": int(row.returned_orders),
         
-        "inventory_value": float(inventory_value),
-        "low_stock_count": low_stock_count,
-        "stockout_count": stockout_count
+        "inventory_value": float(row.inventory_value),
+        "low_stock_count": row.low_stock_count or 0,
+        "stockout_count": row.stockout_count or 0
     }
+    dashboard_cache.set(cache_key, stats)
+    return stats
 
 
 @api_router.get("/admin/notifications")
@@ -1685,58 +1559,18 @@ async def get_sales_analytics(
     db: AsyncSession = Depends(get_db)
 ):
     """Get sales trend data"""
-    from datetime import datetime, timedelta, timezone
-    now = datetime.now(timezone.utc)
+    range_start, range_end = resolve_period(period, start_date, end_date, default_days=days)
+    sales = sales_source(range_start, range_end, channel)
     
-    # Determine start_date based on period/custom
-    if period == 'custom' and start_date and end_date:
-        try:
-            dt_start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc)
-            # For charts, we just need the start date, but maybe we want to filter up to end_date too?
-            # The current chart logic groups by day > start_date.
-            query_start = dt_start
-            # If we want to strictly filter upper bound, we'd need to add where(created_at <= end_date)
-            # For now let's just set the lower bound correctly
-        except ValueError:
-             query_start = now - timedelta(days=days)
-    elif period == 'today':
-            import pytz
-            ist = pytz.timezone('Asia/Kolkata')
-            now_ist = datetime.now(ist)
-            today_start_ist = now_ist.replace(hour=0, minute=0, second=0, microsecond=0)
-            query_start = today_start_ist.astimezone(timezone.utc)
-    else:
-        # standard days (7d, 30d)
-        # If period is passed, map it, otherwise fallback to days param
-        days_map = {"7d": 7, "30d": 30, "90d": 90}
-        d = days_map.get(period, days)
-        query_start = now - timedelta(days=d)
-
-    # Build query
-    from sqlalchemy import case, Date
-    stmt = select(
-        func.cast(OrderDB.created_at, Date).label('date'),
-        func.sum(case((OrderDB.payment_status == 'paid', OrderDB.grand_total), else_=0)).label('sales'),
-        func.sum(case((OrderDB.payment_status == 'paid', OrderDB.gross_profit), else_=0)).label('profit')
-    ).where(OrderDB.created_at >= query_start)
-    
-    if period == 'custom' and end_date:
-        try:
-             dt_end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
-             stmt = stmt.where(OrderDB.created_at <= dt_end)
-        except: pass
-    
-    if channel:
-        if channel == 'online':
-            stmt = stmt.where(OrderDB.channel == 'online')
-        else: # pos / main store
-            stmt = stmt.where(OrderDB.channel != 'online')
-
-    # Get daily sales
-    # Group by the date directly
+    # Daily paid sales/profit, one row per IST day
     result = await db.execute(
-        stmt.group_by(func.cast(OrderDB.created_at, Date))
-        .order_by(func.cast(OrderDB.created_at, Date))
+        select(
+            sales.c.day.label('date'),
+            paid(sales, sales.c.gross_sales).label('sales'),
+            paid(sales, sales.c.gross_profit).label('profit')
+        )
+        .group_by(sales.c.day)
+        .order_by(sales.c.day)
     )
     
     data = [
@@ -1750,8 +1584,6 @@ async def get_sales_analytics(
     
     return data
 
-    return data
-
 @api_router.get("/admin/analytics/sales-by-channel")
 async def get_sales_by_channel(
     days: int = 7,  
@@ -1762,25 +1594,17 @@ async def get_sales_by_channel(
     db: AsyncSession = Depends(get_db)
 ):
     """Get sales breakdown by channel"""
-    from datetime import datetime, timedelta, timezone
-    from sqlalchemy import case, func
-    
-    current_start = datetime.now(timezone.utc) - timedelta(days=days)
+    range_start, range_end = resolve_period('custom', start_date, end_date or ist_today().isoformat(), default_days=days)
+    sales = sales_source(range_start, range_end)
     
-    # Custom dates
-    if start_date:
-        try:
-            current_start = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-        except: pass
-            
-    stmt = select(
-        OrderDB.channel,
-        func.count(OrderDB.id).label('orders'),
-        func.sum(case((OrderDB.payment_status == 'paid', OrderDB.grand_total), else_=0)).label('sales'),
-        func.sum(case((OrderDB.payment_status == 'paid', OrderDB.gross_profit), else_=0)).label('profit')
-    ).where(OrderDB.created_at >= current_start)
-    
-    result = await db.execute(stmt.group_by(OrderDB.channel))
+    result = await db.execute(
+        select(
+            sales.c.channel,
+            func.sum(sales.c.order_count).label('orders'),
+            paid(sales, sales.c.gross_sales).label('sales'),
+            paid(sales, sales.c.gross_profit).label('profit')
+        ).group_by(sales.c.channel)
+    )
     rows = result.all()
     
     # Process results
@@ -1796,7 +1620,7 @@ async def get_sales_by_channel(
         data.append({
             "channel": channel_code,
             "label": channel_map.get(channel_code, channel_code.title()),
-            "orders": row.orders,
+            "orders": int(row.orders or 0),
             "sales": float(row.sales or 0),
             "profit": float(row.profit or 0)
         })
@@ -1827,86 +1651,146 @@ async def get_top_products(
         except Exception:
             pass # fallback to days
 
-    stmt = select(OrderDB).where(OrderDB.created_at >= current_start)
+    # Aggregate sold lines in SQL; unit_cost is the cost snapshot taken at sale time
+    revenue = func.sum(OrderLineDB.quantity * OrderLineDB.unit_price)
+    profit = func.sum(OrderLineDB.quantity * (OrderLineDB.unit_price - func.coalesce(OrderLineDB.unit_cost, 0)))
+    stmt = (
+        select(
+            OrderLineDB.product_id,
+            func.max(OrderLineDB.name).label('name'),
+            func.sum(OrderLineDB.quantity).label('quantity'),
+            revenue.label('revenue'),
+            profit.label('profit')
+        )
+        .where(OrderLineDB.created_at >= current_start)
+        .group_by(OrderLineDB.product_id)
+        # Sort by profit (since the UI title is "Top Products by Profit")
+        .order_by(profit.desc())
+        .limit(10)
+    )
     
     if channel:
         if channel == 'online':
-            stmt = stmt.where(OrderDB.channel == 'online')
+            stmt = stmt.where(OrderLineDB.channel == 'online')
         else: # pos / main store
-            stmt = stmt.where(OrderDB.channel != 'online')
+            stmt = stmt.where(OrderLineDB.channel != 'online')
 
-    # Query orders and extract product info from items JSONB
     result = await db.execute(stmt)
-    orders = result.scalars().all()
+    top_products = [
+        {
+            "id": str(row.product_id) if row.product_id else None,
+            "name": row.name or 'Unknown',
+            "quantity": int(row.quantity or 0),
+            "revenue": float(row.revenue or 0),
+            "profit": float(row.profit or 0)
+        }
+        for row in result.all()
+    ]
     
-    # Aggregate product sales
-    product_sales = {}
-    
-    # Need to fetch costs for accurate profit calculation
-    # Only fetch products that have been sold to avoid fetching entire DB
-    # Optimized: Fetch standard cost for all products first (caching strategy)
-    # OR: Just trust product snapshots in items if we added cost there.
-    # Checking `place_order`: we only added id, name, quantity, price, image, category. 
-    # We DID NOT add cost to the item snapshot.
-    # So we must fetch current product cost from DB.
-    
-    # 1. Collect all product IDs first
-    product_ids = set()
-    for order in orders:
-        if order.items:
-            for item in order.items:
-                pid = item.get('id') or item.get('productId')
-                if pid:
-                    product_ids.add(pid)
-    
-    # 2. Fetch costs
-    product_costs = {}
-    if product_ids:
-        # Convert IDs to UUIDs if needed, assuming they are stored as strings in items JSON
+    return top_products
+
+PROFIT_GROUPINGS = ('day', 'channel', 'product')
+# Orders whose lines are not (or no longer) a sale
+NON_REVENUE_ORDER_STATUSES = ('cancelled', 'returned', 'return_approved')
+
+@api_router.get("/admin/analytics/profit")
+async def get_profit_rollup(
+    days: int = 30,
+    channel: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    group_by: str = 'day',
+    owner: UserDB = Depends(get_owner),
+    db: AsyncSession = Depends(get_db)
+):
+    """Revenue, cost breakdown and gross profit aggregated from order line cost snapshots"""
+    if group_by not in PROFIT_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(PROFIT_GROUPINGS)}")
+    
+    # IST days, like the sales rollup behind the dashboard; end_date is inclusive
+    end_day = ist_today()
+    start_day = end_day - timedelta(days=max(days, 1) - 1)
+    if start_date and end_date:
         try:
-             import uuid as uuid_lib
-             ids_as_uuid = [uuid_lib.UUID(pid) for pid in product_ids]
-             prod_res = await db.execute(select(ProductDB).where(ProductDB.id.in_(ids_as_uuid)))
-             products = prod_res.scalars().all()
-             product_costs = {str(p.id): float(p.total_cost or 0) for p in products}
-        except Exception as e:
-             logging.error(f"Error fetching product costs: {e}")
+            start_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_day = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    range_start = ist_day_bounds(start_day)[0]
+    range_end = ist_day_bounds(end_day)[1]
+    
+    def line_sum(column):
+        return func.coalesce(func.sum(OrderLineDB.quantity * func.coalesce(column, 0)), 0)
+    
+    if group_by == 'day':
+        # Literal zone, so the select and GROUP BY expressions are textually identical
+        group_key = cast(func.timezone(literal_column("'Asia/Kolkata'"), OrderLineDB.created_at), Date)
+    elif group_by == 'channel':
+        group_key = OrderLineDB.channel
+    else:
+        group_key = OrderLineDB.product_id
     
-    for order in orders:
-        if order.items:
-            for item in order.items:
-                product_id = item.get('id') or item.get('productId')
-                name = item.get('name', 'Unknown')
-                
-                if name:
-                    if name not in product_sales:
-                        product_sales[name] = {
-                            "name": name,
-                            "quantity": 0,
-                            "revenue": 0,
-                            "profit": 0,
-                            # Keep one ID for reference, though it might be mixed
-                            "id": product_id 
-                        }
-                    quantity = item.get('quantity', 1)
-                    price = item.get('price', 0)
-                    cost = product_costs.get(product_id, 0)
-                    
-                    revenue = quantity * price
-                    profit = revenue - (cost * quantity)
-                    
-                    product_sales[name]["quantity"] += quantity
-                    product_sales[name]["revenue"] += revenue
-                    product_sales[name]["profit"] += profit
+    revenue = line_sum(OrderLineDB.unit_price)
+    cost = line_sum(OrderLineDB.unit_cost)
+    stmt = (
+        select(
+            group_key.label('key'),
+            func.max(OrderLineDB.name).label('name'),
+            func.coalesce(func.sum(OrderLineDB.quantity), 0).label('quantity'),
+            revenue.label('revenue'),
+            line_sum(OrderLineDB.cost_gold).label('cost_gold'),
+            line_sum(OrderLineDB.cost_stone).label('cost_stone'),
+            line_sum(OrderLineDB.cost_making).label('cost_making'),
+            line_sum(OrderLineDB.cost_other).label('cost_other'),
+            cost.label('total_cost'),
+            (revenue - cost).label('profit')
+        )
+        .join(OrderDB, OrderDB.id == OrderLineDB.order_id)
+        .where(
+            OrderLineDB.created_at >= range_start,
+            OrderLineDB.created_at < range_end,
+            # Same orders the dashboard counts as sales
+            OrderDB.payment_status == 'paid',
+            OrderDB.status.notin_(NON_REVENUE_ORDER_STATUSES)
+        )
+        .group_by(group_key)
+    )
+    if channel:
+        if channel == 'online':
+            stmt = stmt.where(OrderLineDB.channel == 'online')
+        else: # pos / main store
+            stmt = stmt.where(OrderLineDB.channel != 'online')
+    stmt = stmt.order_by(group_key.asc() if group_by == 'day' else (revenue - cost).desc())
     
-    # Sort by profit (since the UI title is "Top Products by Profit")
-    top_products = sorted(
-        [{"id": v["id"], **v} for k, v in product_sales.items()],
-        key=lambda x: x["profit"],
-        reverse=True
-    )[:10]
+    result = await db.execute(stmt)
+    rows = []
+    totals = {"quantity": 0, "revenue": 0.0, "cost_gold": 0.0, "cost_stone": 0.0,
+              "cost_making": 0.0, "cost_other": 0.0, "total_cost": 0.0, "profit": 0.0}
+    for row in result.all():
+        entry = {
+            "quantity": int(row.quantity),
+            "revenue": float(row.revenue),
+            "cost_gold": float(row.cost_gold),
+            "cost_stone": float(row.cost_stone),
+            "cost_making": float(row.cost_making),
+            "cost_other": float(row.cost_other),
+            "total_cost": float(row.total_cost),
+            "profit": float(row.profit)
+        }
+        for field, value in entry.items():
+            totals[field] += value
+        if group_by == 'day':
+            entry["date"] = row.key.isoformat() if row.key else None
+        elif group_by == 'channel':
+            entry["channel"] = row.key
+        else:
+            entry["product_id"] = str(row.key) if row.key else None
+            entry["name"] = row.name or 'Unknown'
+        entry["margin_percent"] = round(entry["profit"] / entry["revenue"] * 100, 2) if entry["revenue"] else 0
+        rows.append(entry)
     
-    return top_products
+    totals["margin_percent"] = round(totals["profit"] / totals["revenue"] * 100, 2) if totals["revenue"] else 0
+    return {"group_by": group_by, "rows": rows, "totals": totals}
 
 @api_router.get("/admin/analytics/low-stock")
 async def get_low_stock_items(
@@ -1931,27 +1815,36 @@ async def get_low_stock_items(
         "category": p.category
     } for p in products]
 
+def traffic_window_start(days: int):
+    """First IST day of the last `days` days, including today"""
+    return ist_today() - timedelta(days=max(days, 1) - 1)
+
 @api_router.get("/admin/analytics/traffic")
 async def get_traffic_analytics(
     days: int = 30,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get traffic analytics over time (simulated data for now)"""
-    import random
-    from datetime import datetime, timedelta
+    """Get daily visitors and pageviews (from the traffic rollup)"""
+    result = await db.execute(
+        select(TrafficDailyDB.day, TrafficDailyDB.visitors, TrafficDailyDB.pageviews)
+        .where(
+            TrafficDailyDB.dimension == 'total',
+            TrafficDailyDB.day >= traffic_window_start(days)
+        )
+    )
+    by_day = {row.day: row for row in result.all()}
     
+    # One point per day, including days without traffic
+    today = ist_today()
     traffic_data = []
-    today = datetime.now()
-    
-    for i in range(days, 0, -1):
+    for i in range(days - 1, -1, -1):
         date = today - timedelta(days=i)
-        # Generate realistic-looking traffic data with some variance
-        base_visitors = random.randint(50, 200)
+        row = by_day.get(date)
         traffic_data.append({
             "date": date.strftime("%b %d"),
-            "visitors": base_visitors,
-            "pageviews": base_visitors * random.randint(2, 5)
+            "visitors": row.visitors if row else 0,
+            "pageviews": row.pageviews if row else 0
         })
     
     return traffic_data
@@ -1959,66 +1852,84 @@ async def get_traffic_analytics(
 @api_router.get("/admin/analytics/pages")
 async def get_top_pages(
     limit: int = 5,
+    days: int = 30,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get top visited pages with analytics"""
-    import random
+    """Get top visited pages with views and bounce rate"""
+    views = func.sum(TrafficDailyDB.pageviews).label('views')
+    result = await db.execute(
+        select(
+            TrafficDailyDB.value.label('path'),
+            views,
+            func.sum(TrafficDailyDB.visitors).label('visitors'),
+            func.sum(TrafficDailyDB.bounces).label('bounced')
+        )
+        .where(
+            TrafficDailyDB.dimension == 'path',
+            TrafficDailyDB.day >= traffic_window_start(days)
+        )
+        .group_by(TrafficDailyDB.value)
+        .order_by(views.desc())
+        .limit(limit)
+    )
     
-    pages = [
-        {"page": "/", "views": random.randint(500, 2000), "bounce": random.randint(20, 50)},
-        {"page": "/products", "views": random.randint(300, 1500), "bounce": random.randint(25, 45)},
-        {"page": "/collections/engagement-rings", "views": random.randint(200, 800), "bounce": random.randint(30, 55)},
-        {"page": "/collections/gold-jewellery", "views": random.randint(150, 600), "bounce": random.randint(28, 50)},
-        {"page": "/about", "views": random.randint(100, 400), "bounce": random.randint(35, 60)},
-        {"page": "/contact", "views": random.randint(80, 300), "bounce": random.randint(40, 65)},
-        {"page": "/cart", "views": random.randint(150, 500), "bounce": random.randint(15, 35)}
+    # Bounce rate: daily single-pageview visitors over daily visitors of the page
+    return [
+        {
+            "page": row.path,
+            "views": int(row.views),
+            "bounce": min(100, round(row.bounced * 100 / row.visitors)) if row.visitors else 0
+        }
+        for row in result.all()
     ]
-    
-    # Sort by views and return top N
-    pages.sort(key=lambda x: x["views"], reverse=True)
-    return pages[:limit]
 
 @api_router.get("/admin/analytics/devices")
 async def get_device_analytics(
+    days: int = 30,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get device breakdown analytics"""
-    import random
-    
-    total = random.randint(2000, 5000)
-    mobile_pct = random.uniform(0.45, 0.65)
-    desktop_pct = random.uniform(0.25, 0.40)
-    tablet_pct = 1 - mobile_pct - desktop_pct
+    """Get device breakdown analytics (unique visitors per device over the window)"""
+    result = await db.execute(
+        select(TrafficDailyDB.value, TrafficDailyDB.visitor_sketch)
+        .where(
+            TrafficDailyDB.dimension == 'device',
+            TrafficDailyDB.day >= traffic_window_start(days)
+        )
+    )
+    sketches = {}
+    for row in result.all():
+        sketches.setdefault(row.value, []).append(row.visitor_sketch)
+    sessions = {device: merged_visitors(device_sketches) for device, device_sketches in sketches.items()}
     
     return [
-        {"device": "Mobile", "sessions": int(total * mobile_pct)},
-        {"device": "Desktop", "sessions": int(total * desktop_pct)},
-        {"device": "Tablet", "sessions": int(total * tablet_pct)}
+        {"device": "Mobile", "sessions": sessions.get('mobile', 0)},
+        {"device": "Desktop", "sessions": sessions.get('desktop', 0)},
+        {"device": "Tablet", "sessions": sessions.get('tablet', 0)}
     ]
 
 @api_router.get("/admin/analytics/sources")
 async def get_traffic_sources(
+    days: int = 30,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get traffic source breakdown"""
-    import random
-    
-    # Generate percentages that sum to ~1
-    direct = random.uniform(0.25, 0.40)
-    organic = random.uniform(0.20, 0.35)
-    social = random.uniform(0.10, 0.25)
-    referral = random.uniform(0.05, 0.15)
-    paid = 1 - direct - organic - social - referral
+    """Get traffic source breakdown (share of pageviews)"""
+    result = await db.execute(
+        select(TrafficDailyDB.value, func.sum(TrafficDailyDB.pageviews).label('views'))
+        .where(
+            TrafficDailyDB.dimension == 'source',
+            TrafficDailyDB.day >= traffic_window_start(days)
+        )
+        .group_by(TrafficDailyDB.value)
+    )
+    views = {row.value: int(row.views) for row in result.all()}
+    total = sum(views.values())
     
     return [
-        {"source": "Direct", "percent": round(direct, 3)},
-        {"source": "Organic Search", "percent": round(organic, 3)},
-        {"source": "Social Media", "percent": round(social, 3)},
-        {"source": "Referral", "percent": round(referral, 3)},
-        {"source": "Paid Ads", "percent": round(max(0, paid), 3)}
+        {"source": source, "percent": round(views.get(source, 0) / total, 3) if total else 0}
+        for source in SOURCES
     ]
 
 # ============================================
@@ -2039,171 +1950,103 @@ class VendorCreate(BaseModel):
     payment_terms: Optional[str] = None
     lead_time_days: Optional[int] = 0
 
+async def save_upload_to_temp(file: UploadFile, suffix: str) -> str:
+    """Copy an upload to a temp file on disk (it outlives the request for background jobs)"""
+    import tempfile
+
+    def copy() -> str:
+        with tempfile.NamedTemporaryFile("wb", suffix=suffix, delete=False) as tmp:
+            shutil.copyfileobj(file.file, tmp, 1024 * 1024)
+            return tmp.name
+
+    return await asyncio.to_thread(copy)
+
+
 @api_router.post("/admin/products/import")
 async def import_products(
     file: UploadFile = File(...),
-    owner: UserDB = Depends(get_owner),
-    db: AsyncSession = Depends(get_db)
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=MAX_IMPORT_BATCH_SIZE),
+    background: bool = False,
+    owner: UserDB = Depends(get_owner)
 ):
-    """Import products from CSV file using UPSERT pattern"""
-    import csv
-    import codecs
-    import uuid as uuid_lib
-    import io
-    from sqlalchemy.dialects.postgresql import insert as pg_insert
-    
-    print(f"DEBUG: Starting import for file: {file.filename}")
-    
+    """Upsert products from a CSV file by SKU; with ?background=true returns a job id to poll"""
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV file.")
-        
+
+    path = await save_upload_to_temp(file, ".csv")
+
+    async def run(job=None) -> dict:
+        async def on_progress(report, bytes_read, file_size):
+            if job:
+                job.update(processed=bytes_read, total=file_size, rows=report.rows,
+                           inserted=report.inserted, updated=report.updated, failed=report.failed)
+        try:
+            report = await import_products_csv(path, batch_size, on_progress)
+        finally:
+            os.remove(path)
+            # Earlier batches are committed even if a later one fails
+            await invalidate_catalog()
+        return report.to_dict()
+
+    if background:
+        job = await job_registry.start("product_import", run)
+        return {"success": True, "job_id": job.id, "status": job.status}
+
     try:
-        # Read file content
-        content = await file.read()
-        print(f"DEBUG: Read {len(content)} bytes")
-        
-        # Decode using utf-8-sig to handle BOM if present
-        decoded_content = content.decode('utf-8-sig')
-        
-        # Use StringIO to handle universal newlines
-        csv_file = io.StringIO(decoded_content)
-        csv_reader = csv.DictReader(csv_file)
-        
-        # Log headers
-        print(f"DEBUG: CSV Headers detected: {csv_reader.fieldnames}")
-        
-        values_list = []
-        rows_processed = 0
-        skipped_count = 0
-        
-        # Helper to parse float safely
-        def parse_float(val, default=0.0):
-            if not val: return default
-            try:
-                return float(str(val).replace(',', '').strip())
-            except:
-                return default
-        
-        # Helper to parse int safely
-        def parse_int(val, default=0):
-            if not val: return default
-            try:
-                return int(float(str(val).replace(',', '').strip()))
-            except:
-                return default
-        
-        for i, row in enumerate(csv_reader):
-            rows_processed += 1
-            
-            # Skip empty rows
-            if not any(v for v in row.values() if v is not None and str(v).strip()):
-                skipped_count += 1
-                continue
-                
-            # Basic validation
-            name = row.get('name')
-            price = row.get('sellingPrice')
-            
-            if not name or not price:
-                print(f"DEBUG: Skipping invalid row {i} - Name: {name}, Price: {price}")
-                skipped_count += 1
-                continue
-            
-            # Calculations
-            selling_price = parse_float(row.get('sellingPrice'))
-            cost_gold = parse_float(row.get('costGold'))
-            cost_stone = parse_float(row.get('costStone'))
-            cost_making = parse_float(row.get('costMaking'))
-            cost_other = parse_float(row.get('costOther'))
-            
-            total_cost = cost_gold + cost_stone + cost_making + cost_other
-            profit_margin = 0
-            margin_percent = 0
-            
-            if selling_price > 0:
-                profit_margin = selling_price - total_cost
-                margin_percent = (profit_margin / selling_price) * 100
-
-            # Build dict for execute(stmt)
-            product_dict = {
-                "id": uuid_lib.uuid4(), # Note: On conflict update, ID won't change if exists
-                "sku": row.get('sku') or f"SKU-{uuid_lib.uuid4().hex[:8].upper()}",
-                "barcode": row.get('barcode'),
-                "hsn_code": row.get('hsnCode', '7113'),
-                
-                "name": row.get('name'),
-                "description": row.get('description'),
-                "category": row.get('category'),
-                "subcategory": row.get('subcategory'),
-                "tags": row.get('tags', '').split(',') if row.get('tags') else [],
-                "status": row.get('status', 'active'),
-                
-                "metal": row.get('metal'),
-                "purity": row.get('purity'),
-                "gross_weight": parse_float(row.get('grossWeight')),
-                "net_weight": parse_float(row.get('netWeight')),
-                "stone_weight": parse_float(row.get('stoneWeight')),
-                "stone_type": row.get('stoneType'),
-                "stone_quality": row.get('stoneQuality'),
-                
-                "selling_price": selling_price,
-                "price": parse_float(row.get('netPrice')) or selling_price,
-                
-                "cost_gold": cost_gold,
-                "cost_stone": cost_stone,
-                "cost_making": cost_making,
-                "cost_other": cost_other,
-                
-                "total_cost": total_cost,
-                "profit_margin": profit_margin,
-                "margin_percent": margin_percent,
-                
-                "stock_quantity": parse_int(row.get('stockQuantity')),
-                "low_stock_threshold": parse_int(row.get('lowStockThreshold'), 2),
-                "track_inventory": True,
-                "in_stock": parse_int(row.get('stockQuantity')) > 0
-            }
-            values_list.append(product_dict)
-            
-        print(f"DEBUG: Total rows: {rows_processed}, Skipped: {skipped_count}, To add/update: {len(values_list)}")
-        
-        # Alternative approach: Delete existing and insert fresh
-        # This avoids unique constraint issues between SKU and barcode
-        if values_list:
-            # First, delete all products that match SKUs in the import
-            skus_to_import = [v['sku'] for v in values_list]
-            await db.execute(
-                delete(ProductDB).where(ProductDB.sku.in_(skus_to_import))
-            )
-            
-            # Also delete by barcode to avoid conflicts
-            barcodes_to_import = [v['barcode'] for v in values_list if v.get('barcode')]
-            if barcodes_to_import:
-                await db.execute(
-                    delete(ProductDB).where(ProductDB.barcode.in_(barcodes_to_import))
-                )
-            
-            # Now insert all products fresh
-            from sqlalchemy import insert as sql_insert
-            stmt = sql_insert(ProductDB).values(values_list)
-            
-            await db.execute(stmt)
-            await db.commit()
-            print("DEBUG: Commit successful")
-            
-        return {
-            "success": True, 
-            "message": f"Processed {len(values_list)} products",
-            "count": len(values_list),
-            "inserted": len(values_list), # We treat upserts as 'success'
-            "updated": 0
-        }
-        
+        result = await run()
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Import failed: {str(e)}")
     except Exception as e:
-        print(f"Import Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Product import failed: {e}")
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    return {
+        "success": True,
+        "message": f"Processed {result['inserted'] + result['updated']} products",
+        "count": result['inserted'] + result['updated'],
+        **result
+    }
+
+
+@api_router.post("/admin/products/bulk-load")
+async def bulk_load_products_endpoint(
+    file: UploadFile = File(...),
+    background: bool = True,
+    owner: UserDB = Depends(get_owner)
+):
+    """COPY-based load of a large product CSV (import format), merged by SKU in one transaction"""
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV file.")
+
+    path = await save_upload_to_temp(file, ".csv")
+
+    async def run(job=None) -> dict:
+        try:
+            report = await bulk_load_products(path)
+        finally:
+            os.remove(path)
+        await invalidate_catalog()
+        return report.to_dict()
+
+    if background:
+        job = await job_registry.start("product_bulk_load", run)
+        return {"success": True, "job_id": job.id, "status": job.status}
+
+    try:
+        return {"success": True, **(await run())}
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Bulk load failed: {str(e)}")
+    except Exception as e:
+        logger.error(f"Product bulk load failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Bulk load failed: {str(e)}")
+
+
+@api_router.get("/admin/jobs/{job_id}")
+async def get_job_status(job_id: str, owner: UserDB = Depends(get_owner)):
+    """Progress and result of a background admin job"""
+    job = await job_registry.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 class BulkDeleteRequest(BaseModel):
@@ -2234,6 +2077,7 @@ async def bulk_delete_products(
             delete(ProductDB).where(ProductDB.id.in_(valid_uuids))
         )
         await db.commit()
+        await invalidate_catalog()
         
         return {
             "success": True, 
@@ -2248,103 +2092,38 @@ async def bulk_delete_products(
 
 @api_router.get("/admin/products/export")
 async def export_products(
-    owner: UserDB = Depends(get_owner),
-    db: AsyncSession = Depends(get_db)
+    category: Optional[str] = None,
+    product_status: Optional[str] = Query(None, alias="status"),
+    updated_since: Optional[datetime] = None,
+    gzip: bool = False,
+    owner: UserDB = Depends(get_owner)
 ):
-    """Export all products to CSV"""
-    import csv
-    import io
-    from fastapi.responses import StreamingResponse
-
-    # Fetch all products
-    stmt = select(ProductDB).order_by(ProductDB.created_at.desc())
-    result = await db.execute(stmt)
-    products = result.scalars().all()
-
-    # Create CSV content
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Headers match import format
-    headers = [
-        'sku', 'barcode', 'hsnCode', 'name', 'description',
-        'category', 'subcategory', 'tags', 'status', 'metal',
-        'purity', 'grossWeight', 'netWeight', 'stoneWeight',
-        'stoneType', 'stoneQuality', 'sellingPrice', 'netPrice',
-        'costGold', 'costStone', 'costMaking', 'costOther',
-        'stockQuantity', 'lowStockThreshold'
-    ]
-    writer.writerow(headers)
-
-    for p in products:
-        writer.writerow([
-            p.sku,
-            p.barcode,
-            p.hsn_code,
-            p.name,
-            p.description,
-            p.category,
-            p.subcategory,
-            ",".join(p.tags) if p.tags else "",
-            p.status,
-            p.metal,
-            p.purity,
-            float(p.gross_weight) if p.gross_weight else 0.0,
-            float(p.net_weight) if p.net_weight else 0.0,
-            float(p.stone_weight) if p.stone_weight else 0.0,
-            p.stone_type,
-            p.stone_quality,
-            float(p.selling_price),
-            float(p.price) if p.price else float(p.selling_price),
-            float(p.cost_gold) if p.cost_gold else 0.0,
-            float(p.cost_stone) if p.cost_stone else 0.0,
-            float(p.cost_making) if p.cost_making else 0.0,
-            float(p.cost_other) if p.cost_other else 0.0,
-            p.stock_quantity,
-            p.low_stock_threshold
-        ])
-
-    output.seek(0)
-    
-    filename = f"products_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    
+    """Stream products as CSV (import format), optionally filtered and gzip-compressed"""
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        stream_products_csv(category, product_status, updated_since, compress=gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={export_filename(gzip)}"}
     )
 
 @api_router.get("/admin/products")
 async def get_products(
     limit: Optional[int] = Query(None, le=1000),
     offset: int = 0,
+    cursor: Optional[str] = None,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
     """Get all products for admin dashboard"""
     # Fetch products with newest first
-    stmt = select(ProductDB).order_by(ProductDB.created_at.desc())
-    if limit is not None:
-        stmt = stmt.limit(limit).offset(offset)
+    limit = resolve_page_limit(limit, cursor)
+    stmt = keyset_paginate(select(ProductDB), [ProductDB.created_at, ProductDB.id], cursor, limit)
+    if cursor is None and limit is not None:
+        stmt = stmt.offset(offset)
     result = await db.execute(stmt)
-    products = result.scalars().all()
-
-    # Calculate reserved quantities from pending/processing orders
-    reserved_map = {}
-    stmt_orders = select(OrderDB).where(OrderDB.status.in_(['pending', 'processing']))
-    result_orders = await db.execute(stmt_orders)
-    active_orders = result_orders.scalars().all()
-    
-    for order in active_orders:
-        if order.items:
-            for item in order.items:
-                # item is a dict stored in JSON column
-                pid = item.get('id') 
-                qty = int(item.get('quantity', 0))
-                if pid:
-                    reserved_map[str(pid)] = reserved_map.get(str(pid), 0) + qty
+    rows, next_cursor = split_page(result.all(), limit)
+    products = [row[0] for row in rows]
     
-    return [
+    return page_response([
         {
             "id": str(p.id),
             "sku": p.sku,
@@ -2376,8 +2155,8 @@ async def get_products(
             "profitMargin": float(p.profit_margin) if p.profit_margin else 0.0,
             "marginPercent": float(p.margin_percent) if p.margin_percent else 0.0,
             "stockQuantity": p.stock_quantity,
-            "reserved": reserved_map.get(str(p.id), 0),
-            "onHand": p.stock_quantity + reserved_map.get(str(p.id), 0),
+            "reserved": p.reserved_quantity or 0,
+            "onHand": p.stock_quantity + (p.reserved_quantity or 0),
             "lowStockThreshold": p.low_stock_threshold,
             "inStock": p.in_stock,
             "vendorName": p.vendor_name,
@@ -2386,7 +2165,7 @@ async def get_products(
             "rating": 5.0 # Placeholder
         }
         for p in products
-    ]
+    ], next_cursor, cursor)
 
 @api_router.get("/admin/products/summary")
 async def get_products_summary_admin(
@@ -2533,6 +2312,7 @@ async def update_product(
             product.tags = product_data.get("tags", [])
             
         await db.commit()
+        await invalidate_catalog()
         
         return {"success": True, "message": "Product updated successfully", "id": str(product.id)}
         
@@ -2600,6 +2380,7 @@ async def create_product(
         
         db.add(new_product)
         await db.commit()
+        await invalidate_catalog()
         
         return {"success": True, "message": "Product created successfully", "id": str(new_product.id)}
         
@@ -2946,27 +2727,94 @@ class OrderCreate(BaseModel):
 #     """Deprecated: Use send_email directly"""
 #     await send_email(to_email, subject, body, is_html=True)
 
+# Orders in these statuses hold stock that is reserved but not yet fulfilled
+RESERVED_ORDER_STATUSES = ('pending', 'processing')
+
+async def adjust_reserved_quantities(db: AsyncSession, items: list, direction: int):
+    """Reserve (+1) or release (-1) an order's line quantities on products.reserved_quantity"""
+    totals = {}
+    for item in items or []:
+        pid = item.get('id') or item.get('productId')
+        if not pid:
+            continue
+        try:
+            product_id = uuid_lib.UUID(str(pid))
+        except ValueError:
+            # Custom/legacy line items have no product to reserve
+            logger.warning(f"Skipping reservation for invalid product id {pid!r}")
+            continue
+        totals[product_id] = totals.get(product_id, 0) + int(item.get('quantity', 0))
+    
+    # Sorted to take row locks in the same order as place_order
+    for product_id, qty in sorted(totals.items(), key=lambda entry: str(entry[0])):
+        reserved = (await db.execute(
+            select(ProductDB.reserved_quantity).where(ProductDB.id == product_id).with_for_update()
+        )).scalar_one_or_none()
+        if reserved is None:
+            continue
+        if reserved + direction * qty < 0:
+            logger.warning(
+                f"reserved_quantity drift on product {product_id}: releasing {qty} with only {reserved} reserved"
+            )
+        await db.execute(
+            update(ProductDB)
+            .where(ProductDB.id == product_id)
+            .values(reserved_quantity=func.greatest(ProductDB.reserved_quantity + direction * qty, 0))
+            .execution_options(synchronize_session=False)
+        )
+
+async def set_order_status(db: AsyncSession, order: OrderDB, new_status: str):
+    """Change an order's status, keeping reserved stock counters in step"""
+    was_reserved = order.status in RESERVED_ORDER_STATUSES
+    now_reserved = new_status in RESERVED_ORDER_STATUSES
+    if was_reserved != now_reserved:
+        await adjust_reserved_quantities(db, order.items, 1 if now_reserved else -1)
+    order.status = new_status
+
+def build_order_line(order_id, channel: str, product: ProductDB, quantity: int, unit_price: float, created_at=None) -> OrderLineDB:
+    """Normalized order line, added to the session alongside the order itself"""
+    return OrderLineDB(
+        order_id=order_id,
+        product_id=product.id,
+        sku=product.sku,
+        name=product.name,
+        quantity=quantity,
+        unit_price=unit_price,
+        cost_gold=product.cost_gold,
+        cost_stone=product.cost_stone,
+        cost_making=product.cost_making,
+        cost_other=product.cost_other,
+        unit_cost=product.total_cost,
+        channel=channel,
+        created_at=created_at or datetime.now(timezone.utc)
+    )
+
 @api_router.get("/admin/orders")
 async def get_admin_orders(
-    status: str = None,
+    order_status: str = Query(None, alias="status"),
+    limit: Optional[int] = Query(None, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all orders for admin dashboard"""
-    stmt = select(OrderDB).order_by(OrderDB.created_at.desc())
+    """Get orders for admin dashboard, newest first (pass `cursor` for keyset pages)"""
+    stmt = select(OrderDB)
     
-    if status and status != 'all':
-        if status == 'paid':
+    if order_status and order_status != 'all':
+        if order_status == 'paid':
             stmt = stmt.where(OrderDB.payment_status == 'paid')
-        elif status == 'pending':
+        elif order_status == 'pending':
             stmt = stmt.where(OrderDB.payment_status == 'pending')
         else:
-            stmt = stmt.where(OrderDB.status == status)
+            stmt = stmt.where(OrderDB.status == order_status)
 
+    limit = resolve_page_limit(limit, cursor)
+    stmt = keyset_paginate(stmt, [OrderDB.created_at, OrderDB.id], cursor, limit)
     result = await db.execute(stmt)
-    orders = result.scalars().all()
+    rows, next_cursor = split_page(result.all(), limit)
+    orders = [row[0] for row in rows]
     
-    return [
+    return page_response([
         {
             "id": str(o.id),
             "order_number": o.order_number,
@@ -2983,7 +2831,7 @@ async def get_admin_orders(
             "shippingAddress": o.shipping_address
         }
         for o in orders
-    ]
+    ], next_cursor, cursor)
 
 @api_router.get("/admin/orders/{order_id}")
 async def get_admin_order_detail(
@@ -3024,7 +2872,8 @@ async def update_order_status(
     db: AsyncSession = Depends(get_db)
 ):
     """Update order status"""
-    result = await db.execute(select(OrderDB).where(OrderDB.id == order_id))
+    # Locked so concurrent status changes cannot both adjust the reservation
+    result = await db.execute(select(OrderDB).where(OrderDB.id == order_id).with_for_update())
     order = result.scalar_one_or_none()
     
     if not order:
@@ -3032,13 +2881,14 @@ async def update_order_status(
         
     if "status" in status_data:
         new_status = status_data["status"]
-        order.status = new_status
+        await set_order_status(db, order, new_status)
         
         # Auto-update payment status for logical consistency
         if new_status in ['delivered', 'paid']:
             order.payment_status = 'paid'
         elif new_status == 'pending':
             order.payment_status = 'pending'
+        await refresh_sales_for_orders(db, order)
             
     await db.commit()
     return {"success": True, "status": order.status}
@@ -3077,8 +2927,10 @@ async def create_manual_order(
     """Manually create an order from admin panel"""
     import uuid
     
-    # Generate Order Number early
+    # Generate Order Number (and ID, shared with order lines) early
     order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+    order_id = uuid.uuid4()
+    created_at = datetime.now(timezone.utc)
     
     # 1. Get or Create Customer
     # For manual orders, we might not want to enforce full auth user creation if it's just a walk-in,
@@ -3151,6 +3003,7 @@ async def create_manual_order(
             "quantity": item.quantity,
             "image": product.images[0] if product.images else None
         })
+        db.add(build_order_line(order_id, order_data.channel, product, item.quantity, price, created_at))
         
     # 3. Create Order
     # Apply discount
@@ -3159,13 +3012,12 @@ async def create_manual_order(
     gross_profit = grand_total - total_cost
     
     # Generate Order Number (Already generated at top)
-    from datetime import datetime
     
     # Prepare shipping address dict if provided
     shipping_addr_dict = order_data.shipping_address.dict() if order_data.shipping_address else None
 
     new_order = OrderDB(
-        id=uuid.uuid4(),
+        id=order_id,
         order_number=order_number,
         channel=order_data.channel,
         customer_id=str(customer.id),
@@ -3184,11 +3036,15 @@ async def create_manual_order(
         payment_method=order_data.payment_method,
         fulfillment_status=order_data.fulfillment_status,
         shipping_address=shipping_addr_dict,
-        created_at=datetime.utcnow()
+        created_at=created_at
     )
     
     db.add(new_order)
+    if new_order.status in RESERVED_ORDER_STATUSES:
+        await adjust_reserved_quantities(db, line_items, 1)
+    await refresh_sales_for_orders(db, new_order)
     await db.commit()
+    await invalidate_catalog()
     await db.refresh(new_order)
     
     return {"success": True, "order_id": str(new_order.id), "order_number": new_order.order_number}
@@ -3206,7 +3062,7 @@ async def cancel_order(
     """Cancel an order"""
     # include items relationship to restore stock
     result = await db.execute(
-        select(OrderDB).where(OrderDB.id == order_id)
+        select(OrderDB).where(OrderDB.id == order_id).with_for_update()
     )
     order = result.scalar_one_or_none()
     
@@ -3235,8 +3091,10 @@ async def cancel_order(
                  if product.stock_quantity > 0:
                      product.in_stock = True
     
-    order.status = 'cancelled'
+    await set_order_status(db, order, 'cancelled')
+    await refresh_sales_for_orders(db, order)
     await db.commit()
+    await invalidate_catalog()
     return {"success": True, "status": "cancelled"}
 
 @api_router.post("/orders")
@@ -3250,7 +3108,6 @@ async def place_order(
     try:
         import uuid as uuid_lib
         from datetime import datetime, timezone
-        from sqlalchemy import or_
         now = datetime.now(timezone.utc)
         
         # 0. Idempotency Check
@@ -3266,6 +3123,7 @@ async def place_order(
                 }
 
         order_number = f"ORD-{uuid_lib.uuid4().hex[:8].upper()}"
+        order_id = uuid_lib.uuid4()
 
         # 1. Atomic Inventory Check & Lock
         sorted_items = sorted(order_data.items, key=lambda x: x.productId)
@@ -3312,6 +3170,7 @@ async def place_order(
                 "image": product.image,
                 "category": product.category
             })
+            db.add(build_order_line(order_id, "online", product, item.quantity, float(product.selling_price), now))
             
             # Deduct Stock
             qty_change = -item.quantity
@@ -3374,7 +3233,7 @@ async def place_order(
         grand_total = float(total_amount - discount_amount) + shipping_cost
         
         new_order = OrderDB(
-            id=uuid_lib.uuid4(),
+            id=order_id,
             order_number=order_number,
             idempotency_key=order_data.idempotencyKey,
             customer_id=str(current_user.id),
@@ -3402,78 +3261,23 @@ async def place_order(
             channel="online"
         )
         
+        # Confirmation email: queued in the order's transaction, sent once it commits
+        email_body = render(
+            "order_confirmation.html",
+            customer_name=current_user.full_name, order_number=order_number, items=items_json,
+            subtotal=total_amount, discount=discount_amount, shipping=shipping_cost, grand_total=grand_total
+        )
+        await enqueue_email(current_user.email, f"Order Confirmation #{order_number}", email_body,
+                            kind="order_confirmation", db=db)
+
         db.add(new_order)
+        if new_order.status in RESERVED_ORDER_STATUSES:
+            await adjust_reserved_quantities(db, items_json, 1)
+        await refresh_sales_for_orders(db, new_order)
         await db.commit()
+        await invalidate_catalog()
         await db.refresh(new_order)
         
-        # 3. Send Email
-        # Construct email body with details
-        items_html = ""
-        for item in items_json:
-            item_total = item['price'] * item['quantity']
-            items_html += f"""
-            <tr>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">{item['name']}</td>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">{item['quantity']}</td>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">₹{item['price']}</td>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">₹{item_total}</td>
-            </tr>
-            """
-            
-        discount_row = ""
-        if discount_amount > 0:
-            discount_row = f"""
-            <tr>
-                <td colspan="3" style="text-align: right; padding: 8px;"><strong>Discount:</strong></td>
-                <td style="padding: 8px; color: green;">-₹{discount_amount}</td>
-            </tr>
-            """
-            
-        email_body = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #eee;">
-            <h1 style="color: #333; text-align: center;">Order Confirmation</h1>
-            <p>Dear {current_user.full_name},</p>
-            <p>Thank you for your order! Your order number is <strong>{order_number}</strong>.</p>
-            
-            <h3 style="border-bottom: 2px solid #c4ad94; padding-bottom: 10px; margin-top: 30px;">Order Details</h3>
-            <table style="width: 100%; border-collapse: collapse; margin-bottom: 20px;">
-                <thead>
-                    <tr style="background-color: #f8f8f8;">
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Product</th>
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Qty</th>
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Price</th>
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Total</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {items_html}
-                </tbody>
-                <tfoot>
-                    <tr>
-                        <td colspan="3" style="text-align: right; padding: 8px; border-top: 1px solid #ddd;"><strong>Subtotal:</strong></td>
-                        <td style="padding: 8px; border-top: 1px solid #ddd;">₹{total_amount}</td>
-                    </tr>
-                    {discount_row}
-                    <tr>
-                        <td colspan="3" style="text-align: right; padding: 8px;"><strong>Shipping:</strong></td>
-                        <td style="padding: 8px;">₹{shipping_cost}</td>
-                    </tr>
-                    <tr style="background-color: #f8f8f8;">
-                        <td colspan="3" style="text-align: right; padding: 12px; font-size: 1.1em;"><strong>Grand Total:</strong></td>
-                        <td style="padding: 12px; font-size: 1.1em;"><strong>₹{grand_total}</strong></td>
-                    </tr>
-                </tfoot>
-            </table>
-            
-            <p style="margin-top: 20px;">We will notify you when your order is shipped.</p>
-            <br>
-            <p style="color: #666; font-size: 0.9em;">Best regards,<br>The Annya Jewellers Team</p>
-        </div>
-        """
-        # Use simple background task wrapper to match async signature if needed, 
-        # or just pass the async function to BackgroundTasks (FastAPI supports it)
-        background_tasks.add_task(send_email_via_vercel, to_email=current_user.email, subject=f"Order Confirmation #{order_number}", body=email_body)
-        
         # 4. Auto-save Address to Profile
         if order_data.shippingAddress:
             current_user.address = order_data.shippingAddress.address
@@ -3687,18 +3491,23 @@ async def get_my_returns(
 
 @api_router.get("/admin/returns")
 async def get_all_returns(
-    status: Optional[str] = None,
+    return_status: Optional[str] = Query(None, alias="status"),
+    limit: Optional[int] = Query(None, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     owner: UserDB = Depends(get_owner)
 ):
     """Get all return requests for admin"""
-    query = select(ReturnRequestDB).order_by(ReturnRequestDB.created_at.desc())
-    if status:
-        query = query.where(ReturnRequestDB.status == status)
+    query = select(ReturnRequestDB)
+    if return_status:
+        query = query.where(ReturnRequestDB.status == return_status)
     
+    limit = resolve_page_limit(limit, cursor)
+    query = keyset_paginate(query, [ReturnRequestDB.created_at, ReturnRequestDB.id], cursor, limit)
     result = await db.execute(query)
-    returns = result.scalars().all()
-    return [
+    rows, next_cursor = split_page(result.all(), limit)
+    returns = [row[0] for row in rows]
+    return page_response([
         {
             "id": str(r.id),
             "orderId": str(r.order_id),
@@ -3711,7 +3520,7 @@ async def get_all_returns(
             "createdAt": r.created_at.isoformat() if r.created_at else None
         }
         for r in returns
-    ]
+    ], next_cursor, cursor)
 
 class ReturnAction(BaseModel):
     action: str  # approve, reject
@@ -3744,11 +3553,12 @@ async def process_return(
         
         # Update order status
         order_result = await db.execute(
-            select(OrderDB).where(OrderDB.id == return_request.order_id)
+            select(OrderDB).where(OrderDB.id == return_request.order_id).with_for_update()
         )
         order = order_result.scalar_one_or_none()
         if order:
-            order.status = 'return_approved'
+            await set_order_status(db, order, 'return_approved')
+            await refresh_sales_for_orders(db, order)
             
     elif action_data.action == 'reject':
         return_request.status = 'rejected'
@@ -3776,16 +3586,14 @@ class ServiceabilityRequest(BaseModel):
 
 @api_router.post("/shipping/check-serviceability")
 async def check_serviceability(data: ServiceabilityRequest, current_user: UserDB = Depends(get_current_user)):
-    """Check if delivery is available for a pincode"""
-    from shiprocket_client import shiprocket
+    """Check if delivery is available for a pincode (cached per pincode pair and weight band)"""
     try:
-        result = shiprocket.check_serviceability(
-            pickup_postcode=data.pickup_pincode,
-            delivery_postcode=data.delivery_pincode,
+        return await serviceability_cache.check(
+            pickup_pincode=data.pickup_pincode,
+            delivery_pincode=data.delivery_pincode,
             weight=data.weight,
             cod=data.cod
         )
-        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3798,50 +3606,56 @@ async def ship_order(
     """Create a shipment in Shiprocket for an order"""
     from shiprocket_client import shiprocket
     
-    # Get Order
-    result = await db.execute(select(OrderDB).where(OrderDB.id == order_id))
+    # Get Order, and claim it so the row lock is released before the courier call
+    result = await db.execute(select(OrderDB).where(OrderDB.id == order_id).with_for_update())
     order = result.scalar_one_or_none()
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-        
-    # Prepare data
-    shipping = order.shipping_address or {}
-    order_data = {
-        "order_id": order.order_number,
-        "order_date": order.created_at.strftime("%Y-%m-%d %H:%M"),
-        "customer_name": shipping.get("firstName", "") + " " + shipping.get("lastName", ""),
-        "address": shipping.get("address", ""),
-        "city": shipping.get("city", ""),
-        "pincode": shipping.get("postalCode", ""),
-        "state": shipping.get("state", ""),
-        "email": "customer@example.com", # Should be real email from UserDB
-        "phone": shipping.get("phone", ""),
-        "payment_method": "Prepaid", # Simplified
-        "sub_total": float(order.subtotal or 0),
-        "items": [
-            {
-                "name": item.get("name"),
-                "sku": item.get("id"),
-                "units": item.get("quantity"),
-                "selling_price": item.get("price")
-            }
-            for item in order.items
-        ]
-    }
+    blocker = shipment_blocker(order)
+    if blocker:
+        raise HTTPException(status_code=400, detail=blocker)
+    
+    lines_result = await db.execute(select(OrderLineDB).where(OrderLineDB.order_id == order.id))
+    order_data = build_shipment_order_data(order, lines_result.scalars().all())
+    claim_for_shipment(order)
+    await db.commit()
     
     try:
-        response = shiprocket.create_order(order_data)
-        
-        # Save tracking details if successful
-        if response.get("order_id"):
-            order.status = "processing" # Update status
-            # In a real app, save 'shipment_id' and 'awb_code' to DB
-            await db.commit()
-            
-        return response
+        response = await shiprocket.create_order(order_data)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        response = e
+    
+    # Save tracking details if successful (and release the claim either way)
+    try:
+        await complete_shipment(db, order.id, response, set_order_status)
+    except Exception as e:
+        logger.error(f"Courier answered {response!r} for order {order_id} but it could not be recorded: {e}")
+        raise HTTPException(status_code=500, detail=f"Shipment could not be recorded: {e}")
+    if isinstance(response, Exception):
+        raise HTTPException(status_code=500, detail=str(response))
+    return response
+
+class BulkShipRequest(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_SHIP_ORDERS)
+
+@api_router.post("/admin/orders/bulk-ship")
+async def bulk_ship(
+    data: BulkShipRequest,
+    background: bool = True,
+    owner: UserDB = Depends(get_owner)
+):
+    """Ship many orders at once; returns per-order results (or a job id to poll)"""
+    if not background:
+        return await bulk_ship_orders(data.order_ids, set_order_status)
+
+    async def run(job) -> dict:
+        def on_progress(results):
+            job.update(processed=len(results), shipped=sum(1 for r in results if r["success"]))
+        return await bulk_ship_orders(data.order_ids, set_order_status, on_progress)
+
+    job = await job_registry.start("bulk_ship", run, total=len(data.order_ids))
+    return {"success": True, "job_id": job.id, "status": job.status}
 
 # -------------------------------------------------------------------------
 # Abandoned Cart System (Guest & Logged-in Users)
@@ -3982,7 +3796,7 @@ async def update_abandoned_cart_settings(
 
 @api_router.get("/admin/abandoned-carts")
 async def get_abandoned_carts(
-    status: Optional[str] = "active",
+    cart_status: Optional[str] = Query("active", alias="status"),
     timing: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     owner: UserDB = Depends(get_owner)
@@ -4000,13 +3814,14 @@ async def get_abandoned_carts(
         setting_row = settings_res.scalar_one_or_none()
         minutes = int(setting_row.value) if setting_row else 15
         
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    now = datetime.now(timezone.utc)
+    reminder_delay = timedelta(minutes=minutes)
     
     query = select(AbandonedCartDB).order_by(AbandonedCartDB.updated_at.desc())
     
-    if status == "active":
+    if cart_status == "active":
         query = query.where(AbandonedCartDB.status == 'active')
-    elif status == "converted":
+    elif cart_status == "converted":
         query = query.where(AbandonedCartDB.status == 'converted')
     # 'all' = no filter
     
@@ -4024,7 +3839,7 @@ async def get_abandoned_carts(
             "reminderCount": c.reminder_count,
             "lastReminderAt": c.last_reminder_at.isoformat() if c.last_reminder_at else None,
             "status": c.status,
-            "eligibleForReminder": bool(c.updated_at and c.updated_at < cutoff and c.reminder_count < 3),
+            "eligibleForReminder": is_due(c, now, reminder_delay),
             "createdAt": c.created_at.isoformat() if c.created_at else None,
             "updatedAt": c.updated_at.isoformat() if c.updated_at else None
         }
@@ -4036,16 +3851,32 @@ async def send_test_email(
     email: EmailStr = Body(..., embed=True),
     owner: UserDB = Depends(get_owner)
 ):
-    """Send a test email using SMTP configuration."""
-    sent = await send_email_via_vercel(
-        to_email=email,
-        subject="Test Email - Annya Jewellers",
-        body="<p>This is a test email from the SMTP configuration.</p>"
-    )
-    if not sent:
-        raise HTTPException(status_code=500, detail="SMTP send failed. Check server logs for details.")
+    """Send a test email using SMTP configuration (directly, bypassing the outbox)."""
+    try:
+        await mail_worker.send_now(
+            email, "Test Email - Annya Jewellers", "<p>This is a test email from the SMTP configuration.</p>"
+        )
+    except Exception as e:
+        logger.error(f"Test email failed: {e}")
+        raise HTTPException(status_code=500, detail=f"SMTP send failed: {e}")
     return {"success": True}
 
+@api_router.get("/admin/email/outbox")
+async def get_email_outbox_stats(owner: UserDB = Depends(get_owner)):
+    """Outbox counts by status and the mail worker's counters"""
+    return await mail_worker.stats()
+
+class RequeueEmailsRequest(BaseModel):
+    ids: Optional[List[str]] = None
+
+@api_router.post("/admin/email/outbox/requeue")
+async def requeue_dead_letter_emails(
+    data: RequeueEmailsRequest = Body(default=RequeueEmailsRequest()),
+    owner: UserDB = Depends(get_owner)
+):
+    """Retry dead-lettered emails (all of them, or the given ids)"""
+    return {"success": True, "requeued": await requeue_dead_emails(data.ids)}
+
 @api_router.post("/admin/abandoned-carts/send-reminders")
 async def send_abandoned_cart_reminders(
     timing: Optional[int] = None,
@@ -4054,7 +3885,8 @@ async def send_abandoned_cart_reminders(
 ):
     """
     Send reminder emails to all eligible abandoned carts.
-    Eligibility: active, not updated past timing threshold, less than 3 reminders sent
+    Eligibility: active, idle past the timing threshold, and the next escalation
+    step is due (see cart_reminders.py)
     """
     from datetime import timedelta
     
@@ -4068,140 +3900,41 @@ async def send_abandoned_cart_reminders(
         setting_row = settings_res.scalar_one_or_none()
         minutes = int(setting_row.value) if setting_row else 15
 
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    
-    result = await db.execute(
-        select(AbandonedCartDB)
-        .where(
-            AbandonedCartDB.status == 'active',
-            AbandonedCartDB.updated_at < cutoff,
-            AbandonedCartDB.reminder_count < 3
-        )
-        .limit(50)
-    )
-    carts = result.scalars().all()
-    
-    sent_count = 0
-    errors = []
-    
-    for cart in carts:
-        try:
-            # Build email content
-            items_html = ""
-            for item in (cart.items or []):
-                items_html += f"""
-                <tr>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                        <img src="{item.get('image', '')}" width="60" height="60" style="border-radius: 4px;" />
-                    </td>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                        {item.get('name', 'Product')}
-                    </td>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                        ₹{item.get('price', 0):,.0f}
-                    </td>
-                </tr>
-                """
-            
-            email_body = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-                <h1 style="color: #c4ad94; text-align: center;">You left something behind!</h1>
-                
-                <p>Hi {cart.customer_name or 'there'},</p>
-                
-                <p>We noticed you left some beautiful items in your cart. They're waiting for you!</p>
-                
-                <table style="width: 100%; margin: 20px 0;">
-                    {items_html}
-                </table>
-                
-                <p style="text-align: center; font-size: 18px;">
-                    <strong>Cart Total: ₹{float(cart.cart_total):,.0f}</strong>
-                </p>
-                
-                <div style="text-align: center; margin: 30px 0;">
-                    <a href="https://annyajewellers.com/cart" 
-                       style="background: #c4ad94; color: white; padding: 15px 30px; 
-                              text-decoration: none; border-radius: 5px; font-weight: bold;">
-                        Complete Your Purchase
-                    </a>
-                </div>
-                
-                <p style="color: #666; font-size: 12px; text-align: center;">
-                    If you have any questions, reply to this email or call us at +91 9100496169
-                </p>
-                
-                <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;" />
-                
-                <p style="color: #999; font-size: 11px; text-align: center;">
-                    Annya Jewellers | Hyderabad, India<br/>
-                    <a href="https://annyajewellers.com" style="color: #c4ad94;">www.annyajewellers.com</a>
-                </p>
-            </div>
-            """
-            
-            # Send email via Vercel
-            await send_email_via_vercel(
-                to_email=cart.email,
-                subject=f"Your cart is waiting for you - Annya Jewellers",
-                body=email_body
-            )
-            
-            # Update reminder tracking
-            cart.reminder_count += 1
-            cart.last_reminder_at = datetime.now(timezone.utc)
-            sent_count += 1
-            
-        except Exception as e:
-            errors.append({"email": cart.email, "error": str(e)})
-    
-    await db.commit()
+    result = await reminder_engine.send_due_reminders(first_delay=timedelta(minutes=minutes))
     
     return {
         "success": True,
-        "sent": sent_count,
-        "errors": errors
+        "sent": result["queued"],
+        "errors": result["errors"]
     }
 
+@api_router.get("/admin/abandoned-carts/reminder-stats")
+async def get_abandoned_cart_reminder_stats(owner: UserDB = Depends(get_owner)):
+    """Reminder engine throughput and the backlog of due carts by step"""
+    return await reminder_engine.stats()
+
 @api_router.post("/admin/abandoned-carts/{cart_id}/send-reminder")
 async def send_single_reminder(
     cart_id: str,
     db: AsyncSession = Depends(get_db),
     owner: UserDB = Depends(get_owner)
 ):
-    """Send reminder to a specific abandoned cart"""
+    """Send the next reminder step to a specific abandoned cart"""
+    # Locked so a concurrent engine batch cannot send the same step
     result = await db.execute(
-        select(AbandonedCartDB).where(AbandonedCartDB.id == cart_id)
+        select(AbandonedCartDB).where(AbandonedCartDB.id == cart_id).with_for_update()
     )
     cart = result.scalar_one_or_none()
     
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     
-    # Build simplified email
-    items_list = ", ".join([item.get('name', 'Product') for item in (cart.items or [])[:3]])
-    
-    email_body = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-        <h1 style="color: #c4ad94;">Complete Your Order</h1>
-        <p>Hi {cart.customer_name or 'there'},</p>
-        <p>Your cart with {items_list}... is still waiting!</p>
-        <p><strong>Total: ₹{float(cart.cart_total):,.0f}</strong></p>
-        <p><a href="https://annyajewellers.com/cart" style="background: #c4ad94; color: white; padding: 10px 20px; text-decoration: none;">Complete Purchase</a></p>
-    </div>
-    """
-    
-    await send_email_via_vercel(
-        to_email=cart.email,
-        subject="Complete your order - Annya Jewellers",
-        body=email_body
-    )
-    
-    cart.reminder_count += 1
-    cart.last_reminder_at = datetime.now(timezone.utc)
+    step = await reminder_engine.queue_reminder(db, cart)
+    if step is None:
+        raise HTTPException(status_code=400, detail="All reminders have already been sent for this cart")
     await db.commit()
     
-    return {"success": True, "message": f"Reminder sent to {cart.email}"}
+    return {"success": True, "step": step, "message": f"Reminder {step} queued for {cart.email}"}
 
 # -------------------------------------------------------------------------
 # Inventory & Transfer Management (New)
@@ -4304,6 +4037,7 @@ async def adjust_inventory(
     )
     
     await db.commit()
+    await invalidate_catalog()
     return {"message": "Inventory adjusted successfully"}
 
 @api_router.get("/admin/locations")
@@ -4334,18 +4068,22 @@ async def create_location(
 
 @api_router.get("/admin/transfers")
 async def get_transfers(
+    limit: Optional[int] = Query(None, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
     """Get all stock transfers"""
-    stmt = select(TransferDB).order_by(TransferDB.created_at.desc())
+    limit = resolve_page_limit(limit, cursor)
+    stmt = keyset_paginate(select(TransferDB), [TransferDB.created_at, TransferDB.id], cursor, limit)
     result = await db.execute(stmt)
-    transfers = result.scalars().all()
+    rows, next_cursor = split_page(result.all(), limit)
+    transfers = [row[0] for row in rows]
     
     loc_result = await db.execute(select(LocationDB))
     locations = {str(l.id): l.name for l in loc_result.scalars().all()}
     
-    return [
+    return page_response([
         {
             "id": t.transfer_number,
             "uuid": str(t.id),
@@ -4359,7 +4097,7 @@ async def get_transfers(
             "created_at": t.created_at.isoformat()
         }
         for t in transfers
-    ]
+    ], next_cursor, cursor)
 
 @api_router.post("/admin/transfers")
 async def create_transfer(
@@ -4445,18 +4183,23 @@ class POCreate(BaseModel):
 
 @api_router.get("/admin/purchase-orders")
 async def get_purchase_orders(
-    status: Optional[str] = None,
+    po_status: Optional[str] = Query(None, alias="status"),
+    limit: Optional[int] = Query(None, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     owner: UserDB = Depends(get_owner),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(PurchaseOrderDB).order_by(PurchaseOrderDB.created_at.desc())
-    if status and status != 'all':
-        stmt = stmt.where(PurchaseOrderDB.status == status)
+    stmt = select(PurchaseOrderDB)
+    if po_status and po_status != 'all':
+        stmt = stmt.where(PurchaseOrderDB.status == po_status)
     
+    limit = resolve_page_limit(limit, cursor)
+    stmt = keyset_paginate(stmt, [PurchaseOrderDB.created_at, PurchaseOrderDB.id], cursor, limit)
     result = await db.execute(stmt)
-    pos = result.scalars().all()
+    rows, next_cursor = split_page(result.all(), limit)
+    pos = [row[0] for row in rows]
     
-    return [{
+    return page_response([{
         "id": str(po.id),
         "po_number": po.po_number,
         "vendor_name": po.vendor_name,
@@ -4466,7 +4209,7 @@ async def get_purchase_orders(
         "received_count": po.received_count,
         "created_at": po.created_at.isoformat(),
         "expected_date": po.expected_date.isoformat() if po.expected_date else None
-    } for po in pos]
+    } for po in pos], next_cursor, cursor)
 
 @api_router.post("/admin/purchase-orders")
 async def create_purchase_order(
@@ -4537,71 +4280,23 @@ async def create_purchase_order(
 # ============================================
 
 @app.get("/sitemap.xml")
-async def generate_sitemap(db: AsyncSession = Depends(get_db)):
-    """Generate dynamic sitemap.xml for SEO"""
-    from fastapi.responses import Response
-    from datetime import datetime
-    
-    base_url = os.getenv("FRONTEND_URL", "https://annyajewellers.com")
-    
-    # Static pages
-    static_pages = [
-        {"loc": "/", "priority": "1.0", "changefreq": "daily"},
-        {"loc": "/products", "priority": "0.9", "changefreq": "daily"},
-        {"loc": "/about", "priority": "0.7", "changefreq": "monthly"},
-        {"loc": "/contact", "priority": "0.7", "changefreq": "monthly"},
-        {"loc": "/faq", "priority": "0.6", "changefreq": "monthly"},
-        {"loc": "/book-appointment", "priority": "0.8", "changefreq": "weekly"},
-    ]
-    
-    # Get all active products
-    result = await db.execute(
-        select(ProductDB.id, ProductDB.updated_at)
-        .where(ProductDB.status == 'active')
-        .order_by(ProductDB.created_at.desc())
-        .limit(1000)
-    )
-    products = result.all()
-    
-    # Get all categories
-    cat_result = await db.execute(
-        select(ProductDB.category).distinct().where(ProductDB.status == 'active')
-    )
-    categories = [row[0] for row in cat_result.all() if row[0]]
-    
-    # Build XML
-    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    
-    # Add static pages
-    for page in static_pages:
-        xml += f"""  <url>
-    <loc>{base_url}{page["loc"]}</loc>
-    <changefreq>{page["changefreq"]}</changefreq>
-    <priority>{page["priority"]}</priority>
-  </url>\n"""
-    
-    # Add category pages
-    for cat in categories:
-        xml += f"""  <url>
-    <loc>{base_url}/products?category={cat.replace(" ", "%20")}</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>\n"""
-    
-    # Add product pages
-    for product_id, updated_at in products:
-        lastmod = updated_at.strftime("%Y-%m-%d") if updated_at else datetime.now().strftime("%Y-%m-%d")
-        xml += f"""  <url>
-    <loc>{base_url}/product/{product_id}</loc>
-    <lastmod>{lastmod}</lastmod>
-    <changefreq>weekly</changefreq>
-    <priority>0.6</priority>
-  </url>\n"""
-    
-    xml += '</urlset>'
-    
-    return Response(content=xml, media_type="application/xml")
+async def generate_sitemap(request: Request):
+    """Sitemap index pointing at the gzip page and product sitemaps"""
+    headers = versioned_headers(request, await sitemap_cache.version(), SITEMAP_CACHE_CONTROL)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    return Response(content=await sitemap_cache.index(), media_type="application/xml", headers=headers)
+
+@app.get("/sitemap-{name}.xml.gz")
+async def get_sitemap_file(name: str, request: Request):
+    """One gzip sub-sitemap (pages or products-<n>) listed in the sitemap index"""
+    headers = versioned_headers(request, await sitemap_cache.version(), SITEMAP_CACHE_CONTROL)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    content = await sitemap_cache.file(name)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    return Response(content=content, media_type="application/gzip", headers=headers)
 
 # ============================================
 # INVENTORY RESERVATION SYSTEM
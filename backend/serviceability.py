@@ -0,0 +1,249 @@
+"""
+Cached Shiprocket serviceability checks for POST /api/shipping/check-serviceability.
+
+Answers are keyed by (pickup pincode, delivery pincode, weight band, cod).
+Weights are rounded up to SERVICEABILITY_WEIGHT_BAND kg, and the rounded
+weight is what gets quoted, so one entry serves every cart in the band.
+
+Lookups go through three layers:
+
+1. an in-process LRU (SERVICEABILITY_MEMORY_TTL seconds);
+2. the shipping_serviceability table, valid for SERVICEABILITY_TTL_HOURS;
+3. a live Shiprocket call, single-flight per key. If it fails, an expired
+   row is served rather than failing checkout.
+
+warm_serviceability_cache() runs from the scheduler and refreshes entries
+for the SERVICEABILITY_WARM_TOP_N most common delivery pincodes of recent
+orders before they expire, so everyday pincodes never wait on Shiprocket.
+"""
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from cache import LRUCache
+from database import async_session_maker
+from db_models import ShippingServiceabilityDB
+
+logger = logging.getLogger(__name__)
+
+SERVICEABILITY_TTL_HOURS = float(os.getenv("SERVICEABILITY_TTL_HOURS", "24"))
+SERVICEABILITY_MEMORY_TTL = int(os.getenv("SERVICEABILITY_MEMORY_TTL", "600"))
+SERVICEABILITY_WEIGHT_BAND = Decimal(os.getenv("SERVICEABILITY_WEIGHT_BAND", "0.5"))
+
+PICKUP_PINCODE = os.getenv("SHIPROCKET_PICKUP_PINCODE")
+SERVICEABILITY_WARM_TOP_N = int(os.getenv("SERVICEABILITY_WARM_TOP_N", "200"))
+SERVICEABILITY_WARM_INTERVAL_HOURS = int(os.getenv("SERVICEABILITY_WARM_INTERVAL_HOURS", "6"))
+SERVICEABILITY_WARM_CONCURRENCY = int(os.getenv("SERVICEABILITY_WARM_CONCURRENCY", "4"))
+# Weight bands (kg) warmed for each pincode; most orders are a single piece of jewellery
+SERVICEABILITY_WARM_WEIGHTS = [
+    Decimal(w) for w in os.getenv("SERVICEABILITY_WARM_WEIGHTS", "0.5").split(",") if w.strip()
+]
+WARM_ORDER_DAYS = 90
+
+# (pickup pincode, delivery pincode, weight band, cod)
+ServiceabilityKey = Tuple[str, str, Decimal, int]
+
+
+def weight_band(weight: float) -> Decimal:
+    """Round a weight up to the next band (never below one band)"""
+    bands = max(1, math.ceil(Decimal(str(weight)) / SERVICEABILITY_WEIGHT_BAND))
+    return (SERVICEABILITY_WEIGHT_BAND * bands).quantize(Decimal("0.01"))
+
+
+def serviceability_key(pickup_pincode, delivery_pincode, weight: float, cod: int) -> ServiceabilityKey:
+    return (str(pickup_pincode).strip(), str(delivery_pincode).strip(), weight_band(weight), 1 if cod else 0)
+
+
+def is_cacheable(response: Any) -> bool:
+    """Serviceable and not-serviceable answers are cached; auth/server errors are not"""
+    return isinstance(response, dict) and ("data" in response or response.get("status") in (200, 404))
+
+
+class ServiceabilityCache:
+    def __init__(self, ttl_hours: float = SERVICEABILITY_TTL_HOURS, memory_ttl: float = SERVICEABILITY_MEMORY_TTL):
+        self.ttl = timedelta(hours=ttl_hours)
+        self._memory = LRUCache(ttl=memory_ttl, max_entries=5000)
+        self._inflight: Dict[ServiceabilityKey, asyncio.Task] = {}
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.live_fetches = 0
+        self.stale_served = 0
+        self.errors = 0
+
+    async def check(self, pickup_pincode, delivery_pincode, weight: float, cod: int = 0) -> Any:
+        key = serviceability_key(pickup_pincode, delivery_pincode, weight, cod)
+        now = datetime.now(timezone.utc)
+
+        entry = self._memory.get(key)
+        if entry is not None and entry[1] > now:
+            self.memory_hits += 1
+            return entry[0]
+
+        row = None
+        try:
+            row = await self._load(key)
+        except Exception as e:
+            # The cache table is an optimisation; fall through to Shiprocket
+            self.errors += 1
+            logger.warning(f"Serviceability cache read failed: {e}")
+        if row is not None and row.expires_at > now:
+            self.db_hits += 1
+            self._memory.set(key, (row.response, row.expires_at))
+            return row.response
+
+        try:
+            return await self.refresh(key)
+        except Exception as e:
+            if row is None:
+                raise
+            self.stale_served += 1
+            logger.warning(f"Shiprocket serviceability failed for {key[1]}, serving cached answer: {e}")
+            return row.response
+
+    async def refresh(self, key: ServiceabilityKey) -> Any:
+        """Fetch a live answer and store it; concurrent refreshes of a key share one call"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, key: ServiceabilityKey) -> Any:
+        from shiprocket_client import shiprocket
+
+        pickup, delivery, band, cod = key
+        self.live_fetches += 1
+        response = await shiprocket.check_serviceability(
+            pickup_postcode=pickup, delivery_postcode=delivery, weight=float(band), cod=cod
+        )
+        if is_cacheable(response):
+            fetched_at = datetime.now(timezone.utc)
+            expires_at = fetched_at + self.ttl
+            self._memory.set(key, (response, expires_at))
+            try:
+                await self._store(key, response, fetched_at, expires_at)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Serviceability cache write failed: {e}")
+        return response
+
+    async def _load(self, key: ServiceabilityKey) -> Optional[ShippingServiceabilityDB]:
+        pickup, delivery, band, cod = key
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(ShippingServiceabilityDB).where(
+                    ShippingServiceabilityDB.pickup_pincode == pickup,
+                    ShippingServiceabilityDB.delivery_pincode == delivery,
+                    ShippingServiceabilityDB.weight_band == band,
+                    ShippingServiceabilityDB.cod == cod,
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def _store(self, key: ServiceabilityKey, response: Any, fetched_at: datetime, expires_at: datetime):
+        pickup, delivery, band, cod = key
+        async with async_session_maker() as db:
+            stmt = pg_insert(ShippingServiceabilityDB).values(
+                pickup_pincode=pickup, delivery_pincode=delivery, weight_band=band, cod=cod,
+                response=response, fetched_at=fetched_at, expires_at=expires_at,
+            )
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=["pickup_pincode", "delivery_pincode", "weight_band", "cod"],
+                set_={
+                    "response": stmt.excluded.response,
+                    "fetched_at": stmt.excluded.fetched_at,
+                    "expires_at": stmt.excluded.expires_at,
+                }
+            ))
+            await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "live_fetches": self.live_fetches,
+            "stale_served": self.stale_served,
+            "errors": self.errors,
+            "memory_entries": len(self._memory),
+        }
+
+
+serviceability_cache = ServiceabilityCache()
+
+
+async def top_delivery_pincodes(limit: int = SERVICEABILITY_WARM_TOP_N, days: int = WARM_ORDER_DAYS) -> List[str]:
+    """Most frequent delivery pincodes of recent orders"""
+    async with async_session_maker() as db:
+        result = await db.execute(text("""
+            SELECT pincode FROM (
+                SELECT btrim(coalesce(shipping_address->>'postalCode', shipping_address->>'pincode')) AS pincode
+                FROM orders
+                WHERE created_at >= now() - make_interval(days => :days)
+                  AND shipping_address IS NOT NULL
+            ) o
+            WHERE pincode ~ '^[0-9]{6}$'
+            GROUP BY pincode
+            ORDER BY count(*) DESC
+            LIMIT :limit
+        """), {"days": days, "limit": limit})
+        return [pincode for (pincode,) in result.all()]
+
+
+async def warm_serviceability_cache():
+    """Scheduler job: refresh answers for the busiest delivery pincodes before they expire"""
+    if not PICKUP_PINCODE:
+        logger.info("SHIPROCKET_PICKUP_PINCODE is not set; skipping serviceability warm-up")
+        return
+    try:
+        pincodes = await top_delivery_pincodes()
+        keys = [
+            (PICKUP_PINCODE, pincode, weight_band(weight), cod)
+            for pincode in pincodes
+            for weight in SERVICEABILITY_WARM_WEIGHTS
+            for cod in (0, 1)
+        ]
+        if not keys:
+            return
+
+        # Skip entries that stay valid until well after the next run
+        fresh_until = datetime.now(timezone.utc) + timedelta(hours=SERVICEABILITY_WARM_INTERVAL_HOURS * 1.5)
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(ShippingServiceabilityDB.pickup_pincode, ShippingServiceabilityDB.delivery_pincode,
+                       ShippingServiceabilityDB.weight_band, ShippingServiceabilityDB.cod)
+                .where(
+                    ShippingServiceabilityDB.pickup_pincode == PICKUP_PINCODE,
+                    ShippingServiceabilityDB.delivery_pincode.in_(pincodes),
+                    ShippingServiceabilityDB.expires_at > fresh_until,
+                )
+            )
+            fresh = {(p, d, Decimal(b).quantize(Decimal("0.01")), c) for p, d, b, c in result.all()}
+        due = [key for key in keys if key not in fresh]
+
+        semaphore = asyncio.Semaphore(SERVICEABILITY_WARM_CONCURRENCY)
+        failures = 0
+
+        async def warm(key: ServiceabilityKey):
+            nonlocal failures
+            async with semaphore:
+                try:
+                    await serviceability_cache.refresh(key)
+                except Exception as e:
+                    failures += 1
+                    logger.warning(f"Serviceability warm-up failed for {key[1]}: {e}")
+
+        await asyncio.gather(*(warm(key) for key in due))
+        logger.info(
+            f"Serviceability warm-up: {len(pincodes)} pincodes, {len(due)} refreshed, "
+            f"{len(keys) - len(due)} still fresh, {failures} failed"
+        )
+    except Exception as e:
+        logger.error(f"Serviceability warm-up failed: {e}")
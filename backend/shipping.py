@@ -0,0 +1,250 @@
+"""
+Shipment creation for single and bulk "ship" actions.
+
+build_shipment_order_data() turns an order (and its order lines) into the
+data ShiprocketClient.create_order expects, and record_shipment() stores
+the courier's ids on the order; both are shared by
+POST /api/admin/orders/{id}/ship and the bulk endpoint.
+
+No row lock is held across a courier call. Shipping an order takes three
+steps:
+
+1. claim: in a short transaction, lock the order, check shipment_blocker()
+   and set shipment_claimed_at. A claimed order cannot be shipped again
+   while the courier call runs;
+2. the courier call, outside any transaction;
+3. complete_shipment(): lock the order again, record the courier's ids (or
+   just release the claim on failure) and commit right away, so a created
+   courier order is never lost to a later failure.
+
+bulk_ship_orders() ships many orders in batches of BULK_SHIP_BATCH_SIZE:
+each batch is claimed in one transaction (FOR UPDATE SKIP LOCKED, so two
+bulk runs never ship the same order), courier calls run concurrently up to
+BULK_SHIP_CONCURRENCY, and each order completes in its own transaction.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from database import async_session_maker
+from db_models import OrderDB, OrderLineDB
+from sales_rollup import refresh_sales_for_orders
+
+logger = logging.getLogger(__name__)
+
+BULK_SHIP_BATCH_SIZE = int(os.getenv("BULK_SHIP_BATCH_SIZE", "100"))
+BULK_SHIP_CONCURRENCY = int(os.getenv("BULK_SHIP_CONCURRENCY", "8"))
+MAX_BULK_SHIP_ORDERS = 1000
+
+# Orders in these states are never sent to the courier
+UNSHIPPABLE_STATUSES = ('cancelled', 'returned', 'delivered')
+SHIPPED_STATUS = "processing"
+# A claim left by a worker that died mid-call blocks re-shipping for this long,
+# so the courier panel can be checked before a retry could create a duplicate
+SHIPMENT_CLAIM_TIMEOUT = timedelta(minutes=30)
+
+
+def build_shipment_order_data(order: OrderDB, lines: List[OrderLineDB]) -> Dict[str, Any]:
+    """Courier order data for ShiprocketClient.create_order"""
+    if lines:
+        shipment_items = [
+            {
+                "name": line.name,
+                "sku": line.sku or str(line.product_id),
+                "units": line.quantity,
+                "selling_price": float(line.unit_price)
+            }
+            for line in lines
+        ]
+    else:
+        # Orders that predate order_lines and were not backfilled
+        shipment_items = [
+            {
+                "name": item.get("name"),
+                "sku": item.get("sku") or item.get("id"),
+                "units": item.get("quantity"),
+                "selling_price": item.get("price")
+            }
+            for item in order.items
+        ]
+
+    shipping = order.shipping_address or {}
+    return {
+        "order_id": order.order_number,
+        "order_date": order.created_at.strftime("%Y-%m-%d %H:%M"),
+        "customer_name": shipping.get("firstName", "") + " " + shipping.get("lastName", ""),
+        "address": shipping.get("address", ""),
+        "city": shipping.get("city", ""),
+        "pincode": shipping.get("postalCode") or shipping.get("pincode", ""),
+        "state": shipping.get("state", ""),
+        "email": order.customer_email or "customer@example.com",
+        "phone": shipping.get("phone") or order.customer_phone or "",
+        "payment_method": "Prepaid", # Simplified
+        "sub_total": float(order.subtotal or 0),
+        "items": shipment_items
+    }
+
+
+def shipment_blocker(order: OrderDB) -> Optional[str]:
+    """Why an order cannot be shipped, or None"""
+    if order.shipment_id or order.shiprocket_order_id:
+        return f"Order already has courier order {order.shiprocket_order_id or order.shipment_id}"
+    if order.status in UNSHIPPABLE_STATUSES:
+        return f"Order is {order.status}"
+    if order.shipment_claimed_at and order.shipment_claimed_at > datetime.now(timezone.utc) - SHIPMENT_CLAIM_TIMEOUT:
+        return "A shipment request for this order is already in progress"
+    return None
+
+
+def claim_for_shipment(order: OrderDB):
+    """Mark a locked, unblocked order as being shipped (commit before calling the courier)"""
+    order.shipment_claimed_at = datetime.now(timezone.utc)
+
+
+def record_shipment(order: OrderDB, response: Dict[str, Any]):
+    """Store the courier's ids from a create_order response on the order"""
+    order.shiprocket_order_id = str(response.get("order_id"))
+    if response.get("shipment_id"):
+        order.shipment_id = str(response["shipment_id"])
+    if response.get("awb_code"):
+        order.awb_code = str(response["awb_code"])
+    if response.get("courier_name"):
+        order.courier_name = response["courier_name"]
+    order.shipment_created_at = datetime.now(timezone.utc)
+
+
+def _courier_error(response: Any) -> str:
+    if isinstance(response, dict):
+        return str(response.get("message") or response.get("errors") or response)
+    return str(response)
+
+
+async def complete_shipment(db, order_id: uuid.UUID, response: Any,
+                            set_status: Callable[[Any, OrderDB, str], Awaitable]) -> Tuple[OrderDB, Optional[str]]:
+    """
+    Record the courier's answer (a create_order response or an exception) for
+    a claimed order and release the claim, in its own committed transaction.
+    Returns the order and the error, if the courier call failed.
+    """
+    order = await db.get(OrderDB, order_id, with_for_update=True, populate_existing=True)
+    order.shipment_claimed_at = None
+    error = None
+    if isinstance(response, Exception):
+        error = str(response)
+    elif not isinstance(response, dict) or not response.get("order_id"):
+        error = _courier_error(response)
+    else:
+        record_shipment(order, response)
+        await set_status(db, order, SHIPPED_STATUS)
+        await refresh_sales_for_orders(db, order)
+    await db.commit()
+    return order, error
+
+
+async def _ship_batch(order_ids: List[uuid.UUID],
+                      set_status: Callable[[Any, OrderDB, str], Awaitable],
+                      semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    from shiprocket_client import shiprocket
+
+    results: Dict[uuid.UUID, Dict[str, Any]] = {}
+    order_numbers: Dict[uuid.UUID, str] = {}
+    async with async_session_maker() as db:
+        orders_result = await db.execute(
+            select(OrderDB).where(OrderDB.id.in_(order_ids)).with_for_update(skip_locked=True)
+        )
+        orders = {order.id: order for order in orders_result.scalars()}
+        lines_result = await db.execute(select(OrderLineDB).where(OrderLineDB.order_id.in_(list(orders))))
+        lines = defaultdict(list)
+        for line in lines_result.scalars():
+            lines[line.order_id].append(line)
+
+        to_ship: Dict[uuid.UUID, Dict[str, Any]] = {}
+        for order_id in order_ids:
+            order = orders.get(order_id)
+            if order is None:
+                results[order_id] = {"success": False, "error": "Order not found or being shipped by another request"}
+                continue
+            order_numbers[order_id] = order.order_number
+            blocker = shipment_blocker(order)
+            if blocker:
+                results[order_id] = {"success": False, "error": blocker}
+            else:
+                claim_for_shipment(order)
+                to_ship[order_id] = build_shipment_order_data(order, lines[order_id])
+        # Release the row locks before any courier call
+        await db.commit()
+
+    async def ship(order_id: uuid.UUID, order_data: Dict[str, Any]):
+        async with semaphore:
+            try:
+                response = await shiprocket.create_order(order_data)
+            except Exception as e:
+                response = e
+        try:
+            async with async_session_maker() as db:
+                order, error = await complete_shipment(db, order_id, response, set_status)
+        except Exception as e:
+            # The claim stays set, so the order cannot be shipped twice by accident
+            logger.error(f"Courier answered {response!r} for order {order_id} but it could not be recorded: {e}")
+            results[order_id] = {"success": False, "error": f"Shipment could not be recorded: {e}"}
+            return
+        if error:
+            results[order_id] = {"success": False, "error": error}
+        else:
+            results[order_id] = {
+                "success": True,
+                "shipment_id": order.shipment_id,
+                "awb_code": order.awb_code,
+                "courier_name": order.courier_name,
+            }
+
+    await asyncio.gather(*(ship(order_id, order_data) for order_id, order_data in to_ship.items()))
+
+    return [
+        {"order_id": str(order_id), "order_number": order_numbers.get(order_id), **results[order_id]}
+        for order_id in order_ids
+    ]
+
+
+async def bulk_ship_orders(order_ids: List[str],
+                           set_status: Callable[[Any, OrderDB, str], Awaitable],
+                           on_progress: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+                           ) -> Dict[str, Any]:
+    """Ship many orders; set_status(db, order, status) applies the status change"""
+    results: List[Dict[str, Any]] = []
+    valid_ids: List[uuid.UUID] = []
+    seen = set()
+    for raw_id in order_ids:
+        try:
+            order_id = uuid.UUID(str(raw_id))
+        except ValueError:
+            results.append({"order_id": raw_id, "order_number": None, "success": False, "error": "Invalid order id"})
+            continue
+        if order_id not in seen:
+            seen.add(order_id)
+            valid_ids.append(order_id)
+
+    semaphore = asyncio.Semaphore(BULK_SHIP_CONCURRENCY)
+    for i in range(0, len(valid_ids), BULK_SHIP_BATCH_SIZE):
+        batch = valid_ids[i:i + BULK_SHIP_BATCH_SIZE]
+        try:
+            results.extend(await _ship_batch(batch, set_status, semaphore))
+        except Exception as e:
+            # The claim transaction was rolled back; later batches still run
+            logger.error(f"Bulk ship batch failed: {e}")
+            results.extend(
+                {"order_id": str(order_id), "order_number": None, "success": False, "error": f"Batch failed: {e}"}
+                for order_id in batch
+            )
+        if on_progress:
+            on_progress(results)
+
+    shipped = sum(1 for r in results if r["success"])
+    logger.info(f"Bulk ship: {shipped} of {len(results)} orders shipped")
+    return {"requested": len(order_ids), "shipped": shipped, "failed": len(results) - shipped, "results": results}
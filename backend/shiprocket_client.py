@@ -1,60 +1,184 @@
+"""
+Async Shiprocket API client.
+
+One httpx.AsyncClient (and so one keep-alive connection pool) is shared by
+every request of the process. Calls have connect/read timeouts and are
+retried with exponential backoff on transient failures:
+
+* GETs on timeouts, connection errors, 429 and 5xx responses;
+* POSTs (which create orders) only when the request never reached the API
+  (connection failures) or was rejected with 429, so an order cannot be
+  created twice.
+
+The auth token is cached for SHIPROCKET_TOKEN_TTL_HOURS. Logins are
+single-flight: concurrent requests with an expired token wait for one login
+instead of each logging in. A 401 drops the token and retries once.
+
+SHIPROCKET_BASE_URL (or the base_url argument) points the client at a local
+mock server for development and testing.
+"""
+import asyncio
+import logging
 import os
-import requests
-import json
-from datetime import datetime, timedelta
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://apiv2.shiprocket.in/v1/external"
+SHIPROCKET_TIMEOUT = float(os.getenv("SHIPROCKET_TIMEOUT", "20"))
+SHIPROCKET_CONNECT_TIMEOUT = float(os.getenv("SHIPROCKET_CONNECT_TIMEOUT", "5"))
+SHIPROCKET_MAX_RETRIES = int(os.getenv("SHIPROCKET_MAX_RETRIES", "3"))
+SHIPROCKET_MAX_CONNECTIONS = int(os.getenv("SHIPROCKET_MAX_CONNECTIONS", "20"))
+# Tokens are valid for 10 days, but refresh every 24h to be safe
+SHIPROCKET_TOKEN_TTL_HOURS = float(os.getenv("SHIPROCKET_TOKEN_TTL_HOURS", "24"))
+
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ShiprocketError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, payload: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = payload
+
 
 class ShiprocketClient:
-    BASE_URL = "https://apiv2.shiprocket.in/v1/external"
-
-    def __init__(self):
-        self.email = os.getenv("SHIPROCKET_EMAIL")
-        self.password = os.getenv("SHIPROCKET_PASSWORD")
-        self.token = None
-        self.token_expiry = None
-
-    def _get_headers(self):
-        if not self.token or datetime.now() >= self.token_expiry:
-            self._login()
-        return {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.token}"
-        }
+    def __init__(self, email: Optional[str] = None, password: Optional[str] = None,
+                 base_url: Optional[str] = None, timeout: Optional[float] = None,
+                 max_retries: int = SHIPROCKET_MAX_RETRIES,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.email = email or os.getenv("SHIPROCKET_EMAIL")
+        self.password = password or os.getenv("SHIPROCKET_PASSWORD")
+        self.base_url = (base_url or os.getenv("SHIPROCKET_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = httpx.Timeout(timeout or SHIPROCKET_TIMEOUT, connect=SHIPROCKET_CONNECT_TIMEOUT)
+        self.max_retries = max_retries
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._login_lock: Optional[asyncio.Lock] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so the pool belongs to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=SHIPROCKET_MAX_CONNECTIONS,
+                                    max_keepalive_connections=SHIPROCKET_MAX_CONNECTIONS),
+                transport=self._transport,
+                headers={"Content-Type": "application/json"},
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _token_valid(self) -> bool:
+        return self.token is not None and time.monotonic() < self._token_expires_at
 
-    def _login(self):
+    async def _get_token(self) -> str:
+        if self._token_valid():
+            return self.token
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            # Another request may have logged in while we waited
+            if not self._token_valid():
+                await self._login()
+        return self.token
+
+    async def _login(self):
         if not self.email or not self.password:
             raise ValueError("SHIPROCKET_EMAIL and SHIPROCKET_PASSWORD env vars are required")
-        
-        url = f"{self.BASE_URL}/auth/login"
-        payload = {"email": self.email, "password": self.password}
-        
         try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            self.token = data.get("token")
-            # Token is usually valid for 10 days, but let's refresh every 24h to be safe
-            self.token_expiry = datetime.now() + timedelta(hours=24) 
+            data = await self._request("POST", "/auth/login", json={"email": self.email, "password": self.password},
+                                       auth=False)
         except Exception as e:
-            print(f"❌ Shiprocket Login Failed: {e}")
-            raise e
+            logger.error(f"❌ Shiprocket Login Failed: {e}")
+            raise
+        token = data.get("token") if isinstance(data, dict) else None
+        if not token:
+            raise ShiprocketError("Shiprocket login returned no token", payload=data)
+        self.token = token
+        self._token_expires_at = time.monotonic() + SHIPROCKET_TOKEN_TTL_HOURS * 3600
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), RETRY_MAX_DELAY)
+        delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                       json: Any = None, auth: bool = True) -> Any:
+        """Send a request with retries; returns the decoded JSON body"""
+        idempotent = method == "GET"
+        reauthenticated = False
+        attempt = 0
+        while True:
+            headers = {}
+            if auth:
+                token = await self._get_token()
+                headers["Authorization"] = f"Bearer {token}"
+            try:
+                response = await self._http().request(method, path, params=params, json=json, headers=headers)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # Never reached the API: safe to retry any method
+                error, response = e, None
+            except httpx.TransportError as e:
+                if not idempotent:
+                    raise ShiprocketError(f"Shiprocket {method} {path} failed: {e}")
+                error, response = e, None
+            else:
+                if response.status_code == 401 and auth and not reauthenticated:
+                    # Token revoked or expired early: log in again once
+                    if self.token == token:
+                        self.token = None
+                    reauthenticated = True
+                    continue
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRYABLE_STATUSES)
+                if not retryable:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        raise ShiprocketError(
+                            f"Shiprocket {method} {path} returned {response.status_code} with a non-JSON body",
+                            status_code=response.status_code, payload=response.text[:500]
+                        )
+                error = ShiprocketError(f"HTTP {response.status_code}", status_code=response.status_code)
 
-    def check_serviceability(self, pickup_postcode, delivery_postcode, weight, cod=0):
-        url = f"{self.BASE_URL}/courier/serviceability/"
+            if attempt >= self.max_retries:
+                raise ShiprocketError(
+                    f"Shiprocket {method} {path} failed after {attempt + 1} attempts: {error}",
+                    status_code=getattr(error, "status_code", None)
+                )
+            delay = self._backoff(attempt, response)
+            logger.warning(f"Shiprocket {method} {path} failed ({error}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def check_serviceability(self, pickup_postcode, delivery_postcode, weight, cod=0):
         params = {
             "pickup_postcode": pickup_postcode,
             "delivery_postcode": delivery_postcode,
             "weight": weight,
             "cod": cod
         }
-        
-        response = requests.get(url, headers=self._get_headers(), params=params)
-        return response.json()
-
-    def create_order(self, order_data):
-        url = f"{self.BASE_URL}/orders/create/ad-hoc"
-        
-        # Transform our internal order data to Shiprocket format if necessary
-        # Assuming order_data passed here is already formatted or we format it:
+        return await self._request("GET", "/courier/serviceability/", params=params)
+
+    async def create_order(self, order_data):
+        # Transform our internal order data to Shiprocket format
         payload = {
             "order_id": order_data.get("order_id"),
             "order_date": order_data.get("order_date"),
@@ -77,9 +201,7 @@ class ShiprocketClient:
             "height": 10,
             "weight": 0.5 # Default 500g
         }
-        
-        response = requests.post(url, headers=self._get_headers(), json=payload)
-        return response.json()
+        return await self._request("POST", "/orders/create/ad-hoc", json=payload)
 
 # Singleton instance
 shiprocket = ShiprocketClient()
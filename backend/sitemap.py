@@ -0,0 +1,243 @@
+"""
+Sitemaps for search engines: a sitemap index plus gzip sub-sitemaps.
+
+GET /sitemap.xml is a sitemap index pointing at:
+
+* sitemap-pages.xml.gz: static pages and category listings;
+* sitemap-products-<n>.xml.gz: every active product, SITEMAP_URLS_PER_FILE
+  (max 50,000, the protocol limit) per file, oldest first so existing
+  files stay stable as the catalogue grows.
+
+Products are read with a server-side cursor and written straight into
+gzip streams, so only the compressed files are ever held in memory. The
+rendered files are cached for up to SITEMAP_CACHE_TTL seconds, and rebuilt
+sooner only when a cheap signature of what they list changes: the number
+of active products and how many of them were modified today (lastmod has
+day granularity). Orders and stock changes elsewhere in the catalogue do
+not trigger a rebuild unless they change a product's lastmod date.
+"""
+import asyncio
+import gzip
+import hashlib
+import io
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from sqlalchemy import func, select
+
+from database import async_session_maker
+from db_models import ProductDB
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_URLS_PER_FILE = min(int(os.getenv("SITEMAP_URLS_PER_FILE", "50000")), 50000)
+SITEMAP_CACHE_TTL = int(os.getenv("SITEMAP_CACHE_TTL", "3600"))
+SITEMAP_FETCH_SIZE = 2000
+# How often a request may re-run the (cheap) signature query
+SITEMAP_CHECK_INTERVAL = 60
+
+FRONTEND_URL = os.getenv("FRONTEND_URL", "https://annyajewellers.com")
+# Where the sitemap files themselves are reachable (the frontend proxies /sitemap*)
+SITEMAP_BASE_URL = os.getenv("SITEMAP_BASE_URL", FRONTEND_URL)
+
+PAGES_SITEMAP = "pages"
+
+STATIC_PAGES = [
+    {"loc": "/", "priority": "1.0", "changefreq": "daily"},
+    {"loc": "/products", "priority": "0.9", "changefreq": "daily"},
+    {"loc": "/about", "priority": "0.7", "changefreq": "monthly"},
+    {"loc": "/contact", "priority": "0.7", "changefreq": "monthly"},
+    {"loc": "/faq", "priority": "0.6", "changefreq": "monthly"},
+    {"loc": "/book-appointment", "priority": "0.8", "changefreq": "weekly"},
+]
+
+
+def products_sitemap_name(number: int) -> str:
+    return f"products-{number}"
+
+
+def sitemap_url(name: str) -> str:
+    return f"{SITEMAP_BASE_URL}/sitemap-{name}.xml.gz"
+
+
+def _url_entry(loc: str, lastmod: Optional[str] = None, changefreq: Optional[str] = None,
+               priority: Optional[str] = None) -> str:
+    entry = f"  <url>\n    <loc>{escape(loc)}</loc>\n"
+    if lastmod:
+        entry += f"    <lastmod>{lastmod}</lastmod>\n"
+    if changefreq:
+        entry += f"    <changefreq>{changefreq}</changefreq>\n"
+    if priority:
+        entry += f"    <priority>{priority}</priority>\n"
+    return entry + "  </url>\n"
+
+
+class _UrlsetWriter:
+    """Writes one <urlset> straight into a gzip buffer"""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._gzip = gzip.GzipFile(fileobj=self._buffer, mode="wb", mtime=0)
+        self._gzip.write(
+            b'<?xml version="1.0" encoding="UTF-8"?>\n'
+            b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        )
+        self.count = 0
+        self.lastmod: Optional[str] = None
+
+    def write(self, entries: List[str], count: int, lastmod: Optional[str] = None):
+        self._gzip.write("".join(entries).encode())
+        self.count += count
+        if lastmod and (self.lastmod is None or lastmod > self.lastmod):
+            self.lastmod = lastmod
+
+    def close(self) -> bytes:
+        self._gzip.write(b"</urlset>\n")
+        self._gzip.close()
+        return self._buffer.getvalue()
+
+
+class SitemapCache:
+    def __init__(self, ttl: float = SITEMAP_CACHE_TTL):
+        self.ttl = ttl
+        self._files: Dict[str, bytes] = {}
+        self._index: Optional[bytes] = None
+        self._signature: Optional[str] = None
+        self._expires_at = 0.0
+        self._checked_at = 0.0
+        self._builds = 0
+        self._content_hash = ""
+        self._lock = asyncio.Lock()
+
+    async def _build(self):
+        files: Dict[str, bytes] = {}
+        index_entries: List[tuple] = []
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        async with async_session_maker() as db:
+            pages = _UrlsetWriter()
+            pages.write([
+                _url_entry(f"{FRONTEND_URL}{page['loc']}", changefreq=page["changefreq"], priority=page["priority"])
+                for page in STATIC_PAGES
+            ], len(STATIC_PAGES))
+            cat_result = await db.execute(
+                select(ProductDB.category).distinct().where(ProductDB.status == 'active')
+            )
+            categories = [row[0] for row in cat_result.all() if row[0]]
+            pages.write([
+                _url_entry(f"{FRONTEND_URL}/products?category={quote(cat)}", changefreq="weekly", priority="0.8")
+                for cat in categories
+            ], len(categories))
+            files[PAGES_SITEMAP] = pages.close()
+            index_entries.append((PAGES_SITEMAP, today))
+
+            writer: Optional[_UrlsetWriter] = None
+            rows = await db.stream(
+                select(ProductDB.id, ProductDB.updated_at)
+                .where(ProductDB.status == 'active')
+                .order_by(ProductDB.created_at, ProductDB.id)
+                .execution_options(yield_per=SITEMAP_FETCH_SIZE)
+            )
+            async for partition in rows.partitions():
+                position = 0
+                while position < len(partition):
+                    if writer is None:
+                        writer = _UrlsetWriter()
+                    chunk = partition[position:position + SITEMAP_URLS_PER_FILE - writer.count]
+                    position += len(chunk)
+                    lastmods = [updated_at.strftime("%Y-%m-%d") if updated_at else None for _, updated_at in chunk]
+                    writer.write([
+                        _url_entry(f"{FRONTEND_URL}/product/{product_id}", lastmod=lastmod or today,
+                                   changefreq="weekly", priority="0.6")
+                        for (product_id, _), lastmod in zip(chunk, lastmods)
+                    ], len(chunk), max((m for m in lastmods if m), default=None))
+                    if writer.count >= SITEMAP_URLS_PER_FILE:
+                        name = products_sitemap_name(len(index_entries))
+                        files[name] = writer.close()
+                        index_entries.append((name, writer.lastmod))
+                        writer = None
+            if writer is not None:
+                name = products_sitemap_name(len(index_entries))
+                files[name] = writer.close()
+                index_entries.append((name, writer.lastmod))
+
+        index = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+        for name, lastmod in index_entries:
+            index.append(f"  <sitemap>\n    <loc>{escape(sitemap_url(name))}</loc>\n")
+            if lastmod:
+                index.append(f"    <lastmod>{lastmod}</lastmod>\n")
+            index.append("  </sitemap>\n")
+        index.append("</sitemapindex>\n")
+
+        self._files, self._index = files, "".join(index).encode()
+        digest = hashlib.sha1(self._index)
+        for name in sorted(files):
+            digest.update(files[name])
+        self._content_hash = digest.hexdigest()[:16]
+        self._builds += 1
+        logger.info(f"Sitemap rebuilt: {len(files)} files")
+
+    async def _current_signature(self) -> str:
+        """Changes whenever the rendered sitemaps would (up to same-day edits of categories)"""
+        now = datetime.now(timezone.utc)
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        async with async_session_maker() as db:
+            active, modified_today = (await db.execute(
+                select(func.count(), func.count().filter(ProductDB.updated_at >= today_start))
+                .select_from(ProductDB)
+                .where(ProductDB.status == 'active')
+            )).one()
+        return f"{today_start:%Y%m%d}.{active}.{modified_today}"
+
+    async def _ensure_fresh(self):
+        if self._index is not None and time.monotonic() < self._expires_at:
+            if time.monotonic() - self._checked_at < SITEMAP_CHECK_INTERVAL:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                signature = await self._current_signature()
+            except Exception as e:
+                logger.warning(f"Sitemap freshness check failed, serving cached files: {e}")
+                return
+            if signature == self._signature:
+                return
+        async with self._lock:
+            # Another request may have rebuilt it while we waited
+            signature = await self._current_signature()
+            if self._index is not None and signature == self._signature and time.monotonic() < self._expires_at:
+                return
+            try:
+                await self._build()
+            except Exception as e:
+                if self._index is None:
+                    raise
+                logger.error(f"Sitemap rebuild failed, serving previous files: {e}")
+                self._signature = signature
+                self._expires_at = time.monotonic() + min(self.ttl, 60)
+                return
+            self._signature = signature
+            self._expires_at = time.monotonic() + self.ttl
+            self._checked_at = time.monotonic()
+
+    async def version(self) -> str:
+        """Hash of the current sitemap files, the same on every worker (used for ETags)"""
+        await self._ensure_fresh()
+        return f"sitemap.{self._content_hash}"
+
+    async def index(self) -> bytes:
+        await self._ensure_fresh()
+        return self._index
+
+    async def file(self, name: str) -> Optional[bytes]:
+        """A gzip sub-sitemap by name, or None if it does not exist"""
+        await self._ensure_fresh()
+        return self._files.get(name)
+
+
+sitemap_cache = SitemapCache()
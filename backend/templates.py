@@ -0,0 +1,80 @@
+"""
+Email templates (Jinja2) in email_templates/.
+
+load_templates() compiles every template once at startup. The environment
+keeps the compiled templates in an unbounded cache and never re-checks the
+files (auto_reload is off), so a send only renders a template with a small
+context. HTML autoescaping is on, so product and customer names can no
+longer break the markup.
+
+render() is cheap enough for the request path (one order confirmation);
+render_many() renders a batch (reminder campaigns) on a worker thread so
+the event loop keeps serving requests.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import jinja2
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "email_templates")
+STORE_URL = os.getenv("FRONTEND_URL", "https://annyajewellers.com").rstrip("/")
+CART_URL = f"{STORE_URL}/cart"
+# Items shown in abandoned-cart emails
+MAX_CART_EMAIL_ITEMS = 5
+
+_env: Optional[jinja2.Environment] = None
+
+
+def _inr(value: Any) -> str:
+    """Rupee amount without decimals and with thousands separators"""
+    return f"{float(value or 0):,.0f}"
+
+
+def environment() -> jinja2.Environment:
+    global _env
+    if _env is None:
+        _env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+            autoescape=jinja2.select_autoescape(["html"]),
+            auto_reload=False,
+            cache_size=-1,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        _env.filters["inr"] = _inr
+    return _env
+
+
+def load_templates() -> int:
+    """Compile every template up front; a syntax error fails startup instead of a send"""
+    env = environment()
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    logger.info(f"Compiled {len(names)} email templates")
+    return len(names)
+
+
+def render(name: str, **context: Any) -> str:
+    return environment().get_template(name).render(**context)
+
+
+async def render_many(name: str, contexts: List[Dict[str, Any]]) -> List[str]:
+    """Render one template for many contexts on a worker thread"""
+    template = environment().get_template(name)
+    return await asyncio.to_thread(lambda: [template.render(**context) for context in contexts])
+
+
+def cart_email_context(cart: Any, max_items: Optional[int] = MAX_CART_EMAIL_ITEMS) -> Dict[str, Any]:
+    """Context for the abandoned-cart templates from an AbandonedCartDB row"""
+    items = cart.items or []
+    return {
+        "customer_name": cart.customer_name,
+        "items": items[:max_items] if max_items else items,
+        "cart_total": cart.cart_total,
+        "cart_url": CART_URL,
+    }
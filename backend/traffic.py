@@ -0,0 +1,206 @@
+"""
+Storefront traffic ingestion into `traffic_logs`.
+
+/api/track only classifies the event (device from the user agent, source
+bucket from the referrer) and puts it on an in-process queue. A background
+task drains the queue and writes events with one multi-row INSERT per batch,
+flushing every TRAFFIC_FLUSH_INTERVAL_MS or as soon as TRAFFIC_BATCH_SIZE
+events are waiting. If the queue is full (DB down or very slow), new events
+are dropped rather than slowing down page views.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import insert
+
+from database import engine
+from db_models import TrafficLogDB
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = int(os.getenv("TRAFFIC_FLUSH_INTERVAL_MS", "1000")) / 1000
+# 8 bound parameters per row keeps a full batch well under Postgres' 32767 limit
+BATCH_SIZE = min(int(os.getenv("TRAFFIC_BATCH_SIZE", "500")), 2000)
+QUEUE_SIZE = int(os.getenv("TRAFFIC_QUEUE_SIZE", "20000"))
+
+# ---------- Classification ----------
+
+DEVICE_MOBILE = "mobile"
+DEVICE_TABLET = "tablet"
+DEVICE_DESKTOP = "desktop"
+DEVICE_BOT = "bot"
+
+_BOT_RE = re.compile(r"bot|crawl|spider|slurp|preview|headless|lighthouse|facebookexternalhit", re.I)
+_TABLET_RE = re.compile(r"ipad|tablet|kindle|silk|playbook|(android(?!.*mobile))", re.I)
+_MOBILE_RE = re.compile(r"mobi|iphone|ipod|android|blackberry|opera mini|iemobile|windows phone", re.I)
+
+SOURCE_DIRECT = "Direct"
+SOURCE_ORGANIC = "Organic Search"
+SOURCE_SOCIAL = "Social Media"
+SOURCE_REFERRAL = "Referral"
+SOURCE_PAID = "Paid Ads"
+SOURCES = (SOURCE_DIRECT, SOURCE_ORGANIC, SOURCE_SOCIAL, SOURCE_REFERRAL, SOURCE_PAID)
+
+_SEARCH_ENGINES = ("google.", "bing.", "yahoo.", "duckduckgo.", "yandex.", "baidu.", "ecosia.")
+_SOCIAL_SITES = ("facebook.", "fb.", "instagram.", "t.co", "twitter.", "x.com", "linkedin.",
+                 "pinterest.", "youtube.", "reddit.", "whatsapp.", "wa.me", "snapchat.")
+_PAID_PARAMS = ("gclid", "fbclid", "msclkid")
+_PAID_MEDIUMS = ("cpc", "ppc", "paid", "paidsocial", "display")
+
+
+def classify_device(user_agent: Optional[str], hint: Optional[str] = None) -> str:
+    """Bucket a user agent into mobile / tablet / desktop / bot"""
+    ua = user_agent or ""
+    if _BOT_RE.search(ua):
+        return DEVICE_BOT
+    if _TABLET_RE.search(ua):
+        return DEVICE_TABLET
+    if _MOBILE_RE.search(ua):
+        return DEVICE_MOBILE
+    if ua:
+        return DEVICE_DESKTOP
+    # No user agent: trust the client's own guess if it is one we know
+    hint = (hint or "").lower()
+    return hint if hint in (DEVICE_MOBILE, DEVICE_TABLET, DEVICE_DESKTOP) else DEVICE_DESKTOP
+
+
+def _bare_host(host: Optional[str]) -> str:
+    host = (host or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _host_matches(host: str, patterns) -> bool:
+    return any(host == p or host.startswith(p) or f".{p}" in f".{host}" for p in patterns)
+
+
+def classify_source(referrer: Optional[str], own_host: Optional[str] = None, path: Optional[str] = None) -> str:
+    """Bucket a referrer URL (plus campaign params on the landing path) into a traffic source"""
+    for url in (path, referrer):
+        if not url:
+            continue
+        params = parse_qs(urlparse(url).query)
+        if any(p in params for p in _PAID_PARAMS):
+            return SOURCE_PAID
+        if any(m in _PAID_MEDIUMS for m in (v.lower() for v in params.get("utm_medium", []))):
+            return SOURCE_PAID
+
+    if not referrer:
+        return SOURCE_DIRECT
+    host = _bare_host(urlparse(referrer).hostname)
+    if not host or (own_host and host == _bare_host(own_host.split(":")[0])):
+        return SOURCE_DIRECT
+    if _host_matches(host, _SEARCH_ENGINES):
+        return SOURCE_ORGANIC
+    if _host_matches(host, _SOCIAL_SITES):
+        return SOURCE_SOCIAL
+    return SOURCE_REFERRAL
+
+
+def visitor_key(ip_address: Optional[str], user_agent: Optional[str]) -> str:
+    """Stable anonymous visitor id used for unique-visitor counts"""
+    raw = f"{ip_address or ''}|{user_agent or ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+# ---------- Batched writer ----------
+
+class TrafficIngestor:
+    """Queue page views in memory and write them to traffic_logs in batches"""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 queue_size: int = QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Traffic ingestion started (batch {self.batch_size}, every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Stop the writer and flush whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # A batch interrupted mid-write was rolled back, so it is safe to write again
+        batch, self._batch = self._batch, []
+        await self._flush(batch)
+        while not self.queue.empty():
+            await self._flush(self._take(self.batch_size))
+
+    def record(self, path: str, user_agent: Optional[str], ip_address: Optional[str],
+               referrer: Optional[str], device_hint: Optional[str] = None, own_host: Optional[str] = None) -> bool:
+        """Classify and enqueue one page view; returns False if it was skipped or dropped"""
+        device = classify_device(user_agent, device_hint)
+        if device == DEVICE_BOT:
+            return False
+        row = {
+            "path": (path or "/")[:500],
+            "user_agent": user_agent,
+            "ip_address": (ip_address or "")[:45] or None,
+            "referrer": referrer or None,
+            "device_type": device,
+            "source": classify_source(referrer, own_host, path),
+            "visitor_id": visitor_key(ip_address, user_agent),
+            "created_at": datetime.now(timezone.utc),
+        }
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        rows = []
+        while len(rows) < limit and not self.queue.empty():
+            rows.append(self.queue.get_nowait())
+        return rows
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Block until there is something to write, then collect until the batch
+            # is full or the flush interval has passed
+            rows = self._batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            rows.extend(self._take(self.batch_size - len(rows)))
+            await self._flush(rows)
+            self._batch = []
+
+    async def _flush(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(insert(TrafficLogDB).values(rows))
+            self.written += len(rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            logger.error(f"Failed to write {len(rows)} traffic events: {e}")
+
+
+traffic_ingestor = TrafficIngestor()
@@ -0,0 +1,208 @@
+"""
+Daily traffic rollups (`traffic_daily`) behind the traffic analytics endpoints.
+
+A scheduler job folds new traffic_logs rows into per-day rows for four
+dimensions: the day total, each path, each device type and each source.
+Pageviews are summed; unique visitors are kept as HyperLogLog sketches
+(see hll.py), which merge across runs and across days without re-reading
+raw rows. Path rows also carry the day's bounces (visitors with a single
+pageview), recomputed in SQL for each day touched.
+
+Progress is tracked by a watermark in admin_settings over ingested_at, the
+database time at which a row was written, not created_at, which the app
+stamps when the event is queued and which can be well behind for a batch
+that was flushed late. Rows are only rolled up once their ingested_at is
+INGEST_LAG old (on the database clock), which covers the write transaction
+committing after its now(). The watermark row is locked for the whole run,
+so concurrent workers cannot count the same rows twice.
+"""
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import async_session_maker
+from db_models import AdminSettingsDB, TrafficDailyDB, TrafficLogDB
+from hll import HyperLogLog
+from sales_rollup import IST, ist_day_bounds
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_MINUTES = int(os.getenv("TRAFFIC_ROLLUP_INTERVAL_MINUTES", "10"))
+INGEST_LAG = timedelta(minutes=2)
+# Events are written long before this; bounding created_at too lets Postgres skip old partitions
+MAX_INGEST_DELAY = timedelta(days=1)
+# Bound the work (and memory) of a single transaction during backfills
+MAX_CHUNK = timedelta(days=1)
+WATERMARK_KEY = "traffic_rollup_watermark"
+
+DIMENSION_TOTAL = "total"
+DIMENSION_PATH = "path"
+DIMENSION_DEVICE = "device"
+DIMENSION_SOURCE = "source"
+
+# Per-dimension sketch precision: the daily total gets the most accurate one
+SKETCH_PRECISION = {
+    DIMENSION_TOTAL: 14,
+    DIMENSION_PATH: 10,
+    DIMENSION_DEVICE: 12,
+    DIMENSION_SOURCE: 12,
+}
+
+RollupKey = Tuple[date, str, str]
+
+_BOUNCES_SQL = [
+    text("UPDATE traffic_daily SET bounces = 0 WHERE day = :day AND dimension = 'path'"),
+    text("""
+        UPDATE traffic_daily t SET bounces = b.bounces
+        FROM (
+            SELECT path, count(*) AS bounces
+            FROM (
+                SELECT visitor_id, min(path) AS path
+                FROM traffic_logs
+                WHERE created_at >= :day_start AND created_at < :day_end AND visitor_id IS NOT NULL
+                GROUP BY visitor_id
+                HAVING count(*) = 1
+            ) single_page
+            GROUP BY path
+        ) b
+        WHERE t.day = :day AND t.dimension = 'path' AND t.value = b.path
+    """),
+]
+
+
+class _Bucket:
+    __slots__ = ("pageviews", "sketch")
+
+    def __init__(self, dimension: str):
+        self.pageviews = 0
+        self.sketch = HyperLogLog(SKETCH_PRECISION[dimension])
+
+
+def merged_visitors(sketches: Iterable[bytes]) -> int:
+    """Unique visitors across several stored sketches (e.g. the days of a window)"""
+    merged = None
+    for data in sketches:
+        if not data:
+            continue
+        sketch = HyperLogLog.from_bytes(data)
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged.count() if merged else 0
+
+
+async def _lock_watermark(db) -> AdminSettingsDB:
+    await db.execute(
+        pg_insert(AdminSettingsDB)
+        .values(key=WATERMARK_KEY, value="")
+        .on_conflict_do_nothing(index_elements=["key"])
+    )
+    result = await db.execute(
+        select(AdminSettingsDB).where(AdminSettingsDB.key == WATERMARK_KEY).with_for_update()
+    )
+    return result.scalar_one()
+
+
+async def _roll_up_chunk() -> bool:
+    """Roll up one chunk of new rows; returns True if there may be more to do"""
+    async with async_session_maker() as db:
+        watermark = await _lock_watermark(db)
+        if watermark.value:
+            start = datetime.fromisoformat(watermark.value)
+        else:
+            start = (await db.execute(select(func.min(TrafficLogDB.ingested_at)))).scalar()
+            if start is None:
+                await db.commit()
+                return False
+        horizon = (await db.execute(select(func.now()))).scalar() - INGEST_LAG
+        end = min(horizon, start + MAX_CHUNK)
+        if end <= start:
+            await db.commit()
+            return False
+
+        buckets: Dict[RollupKey, _Bucket] = {}
+
+        def bucket(key: RollupKey) -> _Bucket:
+            entry = buckets.get(key)
+            if entry is None:
+                entry = buckets[key] = _Bucket(key[1])
+            return entry
+
+        rows = await db.stream(
+            select(TrafficLogDB.visitor_id, TrafficLogDB.path, TrafficLogDB.device_type,
+                   TrafficLogDB.source, TrafficLogDB.created_at)
+            .where(TrafficLogDB.ingested_at >= start, TrafficLogDB.ingested_at < end,
+                   TrafficLogDB.created_at >= start - MAX_INGEST_DELAY)
+            .execution_options(yield_per=5000)
+        )
+        async for visitor_id, path, device, source, created_at in rows:
+            day = created_at.astimezone(IST).date()
+            for key in (
+                (day, DIMENSION_TOTAL, ""),
+                (day, DIMENSION_PATH, path or "/"),
+                (day, DIMENSION_DEVICE, device or "desktop"),
+                (day, DIMENSION_SOURCE, source or "Direct"),
+            ):
+                entry = bucket(key)
+                entry.pageviews += 1
+                if visitor_id:
+                    entry.sketch.add(visitor_id)
+
+        if buckets:
+            days = sorted({key[0] for key in buckets})
+            existing = await db.execute(
+                select(TrafficDailyDB).where(TrafficDailyDB.day.in_(days))
+            )
+            for row in existing.scalars():
+                entry = buckets.get((row.day, row.dimension, row.value))
+                if entry is None:
+                    continue
+                entry.pageviews += row.pageviews
+                if row.visitor_sketch:
+                    entry.sketch.merge(HyperLogLog.from_bytes(row.visitor_sketch))
+
+            values: List[dict] = [
+                {
+                    "day": day, "dimension": dimension, "value": value,
+                    "pageviews": entry.pageviews,
+                    "visitors": entry.sketch.count(),
+                    "visitor_sketch": entry.sketch.to_bytes(),
+                }
+                for (day, dimension, value), entry in buckets.items()
+            ]
+            for i in range(0, len(values), 500):
+                stmt = pg_insert(TrafficDailyDB).values(values[i:i + 500])
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=["day", "dimension", "value"],
+                    set_={
+                        "pageviews": stmt.excluded.pageviews,
+                        "visitors": stmt.excluded.visitors,
+                        "visitor_sketch": stmt.excluded.visitor_sketch,
+                        "updated_at": datetime.now(timezone.utc),
+                    }
+                ))
+
+            for day in days:
+                day_start, day_end = ist_day_bounds(day)
+                params = {"day": day, "day_start": day_start, "day_end": day_end}
+                for statement in _BOUNCES_SQL:
+                    await db.execute(statement, params)
+
+        watermark.value = end.isoformat()
+        await db.commit()
+        logger.info(f"Traffic rollup: {len(buckets)} rows updated up to {end.isoformat()}")
+        return end < horizon
+
+
+async def roll_up_traffic():
+    """Scheduler job: fold all new traffic_logs rows into traffic_daily"""
+    try:
+        while await _roll_up_chunk():
+            pass
+    except Exception as e:
+        logger.error(f"Traffic rollup failed: {e}")
@@ -0,0 +1,110 @@
+"""
+Image upload pipeline for the admin (single and multi-file uploads).
+
+The Cloudinary SDK is blocking, so uploads run on a dedicated thread pool
+of UPLOAD_WORKERS threads: the event loop stays free, and a 300-image
+batch uploads UPLOAD_WORKERS files at a time instead of one by one.
+
+With variants=True, Cloudinary renders the responsive sizes in
+IMAGE_VARIANTS (thumb/card/zoom) eagerly during the upload, so the first
+shopper to open a product never waits for an on-the-fly transformation.
+
+UPLOAD_TARGET=local swaps Cloudinary for a stand-in that writes files to
+UPLOAD_LOCAL_DIR (served at /uploads) for development and testing without
+credentials; its variants all point at the original file.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "6"))
+UPLOAD_FOLDER = "anya-jewellery"
+UPLOAD_TARGET = os.getenv("UPLOAD_TARGET", "cloudinary").lower()
+UPLOAD_LOCAL_DIR = os.getenv(
+    "UPLOAD_LOCAL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+)
+UPLOAD_LOCAL_BASE_URL = os.getenv("UPLOAD_LOCAL_BASE_URL", "/uploads")
+MAX_FILES_PER_UPLOAD = 100
+
+# Responsive sizes rendered at upload time; the zoom size keeps the aspect ratio
+IMAGE_VARIANTS: Dict[str, Dict[str, Any]] = {
+    "thumb": {"width": 200, "height": 200, "crop": "fill", "gravity": "auto", "quality": "auto", "fetch_format": "auto"},
+    "card": {"width": 600, "height": 600, "crop": "fill", "gravity": "auto", "quality": "auto", "fetch_format": "auto"},
+    "zoom": {"width": 1600, "crop": "limit", "quality": "auto", "fetch_format": "auto"},
+}
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+def _cloudinary_upload(fileobj: BinaryIO, variants: bool) -> Dict[str, Any]:
+    import cloudinary.uploader
+
+    options: Dict[str, Any] = {"folder": UPLOAD_FOLDER}
+    if variants:
+        options["eager"] = list(IMAGE_VARIANTS.values())
+    result = cloudinary.uploader.upload(fileobj, **options)
+    uploaded = {"url": result.get("secure_url"), "public_id": result.get("public_id")}
+    if variants:
+        # Eager results come back in the order they were requested
+        eager = result.get("eager") or []
+        uploaded["variants"] = {
+            name: (eager[i].get("secure_url") if i < len(eager) else None) or uploaded["url"]
+            for i, name in enumerate(IMAGE_VARIANTS)
+        }
+    return uploaded
+
+
+def _local_upload(fileobj: BinaryIO, filename: Optional[str], variants: bool) -> Dict[str, Any]:
+    os.makedirs(UPLOAD_LOCAL_DIR, exist_ok=True)
+    extension = os.path.splitext(filename or "")[1].lower()[:10]
+    name = f"{uuid.uuid4().hex}{extension}"
+    with open(os.path.join(UPLOAD_LOCAL_DIR, name), "wb") as out:
+        shutil.copyfileobj(fileobj, out, 1024 * 1024)
+    url = f"{UPLOAD_LOCAL_BASE_URL}/{name}"
+    uploaded = {"url": url, "public_id": name}
+    if variants:
+        uploaded["variants"] = {variant: url for variant in IMAGE_VARIANTS}
+    return uploaded
+
+
+async def upload_image(fileobj: BinaryIO, filename: Optional[str] = None, variants: bool = False) -> Dict[str, Any]:
+    """Upload one image off the event loop; returns url, public_id and (optionally) variants"""
+    loop = asyncio.get_running_loop()
+    if UPLOAD_TARGET == "local":
+        return await loop.run_in_executor(_executor, _local_upload, fileobj, filename, variants)
+    return await loop.run_in_executor(_executor, _cloudinary_upload, fileobj, variants)
+
+
+async def upload_images(files: List[Any], variants: bool = False) -> List[Dict[str, Any]]:
+    """Upload UploadFiles in parallel (bounded by the thread pool); one result or error per file, in order"""
+    async def upload(file) -> Dict[str, Any]:
+        try:
+            result = await upload_image(file.file, file.filename, variants)
+            return {"filename": file.filename, "success": True, **result}
+        except Exception as e:
+            logger.error(f"Upload of {file.filename} failed: {e}")
+            return {"filename": file.filename, "success": False, "error": str(e)}
+
+    return await asyncio.gather(*(upload(file) for file in files))
+
+
+def add_to_gallery(product: Any, uploaded: List[Dict[str, Any]], variants: bool = True) -> None:
+    """Append successful upload results to a product's images (and image_variants, keyed by url)"""
+    if not uploaded:
+        return
+    # Reassign (not mutate) JSONB values so the ORM sees the change
+    product.images = (product.images or []) + [r["url"] for r in uploaded]
+    if variants:
+        product.image_variants = {
+            **(product.image_variants or {}),
+            **{r["url"]: r["variants"] for r in uploaded if r.get("variants")}
+        }
+    if not product.image:
+        product.image = uploaded[0]["url"]
@@ -28,7 +28,9 @@ const OrdersPage = () => {
     const [searchParams, setSearchParams] = useSearchParams();
 
     const [orders, setOrders] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [searchTerm, setSearchTerm] = useState('');
     const [activeTab, setActiveTab] = useState(searchParams.get('status') || 'all');
     const [currentPage, setCurrentPage] = useState(1);
@@ -44,6 +46,7 @@ const OrdersPage = () => {
     const [dateRange, setDateRange] = useState({ start: '', end: '' });
 
     const itemsPerPage = 15;
+    const ordersPageSize = 100;
 
     const tabs = [
         { id: 'all', label: 'All Orders', count: 0 },
@@ -55,23 +58,47 @@ const OrdersPage = () => {
         { id: 'returned', label: 'Returned', count: 0, icon: XCircle }
     ];
 
+    const fetchOrdersPage = async (cursor = '') => {
+        const params = { cursor, limit: ordersPageSize };
+        if (activeTab !== 'all') params.status = activeTab;
+        const response = await axios.get(`${backendUrl}/api/admin/orders`, {
+            headers: getAuthHeader(),
+            params
+        });
+        return response.data;
+    };
+
     const fetchOrders = async () => {
         setLoading(true);
         try {
-            const params = activeTab !== 'all' ? `?status=${activeTab}` : '';
-            const response = await axios.get(`${backendUrl}/api/admin/orders${params}`, {
-                headers: getAuthHeader()
-            });
-            setOrders(response.data);
+            const page = await fetchOrdersPage();
+            setOrders(page.items);
+            setNextCursor(page.next_cursor);
         } catch (error) {
             console.error('Error fetching orders:', error);
             // No mock data - just show empty state on error
             setOrders([]);
+            setNextCursor(null);
         } finally {
             setLoading(false);
         }
     };
 
+    const loadMoreOrders = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const page = await fetchOrdersPage(nextCursor);
+            setOrders(prev => [...prev, ...page.items]);
+            setNextCursor(page.next_cursor);
+        } catch (error) {
+            console.error('Error loading more orders:', error);
+            showError('Failed to load more orders');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         fetchOrders();
         // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -526,6 +553,18 @@ const OrdersPage = () => {
                         <p className="text-gray-500">No orders found</p>
                     </div>
                 )}
+
+                {nextCursor && (
+                    <div className="flex justify-center px-4 py-3 border-t border-gray-200">
+                        <button
+                            onClick={loadMoreOrders}
+                            disabled={loadingMore}
+                            className="text-sm font-medium text-amber-600 hover:text-amber-700 disabled:opacity-50"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load older orders'}
+                        </button>
+                    </div>
+                )}
             </div>
 
             {/* Status Update Modal */}
@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import shiprocket_client  # noqa: E402
+from shiprocket_client import ShiprocketClient, ShiprocketError  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_delay(monkeypatch):
+    monkeypatch.setattr(shiprocket_client, "RETRY_BASE_DELAY", 0)
+
+
+class FakeShiprocket:
+    """MockTransport handler: logs in with sequential tokens and serves queued API responses"""
+
+    def __init__(self, responses=None, login_delay=0.0, reject_tokens=()):
+        self.responses = list(responses or [])
+        self.login_delay = login_delay
+        self.reject_tokens = set(reject_tokens)
+        self.logins = 0
+        self.calls = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/auth/login"):
+            self.logins += 1
+            await asyncio.sleep(self.login_delay)
+            return httpx.Response(200, json={"token": f"t{self.logins}"})
+        token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        self.calls.append((request.method, request.url.path, token))
+        if token in self.reject_tokens:
+            return httpx.Response(401, json={"message": "Token has expired"})
+        response = self.responses.pop(0) if self.responses else httpx.Response(200, json={"ok": True})
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_client(handler, max_retries=3):
+    return ShiprocketClient(email="ops@example.com", password="secret", base_url="https://shiprocket.test",
+                            max_retries=max_retries, transport=httpx.MockTransport(handler))
+
+
+def run(handler, call, max_retries=3):
+    async def main():
+        client = make_client(handler, max_retries)
+        try:
+            return await call(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def get(client):
+    return client._request("GET", "/courier/serviceability/")
+
+
+def post(client):
+    return client._request("POST", "/orders/create/ad-hoc", json={"order_id": "A1"})
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_get_retries_transient_statuses(status):
+    api = FakeShiprocket([httpx.Response(status), httpx.Response(status), httpx.Response(200, json={"ok": 1})])
+    assert run(api, get) == {"ok": 1}
+    assert len(api.calls) == 3
+
+
+def test_get_gives_up_after_max_retries():
+    api = FakeShiprocket([httpx.Response(503)] * 10)
+    with pytest.raises(ShiprocketError) as excinfo:
+        run(api, get, max_retries=2)
+    assert excinfo.value.status_code == 503
+    assert len(api.calls) == 3
+
+
+def test_backoff_grows_exponentially_and_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(shiprocket_client, "RETRY_BASE_DELAY", 0.5)
+    for attempt in range(4):
+        delay = ShiprocketClient._backoff(attempt)
+        assert 0.25 * 2 ** attempt <= delay <= 0.5 * 2 ** attempt
+    assert ShiprocketClient._backoff(10) <= shiprocket_client.RETRY_MAX_DELAY
+    assert ShiprocketClient._backoff(0, httpx.Response(429, headers={"Retry-After": "3"})) == 3.0
+    assert ShiprocketClient._backoff(0, httpx.Response(429, headers={"Retry-After": "600"})) == shiprocket_client.RETRY_MAX_DELAY
+
+
+def test_post_is_retried_on_429():
+    api = FakeShiprocket([httpx.Response(429), httpx.Response(200, json={"order_id": 7})])
+    assert run(api, post) == {"order_id": 7}
+    assert len(api.calls) == 2
+
+
+def test_post_is_not_retried_on_5xx():
+    api = FakeShiprocket([httpx.Response(502, json={"message": "Bad gateway"})])
+    assert run(api, post) == {"message": "Bad gateway"}
+    assert len(api.calls) == 1
+
+
+def test_post_is_not_retried_after_read_timeout():
+    api = FakeShiprocket([httpx.ReadTimeout("timed out"), httpx.Response(200, json={"order_id": 7})])
+    with pytest.raises(ShiprocketError):
+        run(api, post)
+    assert len(api.calls) == 1
+
+
+def test_post_is_retried_when_the_connection_failed():
+    api = FakeShiprocket([httpx.ConnectError("refused"), httpx.Response(200, json={"order_id": 7})])
+    assert run(api, post) == {"order_id": 7}
+    assert len(api.calls) == 2
+
+
+def test_get_is_retried_after_read_timeout():
+    api = FakeShiprocket([httpx.ReadTimeout("timed out"), httpx.Response(200, json={"ok": 1})])
+    assert run(api, get) == {"ok": 1}
+    assert len(api.calls) == 2
+
+
+def test_concurrent_requests_share_one_login():
+    api = FakeShiprocket(login_delay=0.05)
+
+    async def call(client):
+        return await asyncio.gather(*(get(client) for _ in range(20)))
+
+    assert run(api, call) == [{"ok": True}] * 20
+    assert api.logins == 1
+    assert {token for _, _, token in api.calls} == {"t1"}
+
+
+def test_401_refreshes_the_token_and_retries():
+    api = FakeShiprocket([httpx.Response(200, json={"ok": 1})], reject_tokens={"t1"})
+    assert run(api, get) == {"ok": 1}
+    assert api.logins == 2
+    assert [token for _, _, token in api.calls] == ["t1", "t2"]
+
+
+def test_401_after_a_fresh_login_is_not_retried_again():
+    api = FakeShiprocket(reject_tokens={"t1", "t2", "t3"})
+    assert run(api, get) == {"message": "Token has expired"}
+    assert api.logins == 2
+
+
+def test_create_order_posts_the_shiprocket_payload():
+    api = FakeShiprocket([httpx.Response(200, json={"order_id": 9, "shipment_id": 10})])
+    seen = []
+
+    async def handler(request):
+        if request.method == "POST" and not request.url.path.endswith("/auth/login"):
+            seen.append(json.loads(request.content))
+        return await api(request)
+
+    result = run(handler, lambda client: client.create_order({"order_id": "AJ-1", "payment_method": "COD"}))
+    assert result == {"order_id": 9, "shipment_id": 10}
+    assert seen[0]["order_id"] == "AJ-1"
+    assert seen[0]["payment_method"] == "COD"
@@ -0,0 +1,102 @@
+import asyncio
+import io
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import uploads
+from uploads import IMAGE_VARIANTS, add_to_gallery, upload_images
+
+
+@pytest.fixture(autouse=True)
+def local_target(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "UPLOAD_TARGET", "local")
+    monkeypatch.setattr(uploads, "UPLOAD_LOCAL_DIR", str(tmp_path))
+    return tmp_path
+
+
+class SlowFile(io.BytesIO):
+    def __init__(self, data: bytes, delay: float):
+        super().__init__(data)
+        self.delay = delay
+
+    def read(self, *args):
+        time.sleep(self.delay)
+        self.delay = 0
+        return super().read(*args)
+
+
+class BrokenFile(io.BytesIO):
+    def read(self, *args):
+        raise OSError("disk on fire")
+
+
+def upload(fileobj, filename):
+    """Stand-in for FastAPI's UploadFile"""
+    return SimpleNamespace(file=fileobj, filename=filename)
+
+
+def test_results_keep_the_order_of_the_files(local_target):
+    # The first file finishes last
+    files = [upload(SlowFile(b"first", 0.2), "a.jpg"),
+             upload(io.BytesIO(b"second"), "b.PNG"),
+             upload(io.BytesIO(b"third"), "c.webp")]
+    results = asyncio.run(upload_images(files))
+
+    assert [r["filename"] for r in results] == ["a.jpg", "b.PNG", "c.webp"]
+    assert all(r["success"] for r in results)
+    contents = [(local_target / r["public_id"]).read_bytes() for r in results]
+    assert contents == [b"first", b"second", b"third"]
+    assert [os.path.splitext(r["public_id"])[1] for r in results] == [".jpg", ".png", ".webp"]
+    assert results[0]["url"] == f"{uploads.UPLOAD_LOCAL_BASE_URL}/{results[0]['public_id']}"
+
+
+def test_a_failed_file_is_reported_without_failing_the_batch():
+    files = [upload(io.BytesIO(b"ok"), "a.jpg"), upload(BrokenFile(), "b.jpg"), upload(io.BytesIO(b"ok"), "c.jpg")]
+    results = asyncio.run(upload_images(files))
+
+    assert [r["success"] for r in results] == [True, False, True]
+    assert results[1]["filename"] == "b.jpg"
+    assert "disk on fire" in results[1]["error"]
+    assert "url" not in results[1]
+
+
+def test_variants_are_returned_per_file():
+    results = asyncio.run(upload_images([upload(io.BytesIO(b"x"), "a.jpg")], variants=True))
+
+    assert results[0]["variants"] == {name: results[0]["url"] for name in IMAGE_VARIANTS}
+    without = asyncio.run(upload_images([upload(io.BytesIO(b"x"), "a.jpg")], variants=False))
+    assert "variants" not in without[0]
+
+
+def test_gallery_merge_appends_images_and_variants():
+    existing_variants = {"/old.jpg": {"thumb": "/old-thumb.jpg"}}
+    product = SimpleNamespace(image="/old.jpg", images=["/old.jpg"], image_variants=existing_variants)
+    files = [upload(io.BytesIO(b"a"), "a.jpg"), upload(BrokenFile(), "b.jpg"), upload(io.BytesIO(b"c"), "c.jpg")]
+    results = asyncio.run(upload_images(files, variants=True))
+    uploaded = [r for r in results if r["success"]]
+
+    add_to_gallery(product, uploaded, variants=True)
+
+    assert product.image == "/old.jpg"
+    assert product.images == ["/old.jpg", results[0]["url"], results[2]["url"]]
+    assert product.image_variants == {
+        "/old.jpg": {"thumb": "/old-thumb.jpg"},
+        results[0]["url"]: results[0]["variants"],
+        results[2]["url"]: results[2]["variants"],
+    }
+    # New values are assigned, not mutated in place, so the ORM tracks the JSONB change
+    assert existing_variants == {"/old.jpg": {"thumb": "/old-thumb.jpg"}}
+
+
+def test_gallery_merge_sets_the_main_image_of_an_empty_product():
+    product = SimpleNamespace(image=None, images=None, image_variants=None)
+    results = asyncio.run(upload_images([upload(io.BytesIO(b"a"), "a.jpg")], variants=False))
+
+    add_to_gallery(product, results, variants=False)
+
+    assert product.image == results[0]["url"]
+    assert product.images == [results[0]["url"]]
+    assert product.image_variants is None